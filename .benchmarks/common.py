@@ -0,0 +1,119 @@
+"""Shared helpers for the benchmark scripts in this directory"""
+
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import types
+from typing import Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+STUBS_DIR = os.path.join(BENCHMARK_DIR, "stubs")
+NVDA_STUBS_DIR = os.path.join(STUBS_DIR, "nvda")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+
+def use_talon_stub():
+    """Make `import talon` resolve to the stand-in module"""
+    if STUBS_DIR not in sys.path:
+        sys.path.insert(0, STUBS_DIR)
+
+
+def load_package(name: str, relative_path: str) -> types.ModuleType:
+    """Import a repository directory as a package so relative imports work"""
+    package = types.ModuleType(name)
+    package.__path__ = [os.path.join(REPO_ROOT, relative_path)]
+    sys.modules[name] = package
+    return package
+
+
+def load_module(name: str, relative_path: str) -> types.ModuleType:
+    """Import a single repository file, i.e. one with a dash in its name"""
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(REPO_ROOT, relative_path)
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def summarize(samples: list[float]) -> dict:
+    """Latency percentiles in microseconds for samples measured in seconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1e6
+
+    return {
+        "count": len(ordered),
+        "p50_us": round(percentile(0.50), 2),
+        "p99_us": round(percentile(0.99), 2),
+        "mean_us": round(statistics.fmean(ordered) * 1e6, 2),
+        "max_us": round(ordered[-1] * 1e6, 2),
+    }
+
+
+def current_commit() -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=REPO_ROOT,
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(suite: str, results: dict, output: Optional[str]) -> str:
+    """Save results with enough metadata to compare runs between commits"""
+    commit = current_commit()
+    document = {
+        "suite": suite,
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{suite}-{commit}.json")
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2)
+    return output
+
+
+def _flatten(prefix: str, value, out: dict):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else key, child, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+
+
+def compare(previous_path: str, results: dict):
+    """Print how every metric changed relative to a previous results file"""
+    with open(previous_path) as f:
+        previous = json.load(f)
+
+    old, new = {}, {}
+    _flatten("", previous["results"], old)
+    _flatten("", results, new)
+    print(f"\nCompared to {previous.get('commit', '?')} ({previous_path})")
+    for key in sorted(new):
+        if key not in old or old[key] == 0:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        print(f"  {key:55} {old[key]:>12} -> {new[key]:>12} ({change:+.1f}%)")
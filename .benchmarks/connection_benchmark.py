@@ -0,0 +1,138 @@
+"""
+Compares a new connection per bundle against one persistent connection.
+
+Starts the real NVDA addon server and sends the bundles Talon sends around
+every phrase: the six command pre phrase bundle, then the commands that turn
+the settings back on. Before the connection was kept open, send_ipc_commands
+connected, sent, read the response and closed for every bundle, so that is
+timed against sending the same frames over one socket that stays open, and
+through the real client for reference.
+
+    python .benchmarks/connection_benchmark.py --compare .benchmarks/results/connection-abc1234.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import socket
+import tempfile
+import time
+
+from common import compare, summarize, write_results
+from ipc_benchmark import (
+    LEGACY_PRE_PHRASE,
+    SPEC_FILE_NAME,
+    load_client,
+    start_server,
+    stop_server,
+)
+
+# What the post phrase hook sent back when every setting had been on
+LEGACY_POST_PHRASE = [
+    "enableSpeechInterruptForCharacters",
+    "enableSpeakTypedWords",
+    "enableSpeakTypedCharacters",
+]
+
+
+def connect(ip: str, port: int) -> socket.socket:
+    sock = socket.create_connection((ip, port), timeout=1)
+    # Same as the client, so the comparison is only about the handshake
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def round_trip(protocol, sock: socket.socket, frame: bytes):
+    sock.sendall(frame)
+    reader = protocol.FrameReader()
+    while reader.next_frame() is None:
+        if reader.recv_from(sock) == 0:
+            raise ConnectionResetError("The addon server closed the connection")
+
+
+def new_connection(protocol, ip: str, port: int):
+    """How every bundle was sent before the connection was kept open"""
+
+    def send(frame: bytes):
+        with connect(ip, port) as sock:
+            round_trip(protocol, sock, frame)
+
+    return send
+
+
+def persistent_connection(protocol, sock: socket.socket):
+    return lambda frame: round_trip(protocol, sock, frame)
+
+
+def time_phrases(send, frames: list[bytes], phrases: int) -> dict:
+    bundles, per_phrase = [], []
+    for _ in range(phrases):
+        phrase_start = time.perf_counter()
+        for frame in frames:
+            start = time.perf_counter()
+            send(frame)
+            bundles.append(time.perf_counter() - start)
+        per_phrase.append(time.perf_counter() - phrase_start)
+    return {
+        "pre_phrase_bundle": summarize(bundles[:: len(frames)]),
+        "phrase": summarize(per_phrase),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--phrases", type=int, default=2000)
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as config_path:
+        server = start_server(config_path)
+        try:
+            client, actions = load_client(os.path.join(config_path, SPEC_FILE_NAME))
+            protocol = importlib.import_module(
+                "sightless.core.screenreader_ipc.ipc_protocol"
+            )
+            ip, port, _ = actions.user.addon_server_endpoint()
+            frames = [
+                protocol.encode_frame(json.dumps(bundle).encode())
+                for bundle in (LEGACY_PRE_PHRASE, LEGACY_POST_PHRASE)
+            ]
+
+            results = {
+                "new_connection": time_phrases(
+                    new_connection(protocol, ip, int(port)), frames, args.phrases
+                ),
+            }
+            with connect(ip, int(port)) as sock:
+                # So the one handshake isn't counted
+                persistent = persistent_connection(protocol, sock)
+                persistent(frames[0])
+                results["persistent_connection"] = time_phrases(
+                    persistent, frames, args.phrases
+                )
+
+            actions.user.send_ipc_commands(["debug"])
+            results["client"] = time_phrases(
+                lambda frame: actions.user.send_ipc_commands(
+                    LEGACY_PRE_PHRASE if frame is frames[0] else LEGACY_POST_PHRASE
+                ),
+                frames,
+                args.phrases,
+            )
+        finally:
+            stop_server(server)
+
+    before = results["new_connection"]["phrase"]["p50_us"]
+    after = results["persistent_connection"]["phrase"]["p50_us"]
+    results["phrase_p50_speedup"] = round(before / after, 2)
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {write_results('connection', results, args.output)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Measures the Talon <-> NVDA IPC path on any OS.
+
+The real NVDA addon server is started in its own process with stub config,
+tones and globalVars modules, and driven with the real client code from
+core/screenreader_ipc through a stub talon module. Reports round trip latency
+percentiles, throughput, and behavior with several concurrent clients, then
+saves everything as JSON so runs can be compared between commits.
+
+    python .benchmarks/ipc_benchmark.py --compare .benchmarks/results/ipc-abc1234.json
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import (
+    NVDA_STUBS_DIR,
+    REPO_ROOT,
+    compare,
+    load_package,
+    summarize,
+    use_talon_stub,
+    write_results,
+)
+
+ADDON_PATH = os.path.join(
+    REPO_ROOT,
+    "nvda",
+    ".addOn",
+    "sight-free-talon-server",
+    "addon",
+    "globalPlugins",
+    "nvda-addon.py",
+)
+SPEC_FILE_NAME = "talon_server_spec.json"
+
+# The bundle Talon used to send before every phrase
+LEGACY_PRE_PHRASE = [
+    "getSpeechInterruptForCharacters",
+    "getSpeakTypedWords",
+    "getSpeakTypedCharacters",
+    "disableSpeechInterruptForCharacters",
+    "disableSpeakTypedWords",
+    "disableSpeakTypedCharacters",
+]
+
+
+def start_server(config_path: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = NVDA_STUBS_DIR
+    env["TALON_BENCH_CONFIG_PATH"] = config_path
+    server = subprocess.Popen(
+        [sys.executable, ADDON_PATH],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    spec_file = os.path.join(config_path, SPEC_FILE_NAME)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(spec_file):
+        if time.monotonic() > deadline or server.poll() is not None:
+            server.kill()
+            raise RuntimeError("The addon server did not start")
+        time.sleep(0.01)
+    return server
+
+
+def stop_server(server: subprocess.Popen):
+    # The standalone server shuts down cleanly on a keyboard interrupt
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def load_client(spec_file: str):
+    """Import the real IPC client and point it at the benchmark server"""
+    use_talon_stub()
+    # The client reaches lib/ for its reports, so it needs the whole tree as a package
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package("sightless.lib", "lib")
+    load_package(
+        "sightless.core.screenreader_ipc", os.path.join("core", "screenreader_ipc")
+    )
+    client = importlib.import_module("sightless.core.screenreader_ipc.ipc_client")
+    client.nvda_endpoint.spec_file = spec_file
+
+    from talon import actions
+
+    # There is no controller client outside of Windows
+    actions.user.is_nvda_running = lambda: True
+    return client, actions
+
+
+def time_round_trips(send, bundle, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        send(bundle)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_sequential(client, actions, iterations: int) -> dict:
+    ip, port, _ = actions.user.addon_server_endpoint()
+    command_ids = client.nvda_endpoint.command_ids
+
+    def with_encoding(ids):
+        return lambda bundle: client.submit_commands(
+            ip, int(port), bundle, ids, client.nvda_endpoint.pipelined
+        ).result()
+
+    # Warm up the connection so the handshake isn't counted
+    actions.user.send_ipc_commands(["debug"])
+
+    results = {}
+    scenarios = {
+        "push_keyboard_state": (actions.user.send_ipc_commands, ["pushKeyboardState"]),
+        "pop_keyboard_state": (actions.user.send_ipc_commands, ["popKeyboardState"]),
+        "legacy_bundle_json": (with_encoding(None), LEGACY_PRE_PHRASE),
+        "legacy_bundle_compact": (with_encoding(command_ids), LEGACY_PRE_PHRASE),
+        "get_config": (
+            with_encoding(command_ids),
+            [["getConfig", "keyboard.speakTypedWords"]],
+        ),
+        # Answered from the read cache while the config generation is unchanged
+        "get_config_cached": (
+            actions.user.send_ipc_commands,
+            [["getConfig", "keyboard.speakTypedWords"]],
+        ),
+    }
+    for name, (send, bundle) in scenarios.items():
+        results[name] = summarize(time_round_trips(send, bundle, iterations))
+    return results
+
+
+def run_throughput(actions, bundles: int) -> dict:
+    """Queue bundles back to back without waiting, like bursty dictation"""
+    bundle = ["pushKeyboardState", "popKeyboardState"]
+    start = time.perf_counter()
+    futures = [actions.user.send_ipc_commands_async(bundle) for _ in range(bundles)]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+    return {
+        "bundles": bundles,
+        "bundles_per_second": round(bundles / elapsed, 1),
+        "commands_per_second": round(bundles * len(bundle) / elapsed, 1),
+    }
+
+
+def concurrent_client(spec_file: str, iterations: int) -> list[float]:
+    _, actions = load_client(spec_file)
+    actions.user.send_ipc_commands(["debug"])
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        actions.user.send_ipc_commands(["pushKeyboardState"])
+        actions.user.send_ipc_commands(["popKeyboardState"])
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_concurrent(spec_file: str, clients: int, iterations: int) -> dict:
+    """Every client is its own process so they contend like separate programs"""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(clients) as pool:
+        start = time.perf_counter()
+        per_client = pool.starmap(
+            concurrent_client, [(spec_file, iterations)] * clients
+        )
+        elapsed = time.perf_counter() - start
+
+    samples = [sample for client_samples in per_client for sample in client_samples]
+    return {
+        "clients": clients,
+        "phrase_round_trips": summarize(samples),
+        # Each phrase is a push and a pop
+        "commands_per_second": round(len(samples) * 2 / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as config_path:
+        server = start_server(config_path)
+        spec_file = os.path.join(config_path, SPEC_FILE_NAME)
+        try:
+            client, actions = load_client(spec_file)
+            results = {
+                "sequential": run_sequential(client, actions, args.iterations),
+                "throughput": run_throughput(actions, args.iterations),
+                "concurrent": run_concurrent(
+                    spec_file, args.clients, args.iterations // args.clients
+                ),
+            }
+        finally:
+            stop_server(server)
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {write_results('ipc', results, args.output)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Measures normalizing text for the tts voice, from short phrases to megabytes.
+
+Runs the real normalizer from core/text_normalization at every punctuation
+level on prose, on code and on a mix with links and long numbers, like a long
+clipboard read. For comparison it also runs what utils.remove_special used to
+do, which was one str.replace for each of 32 symbols and didn't name or
+shorten anything. Prints what a sample sentence becomes at each level.
+
+    python .benchmarks/normalization_benchmark.py --compare .benchmarks/results/normalization-abc1234.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import time
+
+from common import compare, load_package, summarize, write_results
+
+PROSE = (
+    "It was the best of times, it was the worst of times, it was the age of "
+    "wisdom, it was the age of foolishness. "
+)
+CODE = 'def f(x): return {"a": [1, 2, 3], "b": x ** 2}  # comment ======\n'
+MIXED = (
+    "See https://github.com/C-Loftus/talon-sightless/pull/12?tab=files or "
+    "www.example.org, build 12345678901234567 failed; x_y = a*b + c/d ---- "
+    "done! Call 555-123-4567. "
+)
+SAMPLE = (
+    "See https://github.com/C-Loftus/talon-sightless/pull/12. Commit "
+    "3f2a9c81d4e5b6a7 fixed x_y == 2 ---------- (finally) don't you think?"
+)
+PHRASES = ["command mode", "Firefox. Pull requests", "x = f(a, b)", SAMPLE]
+LEVELS = ["none", "some", "most", "all"]
+
+SPECIAL_CHARS = "'\"()[]{}<>|\\/_-+=*&^%$#@!`~?,.:;"
+
+
+def remove_special(text: str) -> str:
+    """What utils.remove_special did"""
+    for char in SPECIAL_CHARS:
+        text = text.replace(char, "")
+    return text
+
+
+def load_normalization():
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package(
+        "sightless.core.text_normalization",
+        os.path.join("core", "text_normalization"),
+    )
+    return importlib.import_module(
+        "sightless.core.text_normalization.text_normalization"
+    )
+
+
+def repeat_to(text: str, size: int) -> str:
+    return text * (size // len(text) + 1)
+
+
+def time_once(fn, text: str, repeats: int) -> dict:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(text)
+        samples.append(time.perf_counter() - start)
+    best = min(samples)
+    return {
+        "seconds": summarize(samples),
+        "mb_per_second": round(len(text) / 1e6 / best, 1),
+    }
+
+
+def run_large(normalization, size: int, repeats: int) -> dict:
+    results = {}
+    for name, unit in (("prose", PROSE), ("code", CODE), ("mixed", MIXED)):
+        text = repeat_to(unit, size)
+        results[name] = {"remove_special": time_once(remove_special, text, repeats)}
+        for level in LEVELS:
+            results[name][level] = time_once(
+                normalization.normalizer(level, True, True), text, repeats
+            )
+    return results
+
+
+def run_phrases(normalization, rounds: int) -> dict:
+    normalize = normalization.normalizer("some", True, True)
+    samples = []
+    for _ in range(rounds):
+        for phrase in PHRASES:
+            start = time.perf_counter()
+            normalize(phrase)
+            samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megabytes", type=float, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    normalization = load_normalization()
+    results = {
+        "sample": {
+            level: normalization.normalizer(level, True, True)(SAMPLE)
+            for level in LEVELS
+        },
+        "phrase": run_phrases(normalization, args.rounds),
+        "large": run_large(normalization, int(args.megabytes * 1e6), args.repeats),
+    }
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {write_results('normalization', results, args.output)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
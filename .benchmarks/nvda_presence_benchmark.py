@@ -0,0 +1,109 @@
+"""
+Counts how often one phrase asks NVDA's controller client if NVDA is running.
+
+Loads the real nvda/nvda.py through the stub talon module with a fake
+controller client in place of nvdaControllerClient64.dll, starts the real
+addon server, and runs the pre and post phrase hooks like Talon would for
+every phrase. Reports controller calls per phrase and how long the hooks took
+with the running check cached and with caching turned off.
+
+    python .benchmarks/nvda_presence_benchmark.py --compare .benchmarks/results/nvda_presence-abc1234.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import tempfile
+import time
+import types
+
+from common import compare, load_package, summarize, write_results
+from ipc_benchmark import SPEC_FILE_NAME, load_client, start_server, stop_server
+
+
+class FakeController:
+    """Stands in for the controller DLL, where every call is an RPC to NVDA"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def nvdaController_testIfRunning(self) -> int:
+        self.calls += 1
+        time.sleep(self.latency)
+        # Zero means NVDA is running
+        return 0
+
+
+def load_nvda(spec_file: str, controller: FakeController):
+    _, actions = load_client(spec_file)
+    load_package("sightless.nvda", "nvda")
+    nvda = importlib.import_module("sightless.nvda.nvda")
+    nvda.nvda_client = controller
+    # The IPC benchmark pretends NVDA is always running, so use the real check
+    actions.user.is_nvda_running = nvda.Actions.is_nvda_running
+    # Send the post phrase pop right away instead of 400ms later
+    nvda.cron = types.SimpleNamespace(after=lambda duration, fn: fn())
+    return nvda, actions
+
+
+def run_phrases(nvda, controller: FakeController, phrases: int, ttl: float) -> dict:
+    from talon import settings
+
+    settings["user.nvda_running_ttl"] = ttl
+    controller.calls = 0
+    pre_phrase, post_phrase = [], []
+    for _ in range(phrases):
+        # As if the phrases were further apart than the TTL
+        nvda.nvda_running.invalidate()
+
+        start = time.perf_counter()
+        nvda.disable_interrupt(None)
+        pre_phrase.append(time.perf_counter() - start)
+        nvda.NVDAState.pending_disable.result()
+
+        start = time.perf_counter()
+        nvda.enable_interrupt(None)
+        post_phrase.append(time.perf_counter() - start)
+
+    return {
+        "controller_calls_per_phrase": round(controller.calls / phrases, 2),
+        "pre_phrase": summarize(pre_phrase),
+        "post_phrase": summarize(post_phrase),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--phrases", type=int, default=500)
+    parser.add_argument(
+        "--controller-latency-us",
+        type=float,
+        default=200,
+        help="How long each call into the fake controller client takes",
+    )
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    controller = FakeController(args.controller_latency_us / 1e6)
+    with tempfile.TemporaryDirectory() as config_path:
+        server = start_server(config_path)
+        try:
+            nvda, _ = load_nvda(os.path.join(config_path, SPEC_FILE_NAME), controller)
+            results = {
+                "uncached": run_phrases(nvda, controller, args.phrases, ttl=0),
+                "cached": run_phrases(nvda, controller, args.phrases, ttl=1.0),
+            }
+        finally:
+            stop_server(server)
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {write_results('nvda_presence', results, args.output)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Measures time to first audio from piper, started per utterance or kept warm.
+
+Uses a fake piper from stubs/piper that takes about as long as the real one
+to load its model and synthesize, and a sink that appends to a file instead of
+playing. The per utterance case starts echo | piper | sink for every phrase
+like core-linux.py used to. The warm case runs the real worker from
+core/piper_tts. Also checks that cancelling drops the audio without piper
+loading its model again, and how much the cache of synthesized audio saves
+when the same phrases are said again, including after a restart, and how
+warming up at startup changes the first announcement.
+
+    python .benchmarks/piper_benchmark.py --compare .benchmarks/results/piper-abc1234.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common import STUBS_DIR, compare, load_package, summarize, write_results
+
+PHRASES = [
+    "command mode",
+    "dictation mode",
+    "Talon user scripts loaded",
+    "echo enabled",
+    "Firefox. Pull requests, talon-sightless",
+]
+LONG_PHRASE = " ".join(["This is a long sentence to be interrupted."] * 20)
+LENGTH_SCALE = 0.5
+
+
+def load_piper_client():
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package("sightless.core.piper_tts", os.path.join("core", "piper_tts"))
+    return importlib.import_module("sightless.core.piper_tts.piper_client")
+
+
+def sink_command(path: str):
+    return lambda sample_rate: ["sh", "-c", f"cat >> '{path}'"]
+
+
+def run_per_utterance(sink_path: str, rounds: int) -> dict:
+    first_audio = []
+    for _ in range(rounds):
+        for phrase in PHRASES:
+            start = time.perf_counter()
+            echo = subprocess.Popen(["echo", phrase], stdout=subprocess.PIPE)
+            piper = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "piper",
+                    "--model",
+                    "fake.onnx",
+                    "--length_scale",
+                    str(LENGTH_SCALE),
+                    "--output_raw",
+                ],
+                stdin=echo.stdout,
+                stdout=subprocess.PIPE,
+            )
+            echo.stdout.close()
+            # Sit between piper and the sink so we know when audio first arrives
+            sink = subprocess.Popen(sink_command(sink_path)(0), stdin=subprocess.PIPE)
+            audio = piper.stdout.read(1)
+            first_audio.append(time.perf_counter() - start)
+            sink.stdin.write(audio + piper.stdout.read())
+            sink.stdin.close()
+            for process in (echo, piper, sink):
+                process.wait()
+    return {"time_to_first_audio": summarize(first_audio)}
+
+
+def wait_until_spoken(utterance, timeout: float = 30):
+    if not utterance.played.wait(timeout):
+        raise TimeoutError(f"Utterance {utterance.id} wasn't spoken")
+
+
+def start_worker(piper_client, sink_path: str, cache=None):
+    sink = piper_client.AudioSink(sink_command(sink_path), 16000)
+    worker = piper_client.PiperWorker(
+        [sys.executable, piper_client.WORKER_PATH, "--model", "fake.onnx"],
+        sink,
+        voice="fake.onnx",
+        cache=cache,
+    )
+    return sink, worker
+
+
+def run_warm_worker(piper_client, sink_path: str, rounds: int) -> dict:
+    sink, worker = start_worker(piper_client, sink_path)
+    try:
+        start = time.perf_counter()
+        wait_until_spoken(worker.speak("warming up", LENGTH_SCALE))
+        first_utterance = time.perf_counter() - start
+
+        worker.time_to_first_audio.clear()
+        first_audio = []
+        for _ in range(rounds):
+            for phrase in PHRASES:
+                wait_until_spoken(worker.speak(phrase, LENGTH_SCALE))
+                first_audio.append(worker.time_to_first_audio[-1])
+
+        # Interrupt a long utterance as soon as it starts playing
+        cancel, after_cancel = [], []
+        sink_starts = sink.starts
+        for _ in range(rounds):
+            played = len(worker.time_to_first_audio)
+            worker.speak(LONG_PHRASE, LENGTH_SCALE)
+            while len(worker.time_to_first_audio) == played:
+                time.sleep(0.0005)
+            start = time.perf_counter()
+            worker.cancel()
+            cancel.append(time.perf_counter() - start)
+            wait_until_spoken(worker.speak(PHRASES[1], LENGTH_SCALE))
+            after_cancel.append(worker.time_to_first_audio[-1])
+
+        return {
+            "first_utterance_with_model_load": summarize([first_utterance]),
+            "time_to_first_audio": summarize(first_audio),
+            "cancel": summarize(cancel),
+            "time_to_first_audio_after_cancel": summarize(after_cancel),
+            # Should stay at one, since cancelling doesn't restart piper
+            "piper_starts": worker.starts,
+            "sink_restarts_from_cancels": sink.starts - sink_starts,
+        }
+    finally:
+        worker.stop()
+
+
+def run_cached_worker(
+    piper_client, pcm_cache, sink_path: str, cache_dir: str, rounds: int
+) -> dict:
+    """Says the same phrases over and over, then again after a restart"""
+
+    def speak_all(worker) -> list[float]:
+        first_audio = []
+        for phrase in PHRASES:
+            wait_until_spoken(worker.speak(phrase, LENGTH_SCALE))
+            first_audio.append(worker.time_to_first_audio[-1])
+        return first_audio
+
+    cache = pcm_cache.PCMCache(16 * 1024 * 1024, cache_dir, 64 * 1024 * 1024)
+    _, worker = start_worker(piper_client, sink_path, cache)
+    try:
+        misses = speak_all(worker)
+        hits = []
+        for _ in range(rounds):
+            hits += speak_all(worker)
+        results = {
+            "time_to_first_audio_synthesized": summarize(misses),
+            "time_to_first_audio_from_memory": summarize(hits),
+            "hit_rate": round(cache.hit_rate(), 3),
+        }
+    finally:
+        worker.stop()
+
+    # Like Talon restarting, with only the disk cache left
+    cache = pcm_cache.PCMCache(16 * 1024 * 1024, cache_dir, 64 * 1024 * 1024)
+    _, worker = start_worker(piper_client, sink_path, cache)
+    try:
+        results["time_to_first_audio_from_disk"] = summarize(speak_all(worker))
+        results["disk_hits_after_restart"] = cache.disk_hits
+        # Should be zero, since everything came from the cache
+        results["piper_starts_after_restart"] = worker.starts
+    finally:
+        worker.stop()
+    return results
+
+
+def run_warm_up(piper_client, sink_path: str) -> dict:
+    """Like Talon starting, with and without warming up first"""
+    announcements = ["Talon command mode", "Talon dictation mode", "echo enabled"]
+
+    def fresh_worker():
+        cache = piper_client.PCMCache(16 * 1024 * 1024)
+        return start_worker(piper_client, sink_path, cache)[1]
+
+    # Without warming up the first mode change waits for the model to load
+    worker = fresh_worker()
+    try:
+        wait_until_spoken(worker.speak(announcements[0], LENGTH_SCALE))
+        cold = worker.time_to_first_audio[-1]
+    finally:
+        worker.stop()
+
+    worker = fresh_worker()
+    stop = threading.Event()
+    try:
+        warm_up = threading.Thread(
+            target=worker.prerender, args=(announcements, LENGTH_SCALE, stop)
+        )
+        warm_up.start()
+        # Real speech during the warm up goes first
+        wait_until_spoken(worker.speak("Talon user scripts loaded", LENGTH_SCALE))
+        during_warm_up = worker.time_to_first_audio[-1]
+        start = time.perf_counter()
+        warm_up.join()
+        warm_up_finished = time.perf_counter() - start
+        wait_until_spoken(worker.speak(announcements[0], LENGTH_SCALE))
+        warm = worker.time_to_first_audio[-1]
+
+        # Cancelling stops it within one poll, even partway through
+        stop = threading.Event()
+        warm_up = threading.Thread(
+            target=worker.prerender, args=(PHRASES, LENGTH_SCALE, stop)
+        )
+        warm_up.start()
+        start = time.perf_counter()
+        stop.set()
+        warm_up.join()
+        cancel = time.perf_counter() - start
+    finally:
+        worker.stop()
+
+    return {
+        "first_announcement_cold": summarize([cold]),
+        "speech_during_warm_up": summarize([during_warm_up]),
+        "warm_up_finished_after_speech": summarize([warm_up_finished]),
+        "first_announcement_warm": summarize([warm]),
+        "cancel_warm_up": summarize([cancel]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument(
+        "--load-ms",
+        type=float,
+        default=400,
+        help="How long the fake model takes to load",
+    )
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    # The fake piper module is found through the stubs in every process we start
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [STUBS_DIR, os.environ.get("PYTHONPATH")])
+    )
+    os.environ["FAKE_PIPER_LOAD_MS"] = str(args.load_ms)
+
+    with tempfile.TemporaryDirectory() as directory:
+        sink_path = os.path.join(directory, "audio.raw")
+        results = {
+            "per_utterance": run_per_utterance(sink_path, args.rounds),
+            "warm_worker": run_warm_worker(load_piper_client(), sink_path, args.rounds),
+            "cached_worker": run_cached_worker(
+                load_piper_client(),
+                importlib.import_module("sightless.core.piper_tts.pcm_cache"),
+                sink_path,
+                os.path.join(directory, "cache"),
+                args.rounds,
+            ),
+            "warm_up": run_warm_up(load_piper_client(), sink_path),
+        }
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {write_results('piper', results, args.output)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Measures how quickly the screenreader presence monitor notices a screenreader start and stop.
+
+Runs the real monitor from core/screenreader_presence against a fake
+screenreader, which is a copy of sleep under another name so it can be found
+in /proc like orca is. Reports how long it takes to notice the process start
+with and without a signal, how long to notice it exit, and how often it
+probes while nothing changes. --watcher picks how the probe finds it: a full
+/proc scan, the indexed scan orca uses, or the index plus process events like
+orca uses when it may listen for them. Linux only, since exits are heard
+through a pidfd.
+
+    python .benchmarks/presence_benchmark.py --compare .benchmarks/results/presence-abc1234.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import compare, load_package, summarize, write_results
+
+FAKE_READER_NAME = "fake-reader"
+WATCHERS = ["scan", "index", "events"]
+
+
+def load_monitor():
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package(
+        "sightless.core.screenreader_presence",
+        os.path.join("core", "screenreader_presence"),
+    )
+    monitor_module = importlib.import_module(
+        "sightless.core.screenreader_presence.presence_monitor"
+    )
+    process_watch = importlib.import_module(
+        "sightless.core.screenreader_presence.process_watch"
+    )
+    return monitor_module, process_watch
+
+
+class FakeReader:
+    """Starts and stops a process that looks like a screenreader by name"""
+
+    def __init__(self, directory: str):
+        self.executable = os.path.join(directory, FAKE_READER_NAME)
+        shutil.copy(shutil.which("sleep"), self.executable)
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen([self.executable, "3600"])
+        # Popen can return before the exec, while the child still has our name
+        with open(f"/proc/{self.process.pid}/comm") as comm:
+            while comm.read().rstrip("\n") != FAKE_READER_NAME:
+                comm.seek(0)
+                time.sleep(0.0001)
+
+    def stop(self):
+        self.process.kill()
+        self.process.wait()
+        self.process = None
+
+
+def wait_for(changes: queue.Queue, running: bool, timeout: float = 30) -> float:
+    """Seconds until the monitor reports the fake reader running or not"""
+    deadline = time.monotonic() + timeout
+    while True:
+        present = changes.get(timeout=max(0, deadline - time.monotonic()))
+        if (FAKE_READER_NAME in present) == running:
+            return time.perf_counter()
+
+
+def run_detection(modules, watcher: str, reader: FakeReader, rounds: int, idle: float):
+    monitor_module, process_watch = modules
+    changes: queue.Queue = queue.Queue()
+    probes = []
+    probe_times = []
+    index = process_watch.ProcessIndex(FAKE_READER_NAME)
+    find = (
+        (lambda: monitor_module.find_process(FAKE_READER_NAME))
+        if watcher == "scan"
+        else index.find
+    )
+
+    def probe():
+        probes.append(time.monotonic())
+        start = time.perf_counter()
+        try:
+            return find()
+        finally:
+            probe_times.append(time.perf_counter() - start)
+
+    monitor = monitor_module.PresenceMonitor(changes.put)
+    listener = None
+    max_interval = monitor_module.POLL_MAX_INTERVAL
+    if watcher == "events":
+
+        def on_exec(pid: int):
+            if process_watch.read_comm(pid) == FAKE_READER_NAME:
+                index.offer(pid)
+                monitor.notify(FAKE_READER_NAME)
+
+        listener = process_watch.ExecListener(on_exec)
+        if not listener.start():
+            sys.exit("Process events need CAP_NET_ADMIN, try --watcher index")
+    elif watcher == "index":
+        max_interval = 1.0
+    monitor.add(FAKE_READER_NAME, probe, max_interval)
+    monitor.start()
+
+    polled_start, notified_start, exit_latency = [], [], []
+    try:
+        for i in range(rounds):
+            # Let the poll interval back off like it would while nobody uses it
+            time.sleep(idle)
+            start = time.perf_counter()
+            reader.start()
+            if i % 2:
+                # Like the spec file watcher telling us NVDA's addon started
+                monitor.notify(FAKE_READER_NAME)
+                notified_start.append(wait_for(changes, True) - start)
+            else:
+                polled_start.append(wait_for(changes, True) - start)
+
+            time.sleep(idle)
+            start = time.perf_counter()
+            reader.stop()
+            exit_latency.append(wait_for(changes, False) - start)
+
+        # How often the monitor wakes up while nothing changes
+        reader.start()
+        wait_for(changes, True)
+        probes.clear()
+        time.sleep(idle * 2)
+        probes_while_running = len(probes)
+        reader.stop()
+        wait_for(changes, False)
+        probes.clear()
+        time.sleep(idle * 2)
+        probes_while_stopped = len(probes)
+    finally:
+        monitor.stop()
+        if listener:
+            listener.stop()
+        if reader.process:
+            reader.stop()
+
+    per_minute = 60 / (idle * 2)
+    return {
+        "polled_start": summarize(polled_start),
+        "notified_start": summarize(notified_start),
+        "exit": summarize(exit_latency),
+        "probes_per_minute_running": round(probes_while_running * per_minute, 1),
+        "probes_per_minute_stopped": round(probes_while_stopped * per_minute, 1),
+        "probe": summarize(probe_times),
+        # Only the index counts the process names it reads
+        "names_read_per_probe": (
+            None if watcher == "scan" else round(index.reads / len(probe_times), 1)
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=6)
+    parser.add_argument(
+        "--idle", type=float, default=5.0, help="Seconds between starts and stops"
+    )
+    parser.add_argument("--watcher", choices=WATCHERS, default="index")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="Extra idle processes to start, so scanning /proc costs more",
+    )
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    if not sys.platform.startswith("linux"):
+        sys.exit(
+            "The presence benchmark needs /proc and pidfds, so it only runs on Linux"
+        )
+
+    extra = [subprocess.Popen(["sleep", "3600"]) for _ in range(args.processes)]
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_detection(
+                load_monitor(),
+                args.watcher,
+                FakeReader(directory),
+                args.rounds,
+                args.idle,
+            )
+    finally:
+        for process in extra:
+            process.kill()
+            process.wait()
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {write_results('presence', results, args.output)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Checks the speech queue's ordering and preemption, and how long speaking blocks.
+
+Runs the real queue from core/speech_queue against a fake engine that records
+what it is asked to do. The ordering and preemption checks call step()
+directly, with a fake clock for anything delayed, so they are deterministic,
+and fail loudly if anything is said in the wrong order. It also switches apps
+while titles keep changing, and counts what the engine is asked to say with
+and without coalescing. Then it times how long the caller is blocked speaking
+through the queue's thread, against starting a process on the caller's
+thread, which is what an engine like say or spd-say does for every utterance.
+
+    python .benchmarks/speech_queue_benchmark.py --compare .benchmarks/results/speech_queue-abc1234.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import threading
+import time
+
+from common import compare, load_package, summarize, write_results
+
+
+class FakeEngine:
+    """Records what it says and cancels, and speaks until told it finished"""
+
+    def __init__(self, reports_speaking: bool = True, delay: float = 0):
+        self.reports_speaking = reports_speaking
+        self.delay = delay
+        self.log: list[str] = []
+        self.speaking = False
+        self.spoken = threading.Event()
+
+    def speak(self, text: str):
+        if self.delay:
+            time.sleep(self.delay)
+        self.log.append(text)
+        self.speaking = True
+        self.spoken.set()
+        return (lambda: self.speaking) if self.reports_speaking else None
+
+    def cancel(self):
+        self.log.append("<cancel>")
+        self.speaking = False
+
+    def finish(self):
+        self.speaking = False
+
+
+def load_speech_queue():
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package("sightless.core.speech_queue", os.path.join("core", "speech_queue"))
+    return importlib.import_module("sightless.core.speech_queue.speech_queue")
+
+
+def check(name: str, actual: list[str], expected: list[str]):
+    if actual != expected:
+        raise AssertionError(f"{name}: expected {expected}, got {actual}")
+
+
+def run_until_idle(queue, engine: FakeEngine):
+    """Step the queue, finishing each utterance, until nothing is left"""
+    while queue.step():
+        engine.finish()
+
+
+def run_ordering(speech_queue) -> dict:
+    checks = {}
+
+    # Queued speech comes out most important first, then in order
+    engine = FakeEngine()
+    queue = speech_queue.SpeechQueue(engine.speak, engine.cancel)
+    queue.submit("title", "context", interrupt=False)
+    queue.submit("hello", "echo", interrupt=False)
+    queue.submit("error", "error", interrupt=False)
+    queue.submit("world", "echo", interrupt=False)
+    queue.submit("command mode", "mode", interrupt=False)
+    run_until_idle(queue, engine)
+    check(
+        "priority order",
+        engine.log,
+        ["error", "command mode", "hello", "world", "title"],
+    )
+    checks["priority_order"] = engine.log
+
+    # Echo interrupts echo and drops the queued title, but keeps the mode change.
+    # The first interrupt cancels too, since the engine may be speaking for
+    # someone else, i.e. NVDA reading the screen
+    engine = FakeEngine()
+    queue = speech_queue.SpeechQueue(engine.speak, engine.cancel)
+    queue.submit("first phrase", "echo")
+    queue.step()
+    queue.submit("title", "context", interrupt=False)
+    queue.submit("command mode", "mode", interrupt=False)
+    queue.submit("second phrase", "echo")
+    run_until_idle(queue, engine)
+    check(
+        "echo interrupts echo",
+        engine.log,
+        ["<cancel>", "first phrase", "<cancel>", "command mode", "second phrase"],
+    )
+    checks["echo_interrupts_echo"] = engine.log
+
+    # Echo doesn't cut off an error, it waits for it to finish
+    engine = FakeEngine()
+    queue = speech_queue.SpeechQueue(engine.speak, engine.cancel)
+    queue.submit("Orca is not installed", "error")
+    queue.step()
+    queue.submit("hello", "echo")
+    queue.step()
+    check("error not cut off", engine.log, ["<cancel>", "Orca is not installed"])
+    engine.finish()
+    run_until_idle(queue, engine)
+    check(
+        "error then echo",
+        engine.log,
+        ["<cancel>", "Orca is not installed", "hello"],
+    )
+    checks["echo_waits_for_error"] = engine.log
+
+    # Cancelling drops everything, even an error
+    engine = FakeEngine()
+    queue = speech_queue.SpeechQueue(engine.speak, engine.cancel)
+    queue.submit("error", "error", interrupt=False)
+    queue.step()
+    queue.submit("title", "context", interrupt=False)
+    queue.cancel()
+    run_until_idle(queue, engine)
+    check("cancel", engine.log, ["error", "<cancel>"])
+    checks["cancel_drops_everything"] = engine.log
+
+    # An engine that can't tell when it finishes is handed everything straight
+    # away, but an interrupt still doesn't cut off an error
+    engine = FakeEngine(reports_speaking=False)
+    queue = speech_queue.SpeechQueue(engine.speak, engine.cancel)
+    queue.submit("error", "error", interrupt=False)
+    queue.step()
+    queue.submit("hello", "echo")
+    queue.step()
+    queue.submit("title", "context", interrupt=False)
+    queue.step()
+    check("engine that queues itself", engine.log, ["error", "hello", "title"])
+    checks["engine_without_completion"] = engine.log
+    return checks
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def run_coalescing(speech_queue) -> dict:
+    checks = {}
+
+    # A newer title replaces the one waiting behind something else
+    engine = FakeEngine()
+    queue = speech_queue.SpeechQueue(engine.speak, engine.cancel)
+    queue.submit("hello", "echo", interrupt=False)
+    queue.step()
+    queue.submit("Loading", "context", interrupt=False, key="context")
+    queue.submit("GitHub", "context", interrupt=False, key="context")
+    run_until_idle(queue, engine)
+    check("newer title replaces older", engine.log, ["hello", "GitHub"])
+    checks["newer_replaces_older"] = engine.log
+
+    # Delayed utterances wait for the last change, then interrupt like normal
+    engine = FakeEngine()
+    clock = FakeClock()
+    queue = speech_queue.SpeechQueue(engine.speak, engine.cancel, clock)
+    queue.submit("Firefox", "context", key="context", delay=0.3)
+    clock.now = 0.2
+    queue.submit("Firefox Loading", "context", key="context", delay=0.3)
+    queue.step()
+    check("debounced until quiet", engine.log, [])
+    clock.now = 0.4
+    queue.step()
+    check("still debounced", engine.log, [])
+    clock.now = 0.5
+    queue.submit("hello", "echo", interrupt=False)
+    run_until_idle(queue, engine)
+    check(
+        "app and title said once",
+        engine.log,
+        ["<cancel>", "hello", "Firefox Loading"],
+    )
+    checks["debounced"] = engine.log
+
+    # Something with the same key said straight away drops the delayed one
+    engine = FakeEngine()
+    clock = FakeClock()
+    queue = speech_queue.SpeechQueue(engine.speak, engine.cancel, clock)
+    queue.submit("Firefox", "context", key="context", delay=0.3)
+    queue.submit("Terminal", "context", key="context")
+    clock.now = 1
+    run_until_idle(queue, engine)
+    check("immediate replaces delayed", engine.log, ["<cancel>", "Terminal"])
+    checks["immediate_replaces_delayed"] = engine.log
+    return checks
+
+
+def run_window_churn(speech_queue, switches: int, titles: int) -> dict:
+    """
+    Switch apps while the new window's title changes several times, i.e. a
+    page loading, against an engine that takes a few milliseconds to speak.
+    Counts what the engine is asked to say with every event spoken like
+    before, and with the app and title coalesced and debounced
+    """
+    debounce = 0.05
+
+    def churn(coalesce: bool) -> dict:
+        engine = FakeEngine(reports_speaking=False, delay=0.002)
+        queue = speech_queue.SpeechQueue(engine.speak, engine.cancel)
+        queue.start()
+        try:
+            for switch in range(switches):
+                app = f"App {switch}"
+                if coalesce:
+                    queue.submit(app, "context", key="context", delay=debounce)
+                else:
+                    queue.submit(app, "context")
+                for title in range(titles):
+                    text = f"Page {title}"
+                    if coalesce:
+                        queue.submit(
+                            f"{app} {text}", "context", key="context", delay=debounce
+                        )
+                    else:
+                        queue.submit(text, "context")
+                    time.sleep(0.005)
+                time.sleep(debounce * 2)
+        finally:
+            queue.stop()
+        spoken = [text for text in engine.log if text != "<cancel>"]
+        return {
+            "utterances_spoken": len(spoken),
+            "cancels": len(engine.log) - len(spoken),
+            "last": spoken[-1] if spoken else None,
+        }
+
+    return {
+        "events": switches * (titles + 1),
+        "every_event": churn(False),
+        "coalesced": churn(True),
+    }
+
+
+def run_blocking(speech_queue, rounds: int, engine_delay: float) -> dict:
+    """How long the caller waits to speak, with and without the queue"""
+    direct = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        process = subprocess.Popen(["true"])
+        direct.append(time.perf_counter() - start)
+        process.wait()
+
+    engine = FakeEngine(reports_speaking=False, delay=engine_delay)
+    queue = speech_queue.SpeechQueue(engine.speak, engine.cancel)
+    queue.start()
+    submit, handed_off = [], []
+    try:
+        for _ in range(rounds):
+            engine.spoken.clear()
+            start = time.perf_counter()
+            queue.submit("hello", "echo")
+            submit.append(time.perf_counter() - start)
+            engine.spoken.wait(5)
+            handed_off.append(time.perf_counter() - start)
+    finally:
+        queue.stop()
+    return {
+        "start_process_on_caller": summarize(direct),
+        "submit_to_queue": summarize(submit),
+        "until_engine_has_it": summarize(handed_off),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=500)
+    parser.add_argument(
+        "--engine-ms",
+        type=float,
+        default=1,
+        help="How long the fake engine takes to start speaking",
+    )
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    speech_queue = load_speech_queue()
+    results = {
+        "ordering": run_ordering(speech_queue),
+        "coalescing": run_coalescing(speech_queue),
+        "window_churn": run_window_churn(speech_queue, 20, 5),
+        "blocking": run_blocking(speech_queue, args.rounds, args.engine_ms / 1000),
+    }
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {write_results('speech_queue', results, args.output)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Measures speaking and cancelling through the persistent speech-dispatcher connection.
+
+Runs the real SSIP client from core/speech_dispatcher against a fake
+speech-dispatcher on a unix socket that answers like the real one, and checks
+it reconnects after the server drops it. For comparison, also times starting
+and killing a process per utterance like spd-say needed, which is a lower
+bound since spd-say itself then has to connect and set everything up.
+
+    python .benchmarks/ssip_benchmark.py --compare .benchmarks/results/ssip-abc1234.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common import compare, load_package, summarize, write_results
+
+REPLIES = {
+    "SET": {
+        "CLIENT_NAME": "208 OK CLIENT NAME SET",
+        "RATE": "203 OK RATE SET",
+        "VOLUME": "218 OK VOLUME SET",
+    },
+    "CANCEL": "210 OK CANCELED",
+    "QUIT": "231 HAPPY HACKING",
+}
+
+
+class FakeSpeechDispatcher:
+    """Answers SSIP commands like speech-dispatcher and counts them"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen()
+        self.commands: list[str] = []
+        self.messages: list[str] = []
+        self.connection = None
+        self.message_id = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def drop(self):
+        """Close the current connection, like speech-dispatcher exiting when idle"""
+        self.connection.shutdown(socket.SHUT_RDWR)
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connection = connection
+            threading.Thread(
+                target=self._serve, args=(connection,), daemon=True
+            ).start()
+
+    def _serve(self, connection: socket.socket):
+        try:
+            self._answer(connection)
+        except OSError:
+            # Dropped, or the client went away
+            pass
+
+    def _answer(self, connection: socket.socket):
+        lines = connection.makefile("rb")
+        with connection, lines:
+            for raw in lines:
+                command = raw.decode().rstrip("\r\n")
+                self.commands.append(command)
+                words = command.split()
+                if words[0] == "SPEAK":
+                    connection.sendall(b"230 OK RECEIVING DATA\r\n")
+                    body = []
+                    for data in lines:
+                        line = data.decode().rstrip("\r\n")
+                        if line == ".":
+                            break
+                        body.append(line[1:] if line.startswith("..") else line)
+                    self.messages.append("\n".join(body))
+                    self.message_id += 1
+                    reply = f"225-{self.message_id}\r\n225 OK MESSAGE QUEUED"
+                elif words[0] == "SET":
+                    reply = REPLIES["SET"].get(words[2], "300 ERR UNKNOWN")
+                else:
+                    reply = REPLIES.get(words[0], "300 ERR UNKNOWN")
+                connection.sendall(reply.encode() + b"\r\n")
+
+    def close(self):
+        self.listener.close()
+
+
+def load_ssip_client():
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package(
+        "sightless.core.speech_dispatcher",
+        os.path.join("core", "speech_dispatcher"),
+    )
+    return importlib.import_module("sightless.core.speech_dispatcher.ssip_client")
+
+
+def run_client(ssip_client, address: str, server, utterances: int) -> dict:
+    client = ssip_client.SSIPClient(address)
+
+    start = time.perf_counter()
+    client.speak("first", 50, 60)
+    first = time.perf_counter() - start
+
+    writes = client.writes
+    speak = []
+    for i in range(utterances):
+        start = time.perf_counter()
+        client.speak(f"utterance {i}", 50, 60)
+        speak.append(time.perf_counter() - start)
+    writes_per_speak = (client.writes - writes) / utterances
+
+    cancel, cancel_then_speak = [], []
+    for i in range(utterances):
+        start = time.perf_counter()
+        client.cancel()
+        cancel.append(time.perf_counter() - start)
+        client.speak(f"interrupting {i}", 50, 60)
+        cancel_then_speak.append(time.perf_counter() - start)
+
+    # Changing the rate costs one more command, once
+    writes = client.writes
+    client.speak("faster", 70, 60)
+    client.speak("still faster", 70, 60)
+    writes_after_rate_change = client.writes - writes
+
+    server.drop()
+    start = time.perf_counter()
+    client.speak("after reconnecting", 70, 60)
+    reconnect = time.perf_counter() - start
+    if server.messages[-1] != "after reconnecting":
+        raise AssertionError("The client didn't speak after reconnecting")
+
+    client.close()
+    return {
+        "first_speak": summarize([first]),
+        "speak": summarize(speak),
+        "writes_per_speak": writes_per_speak,
+        "cancel": summarize(cancel),
+        "cancel_then_speak": summarize(cancel_then_speak),
+        "writes_for_rate_change_and_next_speak": writes_after_rate_change,
+        "speak_after_reconnect": summarize([reconnect]),
+        "connects": client.connects,
+    }
+
+
+def run_process_per_utterance(utterances: int) -> dict:
+    """Start and kill a process per utterance, without any speaking at all"""
+    sleep = shutil.which("sleep")
+    samples = []
+    for _ in range(utterances):
+        start = time.perf_counter()
+        process = subprocess.Popen([sleep, "3600"])
+        process.kill()
+        process.wait()
+        samples.append(time.perf_counter() - start)
+    return {"spawn_and_kill": summarize(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--utterances", type=int, default=2000)
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    if not hasattr(socket, "AF_UNIX"):
+        sys.exit("The fake speech-dispatcher needs unix sockets")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "speechd.sock")
+        server = FakeSpeechDispatcher(path)
+        try:
+            results = {
+                "ssip_client": run_client(
+                    load_ssip_client(), f"unix_socket:{path}", server, args.utterances
+                ),
+                "process_per_utterance": run_process_per_utterance(
+                    min(args.utterances, 200)
+                ),
+            }
+        finally:
+            server.close()
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {write_results('ssip', results, args.output)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
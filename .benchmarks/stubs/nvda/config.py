@@ -0,0 +1,14 @@
+# Stand-in for NVDA's config module with the sections the addon touches
+conf = {
+    "keyboard": {
+        "speechInterruptForCharacters": True,
+        "speechInterruptForEnter": True,
+        "speakTypedWords": True,
+        "speakTypedCharacters": True,
+        "speakCommandKeys": False,
+    },
+    "speech": {"symbolLevel": 100, "autoLanguageSwitching": True},
+    "reviewCursor": {"followFocus": True, "followCaret": True},
+    "mouse": {"enableMouseTracking": True},
+    "presentation": {"reportTooltips": False, "reportHelpBalloons": True},
+}
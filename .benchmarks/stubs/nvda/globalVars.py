@@ -0,0 +1,9 @@
+# Stand-in for NVDA's globalVars module. The benchmark picks the config
+# directory so it knows where the server will write its spec file
+import os
+import tempfile
+import types
+
+appArgs = types.SimpleNamespace(
+    configPath=os.environ.get("TALON_BENCH_CONFIG_PATH") or tempfile.mkdtemp()
+)
@@ -0,0 +1,38 @@
+"""
+A fake piper that takes about as long as the real one to load a model and
+to synthesize, and says nothing but silence. The timings come from the
+environment so the benchmark can change them for the worker it starts
+"""
+
+import os
+import re
+import time
+from types import SimpleNamespace
+
+SAMPLE_RATE = 16000
+# Roughly what en_US-amy-low takes to load, and to synthesize a character
+LOAD_SECONDS = float(os.environ.get("FAKE_PIPER_LOAD_MS", 400)) / 1000
+SECONDS_PER_CHARACTER = float(os.environ.get("FAKE_PIPER_MS_PER_CHAR", 0.4)) / 1000
+# About how long a character takes to say at length scale 1
+SPOKEN_SECONDS_PER_CHARACTER = 0.06
+
+
+class PiperVoice:
+    def __init__(self):
+        self.config = SimpleNamespace(sample_rate=SAMPLE_RATE)
+
+    @staticmethod
+    def load(model_path: str, *args, **kwargs) -> "PiperVoice":
+        time.sleep(LOAD_SECONDS)
+        return PiperVoice()
+
+    def synthesize_stream_raw(self, text: str, length_scale: float = 1.0, **kwargs):
+        for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+            time.sleep(len(sentence) * SECONDS_PER_CHARACTER)
+            samples = int(
+                len(sentence)
+                * SPOKEN_SECONDS_PER_CHARACTER
+                * length_scale
+                * SAMPLE_RATE
+            )
+            yield bytes(samples * 2)
@@ -0,0 +1,18 @@
+"""Like `piper --model ... --output_raw`, which loads the model on every run"""
+
+import argparse
+import sys
+
+from piper import PiperVoice
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--model")
+parser.add_argument("--length_scale", type=float, default=1.0)
+parser.add_argument("--output_raw", action="store_true")
+args = parser.parse_args()
+
+voice = PiperVoice.load(args.model)
+for line in sys.stdin:
+    for audio in voice.synthesize_stream_raw(line, length_scale=args.length_scale):
+        sys.stdout.buffer.write(audio)
+        sys.stdout.buffer.flush()
@@ -0,0 +1,103 @@
+"""
+A minimal stand-in for the talon module so repository code can be imported
+and benchmarked outside of Talon. Action classes registered on a context
+override the module defaults, much like a matching context would in Talon
+"""
+
+import threading
+import types
+
+
+class _Namespace(types.SimpleNamespace):
+    pass
+
+
+actions = _Namespace(user=_Namespace())
+
+
+class _Settings(dict):
+    def get(self, name, default=None):
+        return dict.get(self, name, default)
+
+
+settings = _Settings(
+    {
+        "user.addon_debug": False,
+        "user.tts_speed": 8,
+        "user.tts_volume": 80,
+        "user.nvda_running_ttl": 1.0,
+        "user.nvda_key": "capslock",
+    }
+)
+
+
+def _register_actions(cls, override: bool):
+    for name, fn in vars(cls).items():
+        if name.startswith("__") or not callable(fn):
+            continue
+        if override or not hasattr(actions.user, name):
+            setattr(actions.user, name, fn)
+
+
+class Module:
+    def action_class(self, cls):
+        _register_actions(cls, override=False)
+        return cls
+
+    def tag(self, *args, **kwargs):
+        pass
+
+    def setting(self, *args, **kwargs):
+        pass
+
+    def scope(self, fn):
+        fn.update = lambda: None
+        return fn
+
+
+class Context:
+    def __init__(self):
+        self.matches = ""
+        self.tags = []
+        self.settings = {}
+
+    def action_class(self, path: str):
+        def register(cls):
+            if path == "user":
+                _register_actions(cls, override=True)
+            return cls
+
+        return register
+
+
+class _Cron:
+    @staticmethod
+    def _seconds(duration: str) -> float:
+        if duration.endswith("ms"):
+            return float(duration[:-2]) / 1000
+        return float(duration.rstrip("s"))
+
+    def after(self, duration: str, fn):
+        timer = threading.Timer(self._seconds(duration), fn)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def interval(self, duration: str, fn):
+        return None
+
+    def cancel(self, handle):
+        if handle:
+            handle.cancel()
+
+
+cron = _Cron()
+app = _Namespace(register=lambda *args, **kwargs: None, platform="linux")
+registry = _Namespace(register=lambda *args, **kwargs: None)
+speech_system = _Namespace(register=lambda *args, **kwargs: None)
+scope = _Namespace(get=lambda name: ["command"])
+ui = _Namespace(register=lambda *args, **kwargs: None)
+clip = _Namespace()
+fs = _Namespace(
+    watch=lambda *args, **kwargs: None, unwatch=lambda *args, **kwargs: None
+)
@@ -0,0 +1,203 @@
+"""
+Counts what the tts engines are sent, now that they remember their properties.
+
+Runs a session of phrases through the real speech queue, normalizer and fake
+engine from core, with the rate changed halfway, and counts how many times
+rate and volume are written to the engine. For comparison it counts the same
+for an engine that writes them before every utterance, like SAPI5 was used
+before. Then it speaks through the espeak engine against the fake
+speech-dispatcher from the SSIP benchmark and checks what arrives. Also prints
+each engine's capabilities, and what a rate becomes for say and espeak.
+
+    python .benchmarks/tts_engine_benchmark.py --compare .benchmarks/results/tts_engine-abc1234.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from common import compare, load_package, summarize, write_results
+from ssip_benchmark import FakeSpeechDispatcher
+
+PHRASES = ["command mode", "Firefox. Pull requests", "x = f(a, b)", "hello world"]
+
+
+def load_core():
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    for package in (
+        "speech_queue",
+        "text_normalization",
+        "speech_dispatcher",
+        "piper_tts",
+        "tts_engine",
+    ):
+        load_package(f"sightless.core.{package}", os.path.join("core", package))
+    modules = {
+        "speech_queue": "speech_queue.speech_queue",
+        "normalization": "text_normalization.text_normalization",
+        "ssip_client": "speech_dispatcher.ssip_client",
+        "tts_engine": "tts_engine.tts_engine",
+        "espeak_engine": "tts_engine.espeak_engine",
+        "say_engine": "tts_engine.say_engine",
+        "piper_engine": "tts_engine.piper_engine",
+    }
+    return {
+        name: importlib.import_module(f"sightless.core.{module}")
+        for name, module in modules.items()
+    }
+
+
+def writes_every_time(tts_engine):
+    class WritesEveryTime(tts_engine.FakeEngine):
+        """Sends rate and volume before every utterance, whether they changed or not"""
+
+        def set_rate(self, value: float):
+            self._write_rate(value)
+            self._rate = value
+            self.writes += 1
+
+        def set_volume(self, value: float):
+            self._write_volume(value)
+            self._volume = value
+            self.writes += 1
+
+    return WritesEveryTime()
+
+
+def run_session(core: dict, engine, utterances: int) -> dict:
+    """Speak through the queue like core-agnostic does, changing the rate halfway"""
+    normalize = core["normalization"].normalizer("some", True, True)
+    settings = {"rate": 0, "volume": 50}
+    queue = core["speech_queue"].SpeechQueue(
+        lambda text: engine.speak_with_settings(
+            normalize(text), settings["rate"], settings["volume"]
+        ),
+        engine.silence,
+    )
+    samples = []
+    for index in range(utterances):
+        if index == utterances // 2:
+            settings["rate"] = 5
+        queue.submit(PHRASES[index % len(PHRASES)], "echo", interrupt=False)
+        start = time.perf_counter()
+        while queue.step():
+            engine.finish()
+        samples.append(time.perf_counter() - start)
+    if len(engine.spoken()) != utterances:
+        raise AssertionError(f"expected {utterances} utterances, got {engine.spoken()}")
+    return {
+        "property_writes": engine.writes,
+        "writes_per_utterance": round(engine.writes / utterances, 3),
+        "seconds": summarize(samples),
+    }
+
+
+def run_property_writes(core: dict, utterances: int) -> dict:
+    diffed = run_session(core, core["tts_engine"].FakeEngine(), utterances)
+    if diffed["property_writes"] != 3:
+        raise AssertionError(
+            f"expected rate and volume once, then the rate change, "
+            f"got {diffed['property_writes']} writes"
+        )
+    return {
+        "utterances": utterances,
+        "every_utterance": run_session(
+            core, writes_every_time(core["tts_engine"]), utterances
+        ),
+        "on_change": diffed,
+    }
+
+
+def run_espeak(core: dict, utterances: int) -> dict:
+    directory = tempfile.mkdtemp()
+    address = os.path.join(directory, "speechd.sock")
+    server = FakeSpeechDispatcher(address)
+    engine = core["espeak_engine"].EspeakEngine(
+        core["ssip_client"].SSIPClient(f"unix_socket:{address}")
+    )
+    try:
+        for index in range(utterances):
+            rate = 0 if index < utterances // 2 else 5
+            engine.speak_with_settings(f"phrase {index}", rate, 50)
+        # Wait for the last one to be read
+        engine.client.cancel()
+        engine.client.close()
+        deadline = time.monotonic() + 5
+        while len(server.messages) < utterances and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        server.close()
+        shutil.rmtree(directory)
+    if server.messages != [f"phrase {index}" for index in range(utterances)]:
+        raise AssertionError(f"espeak said {server.messages}")
+    return {
+        "utterances": utterances,
+        "engine_property_writes": engine.writes,
+        "set_commands": sum(
+            command.startswith("SET self RATE") or command.startswith("SET self VOLUME")
+            for command in server.commands
+        ),
+        "rates_sent": [
+            command.split()[-1]
+            for command in server.commands
+            if command.startswith("SET self RATE")
+        ],
+    }
+
+
+def run_capabilities(core: dict) -> dict:
+    engines = [
+        core["tts_engine"].FakeEngine,
+        core["espeak_engine"].EspeakEngine,
+        core["piper_engine"].PiperEngine,
+        core["say_engine"].SayEngine,
+    ]
+    flags = ["has_rate", "has_volume", "has_pitch", "has_voices", "reports_speaking"]
+    return {
+        engine.name: {flag: getattr(engine, flag) for flag in flags}
+        for engine in engines
+    }
+
+
+def run_conversions(core: dict) -> dict:
+    say = core["say_engine"].SayEngine()
+    espeak = core["espeak_engine"].EspeakEngine(client=object())
+    results = {}
+    for rate in (-10, -5, 0, 5, 10):
+        say.set_rate(rate)
+        espeak.set_rate(rate)
+        results[rate] = {
+            "say_words_per_minute": say.words_per_minute,
+            "espeak_ssip_rate": espeak.ssip_rate,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--utterances", type=int, default=200)
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="A previous results file to compare with")
+    args = parser.parse_args()
+
+    core = load_core()
+    results = {
+        "capabilities": run_capabilities(core),
+        "rate_conversions": run_conversions(core),
+        "property_writes": run_property_writes(core, args.utterances),
+        "espeak": run_espeak(core, args.utterances),
+    }
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {write_results('tts_engine', results, args.output)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
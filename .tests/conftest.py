@@ -0,0 +1,31 @@
+"""Lets the tests load the tree the same way the benchmarks do, outside of Talon"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, ".benchmarks"))
+
+from loaders import addon  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def addon_server():
+    """
+    The NVDA addon's server running in this process. Stopping it closes its
+    sockets for good, so every test that needs it shares this one
+    """
+    server = addon().server
+    thread = threading.Thread(target=server.create_server, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not server.running:
+        assert time.monotonic() < deadline, "The addon server did not start"
+        time.sleep(0.01)
+    yield server
+    server.stop()
+    thread.join(5)
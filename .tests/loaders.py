@@ -0,0 +1,56 @@
+"""
+Loads the parts of the tree the tests need, once each, the same way the
+benchmarks do: the core files as a package through the stand-in talon module,
+and the NVDA addon with the stand-in NVDA modules
+"""
+
+import functools
+import importlib
+import os
+import sys
+
+from common import NVDA_STUBS_DIR, load_module, load_package, use_talon_stub
+
+ADDON_PATH = os.path.join(
+    "nvda",
+    ".addOn",
+    "sight-free-talon-server",
+    "addon",
+    "globalPlugins",
+    "nvda-addon.py",
+)
+
+
+def _package(name: str, relative_path: str):
+    if name not in sys.modules:
+        load_package(name, relative_path)
+
+
+def _core_packages(*folders: str):
+    use_talon_stub()
+    _package("sightless", "")
+    _package("sightless.core", "core")
+    _package("sightless.lib", "lib")
+    for folder in folders:
+        _package(f"sightless.core.{folder}", os.path.join("core", folder))
+
+
+def core_module(name: str):
+    """A module under core/ by its dotted name, i.e. "speech_queue.speech_queue" """
+    *folders, _ = name.split(".")
+    _core_packages(*folders[:1])
+    return importlib.import_module(f"sightless.core.{name}")
+
+
+def nvda_module():
+    """nvda/nvda.py, which leaves out the NVDA controller client off Windows"""
+    _core_packages("screenreader_ipc", "screenreader_presence")
+    _package("sightless.nvda", "nvda")
+    return importlib.import_module("sightless.nvda.nvda")
+
+
+@functools.cache
+def addon():
+    if NVDA_STUBS_DIR not in sys.path:
+        sys.path.insert(0, NVDA_STUBS_DIR)
+    return load_module("nvda_addon", ADDON_PATH)
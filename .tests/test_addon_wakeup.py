@@ -0,0 +1,29 @@
+"""
+Waking the NVDA addon's event loop from other threads, which must return
+straight away even when the loop hasn't read its earlier wakeups yet
+"""
+
+import threading
+
+from loaders import addon
+
+
+def test_wakes_never_block(monkeypatch):
+    protocol = addon()
+    # A server of our own whose loop never runs, so nothing drains its wakeups
+    monkeypatch.setattr(protocol.subscriptions, "wake", protocol.subscriptions.wake)
+    server = protocol.IPC_Server()
+    try:
+        # Far more than a socket buffer holds
+        thread = threading.Thread(
+            target=lambda: [server.wake() for _ in range(200_000)], daemon=True
+        )
+        thread.start()
+        thread.join(10)
+        assert not thread.is_alive()
+        assert server.wakeup_receiver.recv(1) == b"\0"
+    finally:
+        server.wakeup_receiver.close()
+        server.wakeup_sender.close()
+    # Waking a server that has shut down is harmless too
+    server.wake()
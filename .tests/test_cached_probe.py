@@ -0,0 +1,122 @@
+"""
+How long the answer to "is NVDA running" is reused, and everything that
+throws it away early: a failed request, an event pushed from NVDA and its
+spec file changing. The clock is a fake, so nothing waits
+"""
+
+import pytest
+from loaders import core_module, nvda_module
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Probe:
+    """Answers whatever it is set to, and counts how often it was asked"""
+
+    def __init__(self):
+        self.running = True
+        self.calls = 0
+
+    def __call__(self) -> bool:
+        self.calls += 1
+        return self.running
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def probe():
+    return Probe()
+
+
+def cached_probe(probe, clock, ttl: float = 0.5):
+    presence_monitor = core_module("screenreader_presence.presence_monitor")
+    return presence_monitor.CachedProbe(probe, lambda: ttl, clock)
+
+
+def test_reused_until_the_ttl_is_up(probe, clock):
+    cached = cached_probe(probe, clock)
+    assert cached()
+    probe.running = False
+    clock.now = 0.49
+    assert cached()
+    assert probe.calls == 1
+    clock.now = 0.5
+    assert not cached()
+    assert (probe.calls, cached.queries) == (2, 2)
+
+
+def test_refresh_always_asks(probe, clock):
+    cached = cached_probe(probe, clock)
+    cached()
+    probe.running = False
+    assert not cached.refresh()
+    # And what it got is cached like any other answer
+    probe.running = True
+    assert not cached()
+    assert probe.calls == 2
+
+
+def test_ttl_is_read_each_time(probe, clock):
+    ttl = [0.5]
+    presence_monitor = core_module("screenreader_presence.presence_monitor")
+    cached = presence_monitor.CachedProbe(probe, lambda: ttl[0], clock)
+    cached()
+    # Like changing user.nvda_running_ttl, which applies from the next query
+    ttl[0] = 0
+    clock.now = 0.1
+    cached()
+    assert probe.calls == 1
+    clock.now = 0.5
+    cached()
+    cached()
+    assert probe.calls == 3
+
+
+@pytest.fixture
+def nvda(monkeypatch, probe, clock):
+    """nvda.py's cached probe, asking the fake probe instead of the controller"""
+    nvda = nvda_module()
+    monkeypatch.setattr(nvda.nvda_running, "probe", probe)
+    monkeypatch.setattr(nvda.nvda_running, "clock", clock)
+    monkeypatch.setattr(nvda.nvda_running, "ttl", lambda: 60)
+    nvda.nvda_running.invalidate()
+    return nvda
+
+
+def asked_again(nvda, probe, invalidate) -> bool:
+    nvda.nvda_running()
+    calls = probe.calls
+    invalidate()
+    nvda.nvda_running()
+    return probe.calls == calls + 1
+
+
+def test_failed_request_invalidates(nvda, probe):
+    # What the IPC client does when a request to the addon fails
+    assert asked_again(nvda, probe, nvda.nvda_endpoint.invalidate)
+
+
+def test_pushed_event_invalidates(nvda, probe):
+    push = {"push": "event", "event": "foregroundChanged"}
+    assert asked_again(nvda, probe, lambda: nvda.on_nvda_push(push))
+    # A setting changing says nothing about NVDA running
+    push = {"push": "config", "path": "speech.rate", "value": 50}
+    assert not asked_again(nvda, probe, lambda: nvda.on_nvda_push(push))
+
+
+def test_spec_file_change_invalidates(nvda, probe, tmp_path):
+    spec_file = nvda.nvda_endpoint.spec_file
+    assert asked_again(nvda, probe, lambda: nvda.on_spec_file_change(spec_file, None))
+    # Anything else in the same directory is ignored
+    other = str(tmp_path / "other.json")
+    assert not asked_again(nvda, probe, lambda: nvda.on_spec_file_change(other, None))
@@ -0,0 +1,82 @@
+"""The IPC client's circuit breaker, with a fake clock"""
+
+import functools
+import importlib
+import os
+
+import pytest
+from common import load_package
+
+
+@functools.cache
+def ipc_timeouts():
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package(
+        "sightless.core.screenreader_ipc", os.path.join("core", "screenreader_ipc")
+    )
+    return importlib.import_module("sightless.core.screenreader_ipc.ipc_timeouts")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    breaker = ipc_timeouts().CircuitBreaker(threshold=3, cool_down=5, clock=clock)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.timed_out()
+    return breaker
+
+
+def test_opens_after_threshold(breaker, clock):
+    assert not breaker.allow()
+    clock.now = 4.9
+    assert not breaker.allow()
+
+
+def test_lets_one_probe_through(breaker, clock):
+    clock.now = 5
+    assert breaker.allow()
+    assert not breaker.allow()
+    assert not breaker.allow()
+    assert breaker.report().startswith("Half open, waiting")
+
+
+def test_probe_succeeding_closes(breaker, clock):
+    clock.now = 5
+    assert breaker.allow()
+    breaker.succeeded()
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+def test_probe_timing_out_opens_again(breaker, clock):
+    clock.now = 5
+    assert breaker.allow()
+    clock.now = 6
+    breaker.timed_out()
+    clock.now = 10.9
+    assert not breaker.allow()
+    clock.now = 11
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_another_probe_if_the_first_never_ends(breaker, clock):
+    clock.now = 5
+    assert breaker.allow()
+    clock.now = 10
+    assert breaker.allow()
+    assert not breaker.allow()
@@ -0,0 +1,149 @@
+"""
+The compact encoding from the Talon side to the NVDA addon's copy of it and
+back, and what the client picks from each protocol version's spec file
+"""
+
+import json
+import socket
+
+import pytest
+from loaders import addon, core_module
+
+COMMANDS = ["getSpeakTypedWords", "enableSpeakTypedWords", "getMetrics"]
+VALUES = [None, False, True, 0, -(2**40), {"rate": [1, 2]}, "text"]
+
+
+def ipc_protocol():
+    return core_module("screenreader_ipc.ipc_protocol")
+
+
+def ipc_client():
+    return core_module("screenreader_ipc.ipc_client")
+
+
+def command_ids(commands: list[str]) -> list[int]:
+    return [addon().valid_commands.index(command) for command in commands]
+
+
+@pytest.mark.parametrize("request_id", [None, 0, 2**32 - 1])
+def test_request_round_trip(request_id):
+    payload = ipc_protocol().encode_compact_request(command_ids(COMMANDS), request_id)
+    request = addon().decode_request(memoryview(payload))
+    assert request.commands == COMMANDS
+    assert request.request_id == request_id
+    assert request.compact
+
+
+@pytest.mark.parametrize("request_id", [None, 7])
+def test_response_round_trip(request_id):
+    protocol = addon()
+    request = protocol.Request([], request_id, compact=True)
+    statuses = list(protocol.StatusResult)
+    results = [
+        (None, value, statuses[i % len(statuses)]) for i, value in enumerate(VALUES)
+    ]
+    payload = protocol.encode_compact_response(request, results, 12)
+    assert ipc_protocol().decode_compact_response(memoryview(payload)) == (
+        request_id,
+        [result.value for _, _, result in results],
+        VALUES,
+        12,
+    )
+
+
+def test_unknown_command_id_is_invalid():
+    payload = ipc_protocol().encode_compact_request([len(addon().valid_commands)])
+    request = addon().decode_request(memoryview(payload))
+    _, _, result = addon().handle_command(request.commands[0])
+    assert result == addon().StatusResult.INVALID_COMMAND_ERROR
+
+
+def write_spec(path, **fields) -> str:
+    spec = {"address": "localhost", "port": "8888", "valid_commands": COMMANDS}
+    path.write_text(json.dumps(spec | fields))
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "fields, compact, pipelined, read_only",
+    [
+        # Written before the spec had a version at all
+        ({}, False, False, frozenset()),
+        ({"protocol_version": 2, "encodings": ["json"]}, False, False, frozenset()),
+        (
+            {"protocol_version": 2, "encodings": ["json", "compact"]},
+            True,
+            False,
+            frozenset(),
+        ),
+        (
+            {
+                "protocol_version": 3,
+                "encodings": ["json", "compact"],
+                "read_only_commands": ["getSpeakTypedWords"],
+            },
+            True,
+            True,
+            frozenset(),
+        ),
+        (
+            {
+                "protocol_version": 4,
+                "encodings": ["json", "compact"],
+                "read_only_commands": ["getSpeakTypedWords"],
+            },
+            True,
+            True,
+            frozenset(["getSpeakTypedWords"]),
+        ),
+    ],
+)
+def test_negotiation(tmp_path, fields, compact, pipelined, read_only):
+    endpoint = ipc_client().EndpointCache(write_spec(tmp_path / "spec.json", **fields))
+    _, port, commands = endpoint.get()
+    assert (port, commands) == ("8888", frozenset(COMMANDS))
+    assert (endpoint.command_ids is not None) == compact
+    assert endpoint.pipelined == pipelined
+    assert endpoint.read_only_commands == read_only
+
+
+def test_new_client_against_an_old_spec(tmp_path):
+    client = ipc_client()
+    endpoint = client.EndpointCache(write_spec(tmp_path / "spec.json"))
+    endpoint.get()
+    # Exactly what a version 1 server understands: a JSON list and no id
+    payload = client.encode_request(COMMANDS, endpoint.command_ids)
+    assert json.loads(payload) == COMMANDS
+    # And its responses have no id or generation
+    response = {
+        "processedCommands": COMMANDS,
+        "returnedValues": [True, None, {}],
+        "statusResults": ["success", "success", "success"],
+    }
+    request_id, decoded = client.decode_response(
+        memoryview(json.dumps(response).encode())
+    )
+    assert request_id is None
+    assert "generation" not in decoded
+
+
+def test_new_client_against_the_addon(addon_server):
+    client = ipc_client()
+    endpoint = client.EndpointCache(addon().SPEC_PATH)
+    ip, port, commands = endpoint.get()
+    assert endpoint.command_ids is not None and endpoint.pipelined
+    assert endpoint.read_only_commands == frozenset(addon().READ_ONLY_COMMANDS)
+
+    # Commands with arguments fall back to JSON, with the id either way
+    for bundle in (["getSpeakTypedWords"], [["getConfig", "speech.symbolLevel"]]):
+        payload = client.encode_request(bundle, endpoint.command_ids, 99)
+        assert ipc_protocol().is_compact(memoryview(payload)) == (
+            bundle == ["getSpeakTypedWords"]
+        )
+        with socket.create_connection((ip, int(port)), timeout=5) as sock:
+            sock.sendall(ipc_protocol().encode_frame(payload))
+            frame = ipc_protocol().FrameReader().read_frame(sock)
+            request_id, response = client.decode_response(frame)
+        assert request_id == 99
+        assert response["statusResults"] == [client.ServerStatusResult.SUCCESS]
+        assert response["generation"] == addon().config_generation.current()
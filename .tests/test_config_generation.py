@@ -0,0 +1,76 @@
+"""
+When the NVDA addon's config generation goes up, with the stand-in config,
+including while the keyboard state stack holds the echo settings off
+"""
+
+import functools
+import os
+import sys
+
+import pytest
+from common import NVDA_STUBS_DIR, load_module
+
+ADDON_PATH = os.path.join(
+    "nvda",
+    ".addOn",
+    "sight-free-talon-server",
+    "addon",
+    "globalPlugins",
+    "nvda-addon.py",
+)
+PATH = "keyboard.speakTypedWords"
+
+
+@functools.cache
+def addon():
+    if NVDA_STUBS_DIR not in sys.path:
+        sys.path.insert(0, NVDA_STUBS_DIR)
+    return load_module("nvda_addon", ADDON_PATH)
+
+
+@pytest.fixture(autouse=True)
+def restore_config():
+    conf = addon().config.conf
+    saved = {name: dict(section) for name, section in conf.items()}
+    yield
+    for name, section in saved.items():
+        conf[name].update(section)
+
+
+@pytest.fixture
+def stack():
+    return addon().KeyboardStateStack()
+
+
+@pytest.fixture
+def generation(monkeypatch, stack):
+    monkeypatch.setattr(addon(), "keyboard_state", stack)
+    return lambda: addon().config_generation.value
+
+
+def test_setting_the_same_value_does_not_bump(generation):
+    before = generation()
+    addon().set_config(PATH, addon().get_config(PATH))
+    assert generation() == before
+    addon().set_config(PATH, not addon().get_config(PATH))
+    assert generation() == before + 1
+
+
+def test_push_and_pop_do_not_bump(stack, generation):
+    before = generation()
+    stack.push("talon")
+    assert addon().read_config(PATH) is False
+    assert addon().get_config(PATH) is True
+    stack.pop("talon")
+    assert addon().read_config(PATH) is True
+    assert generation() == before
+
+
+def test_setting_while_held_changes_what_is_restored(stack, generation):
+    stack.push("talon")
+    before = generation()
+    addon().set_config(PATH, False)
+    assert generation() == before + 1
+    assert addon().get_config(PATH) is False
+    stack.pop("talon")
+    assert addon().read_config(PATH) is False
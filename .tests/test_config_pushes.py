@@ -0,0 +1,53 @@
+"""
+The NVDA addon's pushes to subscribers, against the real server running in
+this process, so a setting can change the way a gesture changes it: straight
+in the config, with no notification and no request
+"""
+
+import json
+import socket
+import time
+
+import pytest
+from loaders import addon
+
+PATH = "keyboard.speakTypedWords"
+
+
+@pytest.fixture
+def subscriber(addon_server):
+    protocol = addon()
+    sock = socket.create_connection(("localhost", addon_server.get_port()), timeout=5)
+    reader = protocol.FrameReader()
+
+    def read() -> dict:
+        frame = reader.next_frame()
+        while frame is None:
+            assert reader.recv_from(sock) > 0
+            frame = reader.next_frame()
+        return json.loads(bytes(frame))
+
+    sock.sendall(protocol.encode_frame(json.dumps([["subscribe", PATH]]).encode()))
+    response = read()
+    assert response["statusResults"] == ["success"]
+    yield response["returnedValues"][0], read
+    sock.close()
+
+
+@pytest.fixture
+def keyboard():
+    keyboard = addon().config.conf["keyboard"]
+    saved = dict(keyboard)
+    yield keyboard
+    keyboard.update(saved)
+
+
+def test_change_without_a_notification_is_pushed(subscriber, keyboard):
+    values, read = subscriber
+    keyboard["speakTypedWords"] = not values[PATH]
+
+    started = time.monotonic()
+    push = read()
+    assert push["push"] == "config"
+    assert (push["path"], push["value"]) == (PATH, not values[PATH])
+    assert time.monotonic() - started < addon().WATCH_INTERVAL * 2
@@ -0,0 +1,75 @@
+"""
+How often the client reads NVDA's server spec file: once, and after that
+only when a failure invalidates it and the file has actually changed
+"""
+
+import json
+import os
+
+import pytest
+from loaders import core_module
+
+COMMANDS = ["getSpeakTypedWords"]
+
+
+def write_spec(path, port: str, address: str = "localhost"):
+    path.write_text(
+        json.dumps({"address": address, "port": port, "valid_commands": COMMANDS})
+    )
+
+
+@pytest.fixture
+def spec(tmp_path):
+    path = tmp_path / "talon_server_spec.json"
+    write_spec(path, "8888")
+    return path
+
+
+@pytest.fixture
+def endpoint(spec):
+    return core_module("screenreader_ipc.ipc_client").EndpointCache(str(spec))
+
+
+def test_reused_without_touching_the_file(endpoint, spec):
+    ip, port, commands = endpoint.get()
+    assert (port, commands) == ("8888", frozenset(COMMANDS))
+    spec.unlink()
+    assert endpoint.get() == (ip, port, commands)
+
+
+def test_unchanged_file_isnt_parsed_again(endpoint, spec):
+    endpoint.get()
+    stat = os.stat(spec)
+    # Same inode and modification time, so only a stat tells them apart
+    write_spec(spec, "9999")
+    os.utime(spec, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    endpoint.invalidate()
+    assert endpoint.get()[1] == "8888"
+
+
+def test_new_file_is_read_after_invalidating(endpoint, spec):
+    calls = []
+    endpoint.add_invalidate_listener(lambda: calls.append(1))
+    endpoint.get()
+    spec.unlink()
+    write_spec(spec, "9999")
+    # Still valid until something fails
+    assert endpoint.get()[1] == "8888"
+    endpoint.invalidate()
+    assert endpoint.get()[1] == "9999"
+    assert calls == [1]
+
+
+def test_missing_file_means_no_server(endpoint, spec):
+    spec.unlink()
+    with pytest.raises(FileNotFoundError):
+        endpoint.get()
+
+
+def test_only_local_addresses(endpoint, spec):
+    write_spec(spec, "8888", "8.8.8.8")
+    with pytest.raises(AssertionError):
+        endpoint.get()
+    with pytest.raises(ValueError):
+        endpoint.resolve("not an address")
+    assert endpoint.resolve("192.168.1.2") == "192.168.1.2"
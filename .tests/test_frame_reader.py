@@ -0,0 +1,165 @@
+"""
+Both copies of the frame reader, the Talon client's and the NVDA addon's,
+against frames delivered through a socket pair in every way TCP can split
+or join them
+"""
+
+import functools
+import importlib
+import os
+import random
+import socket
+import sys
+import threading
+
+import pytest
+from common import NVDA_STUBS_DIR, load_module, load_package
+
+ADDON_PATH = os.path.join(
+    "nvda",
+    ".addOn",
+    "sight-free-talon-server",
+    "addon",
+    "globalPlugins",
+    "nvda-addon.py",
+)
+
+
+@functools.cache
+def client_frame_reader():
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package(
+        "sightless.core.screenreader_ipc", os.path.join("core", "screenreader_ipc")
+    )
+    protocol = importlib.import_module("sightless.core.screenreader_ipc.ipc_protocol")
+    return protocol.FrameReader, protocol.FRAME_HEADER
+
+
+@functools.cache
+def addon_frame_reader():
+    if NVDA_STUBS_DIR not in sys.path:
+        sys.path.insert(0, NVDA_STUBS_DIR)
+    addon = load_module("nvda_addon", ADDON_PATH)
+    return addon.FrameReader, addon.FRAME_HEADER
+
+
+@pytest.fixture(params=["client", "addon"])
+def reader(request):
+    load = client_frame_reader if request.param == "client" else addon_frame_reader
+    return load()
+
+
+@pytest.fixture
+def sockets():
+    sender, receiver = socket.socketpair()
+    yield sender, receiver
+    sender.close()
+    receiver.close()
+
+
+def frame(header, payload: bytes) -> bytes:
+    return header.pack(len(payload)) + payload
+
+
+def drain(frame_reader) -> list[bytes]:
+    # Frames are views over the reader's buffer, so copy each one straight away
+    frames = []
+    current = frame_reader.next_frame()
+    while current is not None:
+        frames.append(bytes(current))
+        current = frame_reader.next_frame()
+    return frames
+
+
+def deliver(sockets, frame_reader, chunks: list[bytes]) -> list[bytes]:
+    """Send each chunk on its own and receive exactly it, collecting every frame"""
+    sender, receiver = sockets
+    frames = []
+    for chunk in chunks:
+        sender.sendall(chunk)
+        assert frame_reader.recv_from(receiver, len(chunk)) == len(chunk)
+        frames += drain(frame_reader)
+    return frames
+
+
+def slices(data: bytes, rng: random.Random, largest: int) -> list[bytes]:
+    chunks = []
+    while data:
+        size = rng.randint(1, largest)
+        chunks.append(data[:size])
+        data = data[size:]
+    return chunks
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_slices(reader, sockets, seed):
+    frame_reader_class, header = reader
+    rng = random.Random(seed)
+    sizes = [0, 1, 3, 4, 5, 17, 255, 4095, 4096, 4097, 9000]
+    payloads = [rng.randbytes(rng.choice(sizes)) for _ in range(16)]
+    stream = b"".join(frame(header, payload) for payload in payloads)
+
+    # A small initial buffer so it has to compact and grow along the way
+    frame_reader = frame_reader_class(64)
+    chunks = slices(stream, rng, rng.choice([1, 3, 7, 64, 1500]))
+    assert deliver(sockets, frame_reader, chunks) == payloads
+    assert frame_reader.next_frame() is None
+
+
+@pytest.mark.parametrize("cut", [1, 2, 3])
+def test_split_header(reader, sockets, cut):
+    frame_reader_class, header = reader
+    payloads = [b"first", b"second"]
+    stream = b"".join(frame(header, payload) for payload in payloads)
+    second = len(frame(header, payloads[0]))
+
+    chunks = [stream[:cut], stream[cut : second + cut], stream[second + cut :]]
+    frame_reader = frame_reader_class()
+    assert deliver(sockets, frame_reader, chunks) == payloads
+    assert frame_reader.next_frame() is None
+
+
+def test_several_frames_in_one_chunk(reader, sockets):
+    frame_reader_class, header = reader
+    payloads = [b'["pushKeyboardState"]', b"", b'["popKeyboardState"]'] * 10
+    stream = b"".join(frame(header, payload) for payload in payloads)
+
+    frame_reader = frame_reader_class()
+    assert deliver(sockets, frame_reader, [stream]) == payloads
+    assert frame_reader.next_frame() is None
+
+
+def test_frame_larger_than_the_buffer(reader, sockets):
+    frame_reader_class, header = reader
+    sender, receiver = sockets
+    payloads = [b"before", random.Random(0).randbytes(1024 * 1024), b"after"]
+    stream = b"".join(frame(header, payload) for payload in payloads)
+
+    # More than the socket buffer holds, so it has to be sent while we read
+    writer = threading.Thread(target=sender.sendall, args=(stream,))
+    writer.start()
+    frame_reader = frame_reader_class()
+    frames = []
+    while len(frames) < len(payloads):
+        assert frame_reader.recv_from(receiver) > 0
+        frames += drain(frame_reader)
+    writer.join()
+
+    assert frames == payloads
+    assert frame_reader.next_frame() is None
+
+
+def test_incomplete_frame_is_not_returned(reader, sockets):
+    frame_reader_class, header = reader
+    data = frame(header, b"complete")
+    frame_reader = frame_reader_class()
+    assert deliver(sockets, frame_reader, [data[:-1]]) == []
+    assert deliver(sockets, frame_reader, [data[-1:]]) == [b"complete"]
+
+
+def test_too_large_frame_is_rejected(reader, sockets):
+    frame_reader_class, header = reader
+    frame_reader = frame_reader_class()
+    with pytest.raises(ValueError):
+        deliver(sockets, frame_reader, [header.pack(2**31)])
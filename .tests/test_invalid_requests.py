@@ -0,0 +1,80 @@
+"""
+The NVDA addon's answer to a request it can't decode, which has to carry the
+request's id whenever it can be read so a pipelining client matches it up,
+and to commands it won't run
+"""
+
+import json
+import socket
+import struct
+
+import pytest
+from loaders import addon
+
+
+def compact(version: int, count: int, rest: bytes) -> memoryview:
+    return memoryview(struct.pack(">BBH", addon().COMPACT_MAGIC, version, count) + rest)
+
+
+def test_id_from_a_truncated_compact_request():
+    # Says it has two commands but only carries one
+    frame = compact(addon().COMPACT_PIPELINED_VERSION, 2, struct.pack(">IH", 42, 0))
+    assert addon().recover_request_id(frame) == 42
+
+
+def test_no_id_without_a_pipelined_header():
+    assert addon().recover_request_id(compact(addon().COMPACT_VERSION, 2, b"")) is None
+    assert addon().recover_request_id(memoryview(b'{"id": ')) is None
+    # Too short to hold the id
+    frame = compact(addon().COMPACT_PIPELINED_VERSION, 0, b"\0")
+    assert addon().recover_request_id(frame) is None
+
+
+def test_response_echoes_the_id():
+    response = json.loads(addon().invalid_request_response("bad", 42))
+    assert response["id"] == 42
+    assert response["statusResults"] == ["jsonEncodeError"]
+    assert "id" not in json.loads(addon().invalid_request_response("bad"))
+
+
+@pytest.mark.parametrize(
+    "path", ["speech.rate", "keyboard", "keyboard.speakTypedWords.extra", ""]
+)
+def test_config_outside_the_whitelist(path):
+    conf = json.dumps(addon().config.conf)
+    for command in (["getConfig", path], ["setConfig", path, True]):
+        _, value, result = addon().handle_command(command)
+        assert (value, result) == (None, addon().StatusResult.RUNTIME_ERROR)
+    assert json.dumps(addon().config.conf) == conf
+
+
+@pytest.mark.parametrize("command", ["noSuchCommand", ["noSuchCommand", 1], [42], []])
+def test_unknown_command(command):
+    _, value, result = addon().handle_command(command)
+    assert (value, result) == (None, addon().StatusResult.INVALID_COMMAND_ERROR)
+
+
+def test_server_keeps_answering_after_bad_requests(addon_server):
+    protocol = addon()
+    sock = socket.create_connection(("localhost", addon_server.get_port()), timeout=5)
+    reader = protocol.FrameReader()
+
+    def request(payload: bytes) -> dict:
+        sock.sendall(protocol.encode_frame(payload))
+        frame = reader.next_frame()
+        while frame is None:
+            assert reader.recv_from(sock) > 0
+            frame = reader.next_frame()
+        return json.loads(bytes(frame))
+
+    with sock:
+        response = request(
+            json.dumps(
+                [["noSuchCommand"], ["getConfig", "speech.rate"], "getSpeakTypedWords"]
+            ).encode()
+        )
+        assert response["statusResults"] == ["commandError", "runtimeError", "success"]
+        assert request(b"not json")["statusResults"] == ["jsonEncodeError"]
+        response = request(json.dumps(["getSpeakTypedWords"]).encode())
+        assert response["statusResults"] == ["success"]
+    assert addon_server.running
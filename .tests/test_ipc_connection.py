@@ -0,0 +1,170 @@
+"""
+How the client's IPC connection fails, against a server socket that accepts
+but never answers, and how it keeps one connection to a server that runs the
+addon's own request handling and can hang up on it
+"""
+
+import functools
+import importlib
+import os
+import select
+import socket
+import threading
+from concurrent.futures import Future
+
+import pytest
+from common import load_package, use_talon_stub
+from loaders import addon
+
+
+@functools.cache
+def ipc_client():
+    use_talon_stub()
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package("sightless.lib", "lib")
+    load_package(
+        "sightless.core.screenreader_ipc", os.path.join("core", "screenreader_ipc")
+    )
+    return importlib.import_module("sightless.core.screenreader_ipc.ipc_client")
+
+
+@pytest.fixture
+def silent_server():
+    listener = socket.create_server(("127.0.0.1", 0))
+    yield listener.getsockname()
+    listener.close()
+
+
+@pytest.fixture
+def failures():
+    return []
+
+
+@pytest.fixture
+def connection(failures):
+    connection = ipc_client().IPCConnection(on_failure=lambda: failures.append(1))
+    yield connection
+    connection.close()
+
+
+def send(connection, address) -> Future:
+    future = Future()
+    connection.send(future, *address, ["getSpeakTypedWords"])
+    return future
+
+
+def test_timeout_while_sending_fails_once(connection, failures, silent_server):
+    waiting = send(connection, silent_server)
+    assert not waiting.done()
+
+    def time_out(*args):
+        raise socket.timeout()
+
+    connection._write = time_out
+    timed_out = send(connection, silent_server)
+    assert failures == [1]
+    for future in (waiting, timed_out):
+        with pytest.raises(RuntimeError, match="TIMED_OUT"):
+            future.result(0)
+
+
+def test_refused_connection_fails_once(connection, failures):
+    # Nothing listens on it once it's closed
+    unused = socket.create_server(("127.0.0.1", 0))
+    address = unused.getsockname()
+    unused.close()
+    with pytest.raises(RuntimeError):
+        send(connection, address).result(0)
+    assert failures == [1]
+
+
+class HangingUpServer:
+    """Answers with the addon's request handling, and counts its connections"""
+
+    def __init__(self):
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.address = self.listener.getsockname()
+        self.connections: list[socket.socket] = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def hang_up(self):
+        """Close the newest connection, like NVDA restarting"""
+        self.connections[-1].shutdown(socket.SHUT_RDWR)
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections.append(sock)
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _serve(self, sock: socket.socket):
+        protocol = addon()
+        reader = protocol.FrameReader()
+        try:
+            while reader.recv_from(sock):
+                frame = reader.next_frame()
+                while frame is not None:
+                    response = protocol.run_request(protocol.decode_request(frame))
+                    sock.sendall(protocol.encode_frame(response))
+                    frame = reader.next_frame()
+        except OSError:
+            pass
+
+    def close(self):
+        self.listener.close()
+        for sock in self.connections:
+            sock.close()
+
+
+@pytest.fixture
+def server():
+    server = HangingUpServer()
+    yield server
+    server.close()
+
+
+def exchange(connection, address) -> bool:
+    """Send one read and wait for its result, the way the IPC worker does"""
+    future = Future()
+    connection.send(future, *address, ["getSpeakTypedWords"], pipelined=True)
+    while not future.done():
+        readable, _, _ = select.select([connection.session.sock], [], [], 5)
+        assert readable, "The server didn't answer"
+        connection.read_responses()
+    return future.result(0)
+
+
+def test_connection_is_reused(connection, failures, server):
+    for _ in range(3):
+        [(command, value)] = exchange(connection, server.address)
+        assert command == "getSpeakTypedWords" and isinstance(value, bool)
+    assert len(server.connections) == 1
+    assert failures == []
+
+
+def test_reconnects_after_the_server_hangs_up(connection, failures, server):
+    exchange(connection, server.address)
+    server.hang_up()
+    # The worker waits on the socket between bundles, so it sees the hang up
+    readable, _, _ = select.select([connection.session.sock], [], [], 5)
+    assert readable
+    connection.read_responses()
+    assert connection.session is None
+
+    exchange(connection, server.address)
+    assert len(server.connections) == 2
+    # Nothing was waiting on the old connection, so nothing failed
+    assert failures == []
+
+
+def test_resends_when_a_reused_socket_cant_be_written(connection, failures, server):
+    exchange(connection, server.address)
+    # Closed without us noticing, so the write itself fails
+    connection.session.sock.shutdown(socket.SHUT_WR)
+    exchange(connection, server.address)
+    assert len(server.connections) == 2
+    assert failures == []
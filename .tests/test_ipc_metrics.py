@@ -0,0 +1,114 @@
+"""
+Which bucket each latency lands in, what the summaries make of them, and the
+page the client and server metrics are rendered into
+"""
+
+import pytest
+from loaders import core_module
+
+
+def ipc_metrics():
+    return core_module("screenreader_ipc.ipc_metrics")
+
+
+def bucket_of(seconds: float) -> int:
+    histogram = ipc_metrics().LatencyHistogram()
+    histogram.record(seconds)
+    return histogram.counts.index(1)
+
+
+def test_a_bound_belongs_to_its_own_bucket():
+    bounds = ipc_metrics().BUCKET_BOUNDS
+    for index, bound in enumerate(bounds):
+        assert bucket_of(bound) == index
+        assert bucket_of(bound * 1.001) == index + 1
+    assert bucket_of(0.0) == 0
+    # Anything slower than the last bound goes in the extra bucket
+    assert bucket_of(5.0) == len(bounds)
+
+
+def test_percentiles_are_bucket_bounds_capped_at_the_slowest():
+    histogram = ipc_metrics().LatencyHistogram()
+    for seconds in (0.0003, 0.0004, 0.002, 0.02):
+        histogram.record(seconds)
+    assert histogram.percentile(0.5) == 500e-6
+    assert histogram.percentile(0.99) == 0.02
+    assert histogram.summary() == {
+        "count": 4,
+        "mean_ms": 5.675,
+        "p50_ms": 0.5,
+        "p99_ms": 20.0,
+        "max_ms": 20.0,
+    }
+
+
+def test_overflow_percentile_is_the_slowest():
+    histogram = ipc_metrics().LatencyHistogram()
+    histogram.record(3.0)
+    assert histogram.percentile(0.5) == 3.0
+
+
+def test_empty_summary():
+    assert ipc_metrics().LatencyHistogram().summary() == {"count": 0}
+
+
+def test_snapshot_labels_and_server_errors():
+    schema = core_module("screenreader_ipc.ipc_schema")
+    metrics = ipc_metrics().IPCMetrics(schema.ServerStatusResult.SUCCESS)
+    metrics.record(
+        ["getSpeakTypedWords", "bad"],
+        "success",
+        [
+            schema.ServerStatusResult.SUCCESS,
+            schema.ServerStatusResult.INVALID_COMMAND_ERROR,
+        ],
+        0.001,
+    )
+    metrics.record(["getSpeakTypedWords"], "timedOut", None, 0.2)
+    snapshot = metrics.snapshot()
+    assert set(snapshot["by_outcome"]) == {"success", "timedOut"}
+    assert snapshot["by_command"]["getSpeakTypedWords"]["count"] == 2
+    assert snapshot["by_command"]["bad"]["count"] == 1
+    assert snapshot["server_errors"] == {
+        f"bad {schema.ServerStatusResult.INVALID_COMMAND_ERROR.value}": 1
+    }
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    """Every page render_metrics builds, without opening a browser"""
+    client = core_module("screenreader_ipc.ipc_client")
+    rendered = []
+
+    class Builder(client.Builder):
+        def render(self):
+            rendered.append("\n".join(self.elements))
+
+    monkeypatch.setattr(client, "Builder", Builder)
+    return client, rendered
+
+
+def test_render_metrics_with_both_ends(pages):
+    client, rendered = pages
+    metrics = ipc_metrics().IPCMetrics()
+    metrics.record(["getSpeakTypedWords"], "success", ["invalidCommand"], 0.0004)
+    server = {"commands": {"getSpeakTypedWords": {"count": 0}}, "requests": {}}
+    client.render_metrics(metrics.snapshot(), server, ["getSpeakTypedWords: 2"])
+
+    (page,) = rendered
+    assert "<h2>Client latency by outcome</h2>" in page
+    assert "<td>success</td>\n<td>1</td>\n<td>0.4</td>\n<td>0.4</td>" in page
+    assert "<li>getSpeakTypedWords: 2</li>" in page
+    assert "<li>getSpeakTypedWords invalidCommand: 1</li>" in page
+    # A command the server never timed still gets a row, with blank times
+    assert "<td>getSpeakTypedWords</td>\n<td>0</td>\n<td></td>" in page
+    assert "<h2>Server time by request</h2>\n<p>Nothing recorded yet</p>" in page
+
+
+def test_render_metrics_without_the_server(pages):
+    client, rendered = pages
+    client.render_metrics(ipc_metrics().IPCMetrics().snapshot(), None, [])
+    (page,) = rendered
+    assert "<h2>Errors reported by the server</h2>\n<p>None</p>" in page
+    assert "did not report any metrics" in page
+    assert "Server time" not in page
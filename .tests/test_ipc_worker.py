@@ -0,0 +1,51 @@
+"""
+The IPC worker thread: submitting never waits for the work, it runs in
+submission order, and waiting from the worker thread itself doesn't deadlock
+"""
+
+import threading
+
+import pytest
+from loaders import core_module
+
+
+@pytest.fixture
+def worker():
+    ipc_client = core_module("screenreader_ipc.ipc_client")
+    worker = ipc_client.IPCWorker(ipc_client.IPCConnection())
+    yield worker
+    worker.stop()
+
+
+def test_submitting_doesnt_wait(worker):
+    release = threading.Event()
+    slow = worker.submit(release.wait, 5)
+    ran = []
+    later = [worker.submit(ran.append, i) for i in range(3)]
+    assert not slow.done()
+    release.set()
+    for future in later:
+        future.result(5)
+    assert ran == [0, 1, 2]
+    assert slow.result(0) is True
+
+
+def test_work_runs_on_the_worker_thread(worker):
+    thread = worker.submit(threading.current_thread).result(5)
+    assert thread is worker.thread
+    assert thread is not threading.current_thread()
+
+
+def test_waiting_on_the_worker_thread(worker):
+    def nested():
+        # Queued behind this one, it would deadlock without running inline
+        inner = worker.submit(lambda: "inner")
+        return worker.wait(inner)
+
+    assert worker.submit(nested).result(5) == "inner"
+
+
+def test_errors_reach_the_future(worker):
+    with pytest.raises(ZeroDivisionError):
+        worker.submit(lambda: 1 / 0).result(5)
+    assert worker.submit(lambda: "still running").result(5) == "still running"
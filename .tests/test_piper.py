@@ -0,0 +1,194 @@
+"""
+The piper worker that keeps its model loaded, run with the fake piper from
+.benchmarks/stubs, the client that supervises it with a file standing in for
+aplay, and the cache of what it synthesized
+"""
+
+import json
+import os
+import struct
+import subprocess
+import sys
+import threading
+
+import pytest
+from common import STUBS_DIR
+from loaders import core_module
+
+TEXT = "Talon command mode. Dictation mode!"
+
+
+def piper_client():
+    return core_module("piper_tts.piper_client")
+
+
+def pcm_cache():
+    return core_module("piper_tts.pcm_cache")
+
+
+@pytest.fixture(autouse=True)
+def fake_piper(monkeypatch):
+    monkeypatch.setenv(
+        "PYTHONPATH",
+        os.pathsep.join(filter(None, [STUBS_DIR, os.environ.get("PYTHONPATH")])),
+    )
+    monkeypatch.setenv("FAKE_PIPER_LOAD_MS", "0")
+    monkeypatch.setenv("FAKE_PIPER_MS_PER_CHAR", "0")
+
+
+@pytest.fixture
+def sink_path(tmp_path):
+    return tmp_path / "sink.raw"
+
+
+def start_worker(sink_path, command=None, cache=None):
+    client = piper_client()
+    sink = client.AudioSink(lambda rate: ["sh", "-c", f"cat >> '{sink_path}'"], 16000)
+    worker = client.PiperWorker(
+        command or [sys.executable, client.WORKER_PATH, "--model", "fake.onnx"],
+        sink,
+        voice="fake.onnx",
+        cache=cache,
+    )
+    return sink, worker
+
+
+def spoken(utterance):
+    assert utterance.played.wait(10), f"Utterance {utterance.id} wasn't spoken"
+
+
+def read_frame(out) -> tuple[int, bytes]:
+    id, length = struct.unpack(">II", out.read(8))
+    return id, out.read(length)
+
+
+def test_worker_frames_each_sentence():
+    client = piper_client()
+    worker = subprocess.Popen(
+        [sys.executable, client.WORKER_PATH, "--model", "fake.onnx"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    try:
+        assert json.loads(worker.stdout.readline()) == {"sample_rate": 16000}
+        worker.stdin.write(json.dumps({"id": 1, "text": TEXT}).encode() + b"\n")
+        worker.stdin.flush()
+        frames = [read_frame(worker.stdout) for _ in range(3)]
+        assert [id for id, _ in frames] == [1, 1, 1]
+        # One frame of audio per sentence, then an empty one to end it
+        assert all(audio and len(audio) % 2 == 0 for _, audio in frames[:2])
+        assert frames[2][1] == b""
+
+        # Cancelled before it was read, so it only gets the empty frame
+        worker.stdin.write(b'{"cancel": 2}\n{"id": 2, "text": "echo enabled"}\n')
+        worker.stdin.flush()
+        assert read_frame(worker.stdout) == (2, b"")
+    finally:
+        worker.stdin.close()
+        assert worker.wait(5) == 0
+
+
+def test_plays_in_order_through_the_sink(sink_path):
+    _, worker = start_worker(sink_path)
+    try:
+        first = worker.speak(TEXT)
+        second = worker.speak("echo enabled")
+        spoken(first)
+        spoken(second)
+    finally:
+        worker.stop()
+    assert worker.starts == 1
+    assert sink_path.stat().st_size > 0
+
+
+def test_starts_again_after_exiting(sink_path):
+    _, worker = start_worker(sink_path)
+    try:
+        spoken(worker.speak("command mode"))
+        worker.process.kill()
+        worker.process.wait()
+        spoken(worker.speak("dictation mode"))
+        assert worker.starts == 2
+    finally:
+        worker.stop()
+
+
+def test_gives_up_on_a_worker_that_never_loads(sink_path):
+    client = piper_client()
+    # Exits before saying its sample rate, like piper that can't load a model
+    _, worker = start_worker(sink_path, [sys.executable, "-c", "pass"])
+    try:
+        for _ in range(client.PIPER_MAX_FAILURES):
+            spoken(worker.speak("command mode"))
+        with pytest.raises(client.PiperError):
+            worker.speak("command mode")
+    finally:
+        worker.stop()
+
+
+def test_stop_kills_piper_and_the_sink(sink_path):
+    sink, worker = start_worker(sink_path)
+    spoken(worker.speak("command mode"))
+    process, player = worker.process, sink.process
+    assert player is not None
+
+    worker.stop()
+    assert process.poll() is not None
+    assert player.poll() is not None
+    assert worker.process is None and sink.process is None
+    worker.player.join(5)
+    assert not worker.player.is_alive()
+    with pytest.raises(piper_client().PiperError):
+        worker.speak("command mode")
+
+
+def test_cached_audio_is_played_without_piper(sink_path):
+    cache = pcm_cache().PCMCache(1024 * 1024)
+    _, worker = start_worker(sink_path, cache=cache)
+    try:
+        worker.prerender(["command mode"], 1.0, threading.Event())
+        starts = worker.starts
+        spoken(worker.speak("command mode"))
+        assert cache.memory_hits == 1
+        assert worker.starts == starts
+    finally:
+        worker.stop()
+
+
+def test_memory_is_least_recently_used_first():
+    cache = pcm_cache().PCMCache(30)
+    cache.put("a", bytes(10))
+    cache.put("b", bytes(10))
+    cache.put("c", bytes(10))
+    assert cache.get("a") is not None
+    cache.put("d", bytes(10))
+    # b was used least recently
+    assert list(cache.memory) == ["c", "a", "d"]
+    assert cache.memory_size == 30
+    # Too big to keep at all
+    cache.put("e", bytes(31))
+    assert "e" not in cache.memory
+
+
+def test_disk_is_capped_and_lasts(tmp_path):
+    directory = str(tmp_path / "cache")
+    cache = pcm_cache().PCMCache(1024, directory, 25)
+    cache.put("a", bytes(10))
+    cache.put("b", bytes(10))
+    cache.put("c", bytes(10))
+    assert sorted(os.listdir(directory)) == ["b.pcm", "c.pcm"]
+    assert cache.disk_size == 20
+
+    # Like a restart, with nothing in memory
+    cache = pcm_cache().PCMCache(1024, directory, 25)
+    assert cache.get("a") is None
+    assert cache.get("b") == bytes(10)
+    assert (cache.disk_hits, cache.misses) == (1, 1)
+
+
+def test_long_text_isnt_cached():
+    module = pcm_cache()
+    assert module.PCMCache.key("x" * module.CACHE_MAX_CHARACTERS, "v", 1.0)
+    assert (
+        module.PCMCache.key("x" * (module.CACHE_MAX_CHARACTERS + 1), "v", 1.0) is None
+    )
@@ -0,0 +1,123 @@
+"""
+The presence monitor against a fake screenreader, which is a copy of sleep
+under another name, found by scanning /proc like the probes do
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+import pytest
+from loaders import core_module
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "pidfd_open") or not os.path.isdir("/proc"),
+    reason="Needs /proc and pidfds",
+)
+
+NAME = "fakereader"
+
+
+def monitor_module():
+    return core_module("screenreader_presence.presence_monitor")
+
+
+class Changes:
+    """Every set of running screenreaders the monitor reported"""
+
+    def __init__(self):
+        self.seen = []
+        self.condition = threading.Condition()
+
+    def __call__(self, present: frozenset[str]):
+        with self.condition:
+            self.seen.append(present)
+            self.condition.notify_all()
+
+    def wait_for(self, present: frozenset[str], timeout: float = 5):
+        with self.condition:
+            assert self.condition.wait_for(
+                lambda: self.seen and self.seen[-1] == present, timeout
+            ), f"Still {self.seen[-1:] or 'nothing'}, expected {set(present)}"
+
+
+@pytest.fixture
+def fake_reader(tmp_path):
+    sleep = shutil.which("sleep")
+    if sleep is None:
+        pytest.skip("Needs sleep")
+    path = tmp_path / NAME
+    shutil.copy(sleep, path)
+    processes = []
+
+    def start() -> subprocess.Popen:
+        process = subprocess.Popen([str(path), "60"])
+        processes.append(process)
+        # Until it execs it still has our name, and the process events
+        # listener only hears about it once it has
+        deadline = time.monotonic() + 5
+        while monitor_module().find_process(NAME) != process.pid:
+            assert time.monotonic() < deadline, "The fake screenreader didn't start"
+            time.sleep(0.01)
+        return process
+
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
+
+
+@pytest.fixture
+def monitor():
+    changes = Changes()
+    monitor = monitor_module().PresenceMonitor(changes)
+    # Long enough that only a signal could explain noticing anything
+    monitor.add(NAME, lambda: monitor_module().find_process(NAME), 60)
+    monitor.start()
+    yield monitor, changes
+    monitor.stop()
+    monitor.thread.join(5)
+
+
+def test_notices_start_and_exit(monitor, fake_reader):
+    monitor, changes = monitor
+    process = fake_reader()
+    # Like the process events listener does when something starts
+    monitor.notify(NAME)
+    changes.wait_for(frozenset([NAME]))
+    assert monitor.readers[NAME].pid == process.pid
+
+    # Not reaped, so it can still be found in /proc, and only its pidfd
+    # says it exited
+    process.kill()
+    changes.wait_for(frozenset())
+
+
+def test_stop_closes_pidfds(monitor, fake_reader):
+    monitor, changes = monitor
+    fake_reader()
+    monitor.notify(NAME)
+    changes.wait_for(frozenset([NAME]))
+    pidfd = monitor.readers[NAME].pidfd
+    assert pidfd is not None
+
+    monitor.stop()
+    monitor.thread.join(5)
+    assert not monitor.thread.is_alive()
+    assert monitor.readers[NAME].pidfd is None
+    with pytest.raises(OSError):
+        os.fstat(pidfd)
+
+
+def test_backoff_is_capped(tmp_path):
+    presence_monitor = monitor_module()
+    clock = [0.0]
+    monitor = presence_monitor.PresenceMonitor(lambda present: None, lambda: clock[0])
+    monitor.add("jaws", lambda: False, presence_monitor.POLL_UNSIGNALLED_MAX_INTERVAL)
+    reader = monitor.readers["jaws"]
+    for _ in range(10):
+        monitor._probe(reader)
+    assert reader.interval == presence_monitor.POLL_UNSIGNALLED_MAX_INTERVAL
+    monitor.stop()
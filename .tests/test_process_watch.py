@@ -0,0 +1,142 @@
+"""
+Finding orca with the process index against a fake /proc, and the process
+events listener it can be woken by, which polling falls back from
+"""
+
+import os
+import subprocess
+import threading
+
+import pytest
+from loaders import core_module
+
+
+def process_watch():
+    return core_module("screenreader_presence.process_watch")
+
+
+class FakeProc:
+    """A directory laid out like the parts of /proc the index reads"""
+
+    def __init__(self, path):
+        self.path = path
+        self.last_pid = 0
+
+    def spawn(self, pid: int, comm: str):
+        (self.path / str(pid)).mkdir()
+        self.rename(pid, comm)
+        self.last_pid = max(self.last_pid, pid)
+        (self.path / "loadavg").write_text(f"0.00 0.00 0.00 1/1 {self.last_pid}\n")
+
+    def rename(self, pid: int, comm: str):
+        (self.path / str(pid) / "comm").write_text(f"{comm}\n")
+
+    def exit(self, pid: int):
+        (self.path / str(pid) / "comm").unlink()
+        (self.path / str(pid)).rmdir()
+
+
+@pytest.fixture
+def proc(tmp_path):
+    proc = FakeProc(tmp_path)
+    proc.spawn(1, "systemd")
+    proc.spawn(2, "bash")
+    return proc
+
+
+def reads(index) -> int:
+    """How many names the next find reads"""
+    before = index.reads
+    index.find()
+    return index.reads - before
+
+
+def test_nothing_started_is_a_single_read(proc):
+    index = process_watch().ProcessIndex("orca", str(proc.path))
+    assert index.find() is None
+    # Read once more before they are trusted, then never again
+    assert reads(index) == 2
+    assert reads(index) == 0
+    assert index.known == {1, 2}
+
+
+def test_child_is_checked_again_after_exec(proc):
+    index = process_watch().ProcessIndex("orca", str(proc.path))
+    index.find()
+    # Forked from bash, so it has bash's name until it calls exec
+    proc.spawn(3, "bash")
+    assert index.find() is None
+    proc.rename(3, "orca")
+    assert index.find() == 3
+    # Only the found pid is checked while it is still running
+    assert reads(index) == 1
+
+
+def test_forgets_exited_pids(proc):
+    index = process_watch().ProcessIndex("orca", str(proc.path))
+    proc.spawn(3, "orca")
+    assert index.find() == 3
+
+    proc.exit(3)
+    proc.exit(2)
+    proc.spawn(4, "bash")
+    assert index.find() is None
+    index.find()
+    assert index.known == {1, 4}
+
+
+def test_offered_pid_is_checked_even_if_known(proc):
+    index = process_watch().ProcessIndex("orca", str(proc.path))
+    index.find()
+    index.find()
+    # Exec without a new process, so the latest pid doesn't change
+    proc.rename(2, "orca")
+    assert index.find() is None
+    index.offer(2)
+    assert index.find() == 2
+
+
+def test_rescans_without_loadavg(proc):
+    index = process_watch().ProcessIndex("orca", str(proc.path))
+    (proc.path / "loadavg").unlink()
+    index.find()
+    index.find()
+    proc.spawn(3, "orca")
+    (proc.path / "loadavg").unlink()
+    assert index.find() == 3
+
+
+def test_no_listener_without_the_capability(monkeypatch):
+    module = process_watch()
+    monkeypatch.setattr(module, "can_listen_for_process_events", lambda: False)
+    listener = module.ExecListener(lambda pid: None)
+    # So orca is polled instead
+    assert listener.start() is False
+    assert listener.thread is None
+    assert listener.sock is None
+
+
+@pytest.mark.skipif(
+    not os.path.isdir("/proc") or not process_watch().can_listen_for_process_events(),
+    reason="Needs CAP_NET_ADMIN",
+)
+def test_listener_hears_exec_and_stops():
+    heard = []
+    execed = threading.Event()
+
+    def on_exec(pid: int):
+        heard.append(pid)
+        execed.set()
+
+    listener = process_watch().ExecListener(on_exec)
+    if not listener.start():
+        pytest.skip("No process events connector")
+    try:
+        process = subprocess.run(["true"])
+        assert process.returncode == 0
+        assert execed.wait(5)
+    finally:
+        listener.stop()
+    listener.thread.join(5)
+    assert not listener.thread.is_alive()
+    assert listener.sock is None
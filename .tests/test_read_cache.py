@@ -0,0 +1,78 @@
+"""
+When the client answers NVDA reads from its cache, and everything that makes
+it send them again: a newer generation, a push and entries growing old.
+The clock is a fake, so nothing waits
+"""
+
+import pytest
+from loaders import core_module
+
+READ_ONLY = frozenset(["getSpeakTypedWords", "getConfig"])
+READS = ["getSpeakTypedWords", ["getConfig", "speech.symbolLevel"]]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(clock):
+    cache = core_module("screenreader_ipc.ipc_client").ReadCache(2.0, clock)
+    cache.store(READS, [True, 100], 5)
+    return cache
+
+
+def served(cache) -> int:
+    return len(cache.lookup_prefix(READS, READ_ONLY))
+
+
+def test_reads_are_served_at_the_same_generation(cache):
+    assert cache.lookup_prefix(READS, READ_ONLY) == [
+        ("getSpeakTypedWords", True),
+        (["getConfig", "speech.symbolLevel"], 100),
+    ]
+    cache.observe(5)
+    assert served(cache) == 2
+    assert (cache.hits, cache.misses) == (4, 0)
+
+
+def test_a_change_first_sends_everything(cache):
+    assert cache.lookup_prefix(["enableSpeakTypedWords"] + READS, READ_ONLY) == []
+    assert cache.misses == 2
+
+
+def test_a_newer_generation_clears_it(cache):
+    cache.observe(6)
+    assert served(cache) == 0
+    # A response read before the change is too old to keep
+    cache.store(READS, [False, 0], 5)
+    assert served(cache) == 0
+
+
+def test_a_push_clears_it_at_the_same_generation(cache):
+    cache.on_push(5)
+    assert served(cache) == 0
+    # Servers too old to report a generation push without one
+    cache.store(READS, [True, 100], 5)
+    cache.on_push(None)
+    assert served(cache) == 0
+
+
+def test_entries_expire(cache, clock):
+    clock.now = 1.9
+    assert served(cache) == 2
+    clock.now = 2.0
+    assert served(cache) == 0
+    # Reading again starts the wait over
+    cache.store(READS, [True, 100], 5)
+    clock.now = 3.9
+    assert served(cache) == 2
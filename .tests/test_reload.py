@@ -0,0 +1,63 @@
+"""
+What a Talon reload leaves running: registering again stops the previous
+instance, and a stopped IPC worker's thread exits
+"""
+
+import functools
+import importlib
+import os
+from concurrent.futures import CancelledError
+
+import pytest
+from common import load_package, use_talon_stub
+
+
+@functools.cache
+def modules():
+    use_talon_stub()
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package("sightless.lib", "lib")
+    load_package(
+        "sightless.core.screenreader_ipc", os.path.join("core", "screenreader_ipc")
+    )
+    return (
+        importlib.import_module("sightless.lib.running"),
+        importlib.import_module("sightless.core.screenreader_ipc.ipc_client"),
+    )
+
+
+class Thread:
+    def __init__(self):
+        self.stops = 0
+
+    def stop(self):
+        self.stops += 1
+
+
+def test_replacing_stops_the_previous():
+    running = modules()[0]
+    first, second = Thread(), Thread()
+    running.replace_running("test.thread", first)
+    running.replace_running("test.thread", second)
+    assert (first.stops, second.stops) == (1, 0)
+
+
+def test_registering_again_does_not_stop_itself():
+    running = modules()[0]
+    thread = Thread()
+    running.replace_running("test.same", thread)
+    running.replace_running("test.same", thread)
+    assert thread.stops == 0
+
+
+def test_stopped_worker_exits():
+    ipc_client = modules()[1]
+    worker = ipc_client.IPCWorker(ipc_client.IPCConnection())
+    assert worker.submit(lambda: "sent").result(1) == "sent"
+
+    worker.stop()
+    worker.thread.join(1)
+    assert not worker.thread.is_alive()
+    with pytest.raises(CancelledError):
+        worker.submit(lambda: "sent").result(1)
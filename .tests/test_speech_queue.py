@@ -0,0 +1,277 @@
+"""
+The speech queue's ordering, preemption and coalescing, driven one step at a
+time against the fake engine, with a fake clock for anything delayed
+"""
+
+import functools
+import importlib
+import os
+
+import pytest
+from common import load_package
+
+
+@functools.cache
+def modules():
+    load_package("sightless", "")
+    load_package("sightless.core", "core")
+    load_package("sightless.core.speech_queue", os.path.join("core", "speech_queue"))
+    load_package("sightless.core.tts_engine", os.path.join("core", "tts_engine"))
+    return (
+        importlib.import_module("sightless.core.speech_queue.speech_queue"),
+        importlib.import_module("sightless.core.tts_engine.tts_engine"),
+    )
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def engine():
+    return modules()[1].FakeEngine()
+
+
+@pytest.fixture
+def queue(engine, clock):
+    return modules()[0].SpeechQueue(engine.speak, engine.silence, clock)
+
+
+def said(engine) -> list[str]:
+    """What the engine was asked to say, with <cancel> where it was silenced"""
+    return [
+        "<cancel>" if action == "silence" else value
+        for action, value in engine.log
+        if action in ("speak", "silence")
+    ]
+
+
+def run_until_idle(queue, engine):
+    """Step the queue, finishing each utterance, until nothing is left"""
+    while queue.step():
+        engine.finish()
+
+
+def test_most_important_first(queue, engine):
+    queue.submit("title", "context", interrupt=False)
+    queue.submit("hello", "echo", interrupt=False)
+    queue.submit("error", "error", interrupt=False)
+    queue.submit("command mode", "mode", interrupt=False)
+    run_until_idle(queue, engine)
+    assert said(engine) == ["error", "command mode", "hello", "title"]
+
+
+def test_same_priority_in_order(queue, engine):
+    for text in ["one", "two", "three"]:
+        queue.submit(text, "echo", interrupt=False)
+    run_until_idle(queue, engine)
+    assert said(engine) == ["one", "two", "three"]
+
+
+def test_waits_for_the_engine_to_finish(queue, engine):
+    queue.submit("one", "echo", interrupt=False)
+    queue.submit("two", "echo", interrupt=False)
+    assert queue.step()
+    assert queue.step()
+    assert said(engine) == ["one"]
+    engine.finish()
+    queue.step()
+    assert said(engine) == ["one", "two"]
+
+
+def test_interrupt_drops_as_important_or_less(queue, engine):
+    queue.submit("first phrase", "echo")
+    queue.step()
+    queue.submit("title", "context", interrupt=False)
+    queue.submit("command mode", "mode", interrupt=False)
+    queue.submit("second phrase", "echo")
+    run_until_idle(queue, engine)
+    # The first interrupt cancels too, since the engine may be speaking for
+    # someone else, i.e. NVDA reading the screen
+    assert said(engine) == [
+        "<cancel>",
+        "first phrase",
+        "<cancel>",
+        "command mode",
+        "second phrase",
+    ]
+
+
+def test_interrupt_does_not_cut_off_more_important(queue, engine):
+    queue.submit("Orca is not installed", "error")
+    queue.step()
+    queue.submit("hello", "echo")
+    queue.step()
+    assert said(engine) == ["<cancel>", "Orca is not installed"]
+    engine.finish()
+    run_until_idle(queue, engine)
+    assert said(engine) == ["<cancel>", "Orca is not installed", "hello"]
+
+
+def test_more_important_interrupt_cuts_off(queue, engine):
+    queue.submit("hello", "echo", interrupt=False)
+    queue.step()
+    queue.submit("error", "error")
+    run_until_idle(queue, engine)
+    assert said(engine) == ["hello", "<cancel>", "error"]
+
+
+def test_cancel_drops_everything(queue, engine, clock):
+    queue.submit("error", "error", interrupt=False)
+    queue.step()
+    queue.submit("title", "context", interrupt=False)
+    queue.submit("Firefox", "context", key="context", delay=0.3)
+    queue.cancel()
+    clock.now = 1
+    run_until_idle(queue, engine)
+    assert said(engine) == ["error", "<cancel>"]
+
+
+def test_engine_that_queues_itself(clock):
+    speech_queue, tts_engine = modules()
+    engine = tts_engine.FakeEngine(reports_speaking=False)
+    queue = speech_queue.SpeechQueue(engine.speak, engine.silence, clock)
+    queue.submit("error", "error", interrupt=False)
+    queue.step()
+    queue.submit("hello", "echo")
+    queue.step()
+    queue.submit("title", "context", interrupt=False)
+    queue.step()
+    assert said(engine) == ["error", "hello", "title"]
+
+
+def test_newer_with_same_key_replaces_older(queue, engine):
+    queue.submit("hello", "echo", interrupt=False)
+    queue.step()
+    queue.submit("Loading", "context", interrupt=False, key="context")
+    queue.submit("GitHub", "context", interrupt=False, key="context")
+    queue.submit("other", "context", interrupt=False)
+    run_until_idle(queue, engine)
+    assert said(engine) == ["hello", "GitHub", "other"]
+
+
+def test_delay_waits_for_the_last_change(queue, engine, clock):
+    queue.submit("Firefox", "context", key="context", delay=0.3)
+    clock.now = 0.2
+    queue.submit("Firefox Loading", "context", key="context", delay=0.3)
+    queue.step()
+    assert said(engine) == []
+    clock.now = 0.4
+    queue.step()
+    assert said(engine) == []
+    clock.now = 0.5
+    queue.submit("hello", "echo", interrupt=False)
+    run_until_idle(queue, engine)
+    # Once due it interrupts like it would have straight away, so it drops
+    # nothing more important
+    assert said(engine) == ["<cancel>", "hello", "Firefox Loading"]
+
+
+def test_delayed_interrupt_cuts_off_when_due(queue, engine, clock):
+    queue.submit("Firefox", "context", interrupt=False)
+    queue.step()
+    queue.submit("Terminal", "context", key="context", delay=0.3)
+    queue.step()
+    assert said(engine) == ["Firefox"]
+    clock.now = 0.3
+    run_until_idle(queue, engine)
+    assert said(engine) == ["Firefox", "<cancel>", "Terminal"]
+
+
+def test_delayed_interrupt_keeps_more_important(queue, engine, clock):
+    queue.submit("Terminal", "context", key="context", delay=0.3)
+    queue.submit("hello", "echo", interrupt=False)
+    queue.step()
+    clock.now = 0.3
+    queue.step()
+    assert said(engine) == ["hello"]
+    engine.finish()
+    run_until_idle(queue, engine)
+    assert said(engine) == ["hello", "Terminal"]
+
+
+def test_immediate_replaces_delayed(queue, engine, clock):
+    queue.submit("Firefox", "context", key="context", delay=0.3)
+    queue.submit("Terminal", "context", key="context")
+    clock.now = 1
+    run_until_idle(queue, engine)
+    assert said(engine) == ["<cancel>", "Terminal"]
+
+
+def test_calls_run_before_speaking(queue, engine):
+    queue.submit("hello", "echo", interrupt=False)
+    queue.run(lambda: engine.set_rate(5))
+    queue.step()
+    assert engine.log == [("rate", 5), ("speak", "hello")]
+
+
+def test_stop_ends_the_thread(queue):
+    queue.start()
+    queue.submit("hello", "echo", interrupt=False)
+    queue.stop()
+    queue.thread.join(1)
+    assert not queue.thread.is_alive()
+
+
+def test_interrupt_leaves_the_engine_to_interrupt(engine, clock):
+    # Like NVDA, which would otherwise cut off its own speech
+    interrupts = []
+    queue = modules()[0].SpeechQueue(
+        engine.speak, engine.silence, clock, interrupt=lambda: interrupts.append(1)
+    )
+    queue.submit("hello", "echo", interrupt=False)
+    queue.step()
+    queue.submit("command mode", "mode")
+    run_until_idle(queue, engine)
+    assert interrupts == [1]
+    assert said(engine) == ["hello", "command mode"]
+
+    queue.submit("title", "context", interrupt=False)
+    queue.cancel()
+    queue.step()
+    assert interrupts == [1]
+    assert said(engine) == ["hello", "command mode", "<cancel>"]
+
+
+def test_burst_of_context_changes_is_said_once(queue, engine, clock):
+    # Switching apps changes the title a few times while the page loads,
+    # and each change says everything that is waiting so far
+    for now, text in [
+        (0.0, "Firefox"),
+        (0.05, "Firefox New Tab"),
+        (0.1, "Firefox Loading"),
+        (0.2, "Firefox GitHub"),
+    ]:
+        clock.now = now
+        queue.submit(text, "context", key="context", delay=0.3)
+        queue.step()
+    assert len(queue.delayed) == 1
+    clock.now = 0.5
+    run_until_idle(queue, engine)
+    assert said(engine) == ["<cancel>", "Firefox GitHub"]
+
+
+def test_delayed_replaces_queued_with_the_same_key(queue, engine, clock):
+    queue.submit("hello", "echo", interrupt=False)
+    queue.step()
+    queue.submit("Terminal", "context", key="context", delay=0.3)
+    # Due while hello is still being said, so it waits in the queue
+    clock.now = 0.3
+    queue.step()
+    assert [utterance.text for utterance in queue.pending()] == ["Terminal"]
+    queue.submit("Firefox", "context", key="context", delay=0.3)
+    assert queue.pending() == []
+
+    engine.finish()
+    clock.now = 0.6
+    run_until_idle(queue, engine)
+    assert said(engine) == ["hello", "<cancel>", "Firefox"]
@@ -0,0 +1,134 @@
+"""
+The speech-dispatcher client against a fake speech-dispatcher on a unix
+socket, which can answer cancels late or with an error, or stop answering
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+from loaders import core_module
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="Needs unix sockets"
+)
+
+
+def ssip_client():
+    return core_module("speech_dispatcher.ssip_client")
+
+
+class FakeSpeechDispatcher:
+    """Answers SSIP commands in order, like speech-dispatcher"""
+
+    def __init__(self, path: str):
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen()
+        self.messages: list[str] = []
+        self.connections: list[socket.socket] = []
+        self.cancel_reply = "210 OK CANCELED"
+        # Seconds to wait before answering a cancel
+        self.cancel_delay = 0.0
+        # Set to stop answering once a message has been queued
+        self.silent = threading.Event()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def drop(self):
+        """Close the current connection, like speech-dispatcher exiting when idle"""
+        self.connections[-1].shutdown(socket.SHUT_RDWR)
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections.append(connection)
+            threading.Thread(
+                target=self._serve, args=(connection,), daemon=True
+            ).start()
+
+    def _serve(self, connection: socket.socket):
+        lines = connection.makefile("rb")
+        try:
+            for raw in lines:
+                words = raw.decode().split()
+                if words[0] == "SPEAK":
+                    connection.sendall(b"230 OK RECEIVING DATA\r\n")
+                    body = []
+                    for data in lines:
+                        line = data.decode().rstrip("\r\n")
+                        if line == ".":
+                            break
+                        body.append(line[1:] if line.startswith("..") else line)
+                    self.messages.append("\n".join(body))
+                    if self.silent.is_set():
+                        continue
+                    reply = f"225-{len(self.messages)}\r\n225 OK MESSAGE QUEUED"
+                elif words[0] == "CANCEL":
+                    time.sleep(self.cancel_delay)
+                    reply = self.cancel_reply
+                elif words[0] == "SET":
+                    reply = "200 OK SET"
+                else:
+                    reply = "231 HAPPY HACKING"
+                connection.sendall(reply.encode() + b"\r\n")
+        except OSError:
+            pass
+
+    def close(self):
+        self.listener.close()
+        for connection in self.connections:
+            connection.close()
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = FakeSpeechDispatcher(str(tmp_path / "speechd.sock"))
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(server, tmp_path):
+    client = ssip_client().SSIPClient(f"unix_socket:{tmp_path / 'speechd.sock'}")
+    yield client
+    client.close()
+
+
+@pytest.mark.parametrize("cancel_reply", ["210 OK CANCELED", "300 ERR NO CLIENT"])
+def test_unread_cancel_replies_are_skipped(server, client, cancel_reply):
+    server.cancel_reply = cancel_reply
+    # Still on their way when the next speak writes its command
+    server.cancel_delay = 0.05
+    client.speak("first", 0, 0)
+    client.cancel()
+    client.cancel()
+    client.speak("second", 0, 0)
+    client.speak("third", 0, 0)
+    assert server.messages == ["first", "second", "third"]
+    assert client.unread_replies == 0
+    assert client.buffer == b""
+
+
+def test_reconnects_after_being_dropped(server, client):
+    client.speak("first", 0, 0)
+    client.cancel()
+    server.drop()
+    time.sleep(0.05)
+    client.speak("after reconnecting", 0, 0)
+    assert server.messages == ["first", "after reconnecting"]
+    assert client.connects == 2
+
+
+def test_no_reply_isnt_sent_again(server, client, monkeypatch):
+    module = ssip_client()
+    monkeypatch.setattr(module, "SSIP_TIMEOUT", 0.1)
+    client.speak("first", 0, 0)
+    server.silent.set()
+    with pytest.raises(module.SSIPNoReply):
+        client.speak("only once", 0, 0)
+    assert server.messages == ["first", "only once"]
+    assert client.connects == 1
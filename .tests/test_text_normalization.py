@@ -0,0 +1,68 @@
+"""
+What the normalizer makes of the same text at each punctuation level, and
+with links and numbers shortened. Spacing is compared loosely, since the
+engines don't say it
+"""
+
+import pytest
+from loaders import core_module
+
+TEXT = 'a@b (c) "d" e.f, it\'s ---- x_y'
+
+
+def normalize(text: str, *options) -> str:
+    normalizer = core_module("text_normalization.text_normalization").normalizer
+    return " ".join(normalizer(*options)(text).split())
+
+
+@pytest.mark.parametrize(
+    "level, expected",
+    [
+        ("off", 'a@b (c) "d" e.f, it\'s ---- x_y'),
+        ("none", "a b c d e.f, it's x y"),
+        ("some", "a at b c d e.f, it's x underscore y"),
+        (
+            "most",
+            "a at b left paren c right paren quote d quote e.f, it's dash x underscore y",
+        ),
+        (
+            "all",
+            "a at b left paren c right paren quote d quote e dot f comma "
+            "it apostrophe s dash x underscore y",
+        ),
+    ],
+)
+def test_punctuation_levels(level, expected):
+    assert normalize(TEXT, level) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("see https://www.example.com/path?q=1.", "see link example.com ."),
+        ("http://talon.wiki, then", "link talon.wiki , then"),
+        ("www.talon.wiki/unofficial/", "link talon.wiki"),
+        ("no link here.", "no link here."),
+    ],
+)
+def test_links(text, expected):
+    assert normalize(text, "off", True, False) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("id 1234567890123", "id 13 digit number"),
+        ("call 123456789012", "call 123456789012"),
+        ("sha 0123456789abcdef0123456789", "sha 0123456789abcdef0123456789"),
+        ("sha abc0123456789012345", "sha abc 16 digit number"),
+    ],
+)
+def test_numbers(text, expected):
+    assert normalize(text, "off", False, True) == expected
+
+
+def test_defaults_change_nothing():
+    text = "see https://www.example.com/path 1234567890123 ---- a@b (c)"
+    normalizer = core_module("text_normalization.text_normalization").normalizer
+    assert normalizer()(text) == text
@@ -0,0 +1,229 @@
+"""
+The tts engines against fakes of what they drive: a speech-dispatcher
+client, SAPI5's COM object and the say command. Also that only the
+properties that changed are sent, and that the speech queue's speaking and
+cancelling reach the engine
+"""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+from loaders import core_module
+
+
+def tts_engine():
+    return core_module("tts_engine.tts_engine")
+
+
+def test_only_changed_properties_are_written():
+    engine = tts_engine().FakeEngine()
+    engine.speak_with_settings("one", 5, 80)
+    engine.speak_with_settings("two", 5, 80)
+    engine.speak_with_settings("three", 6, 80)
+    # Out of range is the same as the limit, which was already sent
+    engine.set_volume(80)
+    engine.set_rate(11)
+    engine.set_rate(12)
+    assert engine.log == [
+        ("rate", 5),
+        ("volume", 80),
+        ("speak", "one"),
+        ("speak", "two"),
+        ("rate", 6),
+        ("speak", "three"),
+        ("rate", 10),
+    ]
+    assert engine.writes == 4
+
+
+def test_unsupported_properties_are_never_written():
+    engine = tts_engine().FakeEngine()
+    engine.has_volume = False
+    engine.speak_with_settings("hello", 0, 50)
+    assert engine.log == [("rate", 0), ("speak", "hello")]
+    assert engine.get_volume() is None
+
+
+def test_speech_queue_speaks_and_cancels_through_the_engine():
+    engine = tts_engine().FakeEngine()
+    speech_queue = core_module("speech_queue.speech_queue").SpeechQueue(
+        lambda text: engine.speak_with_settings(text, 3, 70), engine.silence
+    )
+    speech_queue.submit("hello", "echo", False)
+    speech_queue.step()
+    speech_queue.cancel()
+    speech_queue.step()
+    assert engine.log == [
+        ("rate", 3),
+        ("volume", 70),
+        ("speak", "hello"),
+        ("silence", None),
+    ]
+
+
+class FakeSSIPClient:
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.log = []
+
+    def speak(self, text: str, rate: int, volume: int):
+        self.log.append(("speak", text, rate, volume))
+        if self.error:
+            raise self.error
+
+    def cancel(self):
+        self.log.append(("cancel",))
+
+    def warm_up(self, rate: int, volume: int):
+        self.log.append(("warm_up", rate, volume))
+
+
+@pytest.fixture
+def popen(monkeypatch):
+    """Every process an engine starts, without starting any"""
+    started = []
+
+    class FakeProcess:
+        def __init__(self, args, **kwargs):
+            self.args = args
+            self.killed = False
+            started.append(self)
+
+        def poll(self):
+            return -9 if self.killed else None
+
+        def kill(self):
+            self.killed = True
+
+    monkeypatch.setattr("subprocess.Popen", FakeProcess)
+    return started
+
+
+def espeak_engine():
+    return core_module("tts_engine.espeak_engine")
+
+
+def test_espeak_converts_to_speech_dispatcher_units(popen):
+    client = FakeSSIPClient()
+    engine = espeak_engine().EspeakEngine(client)
+    assert engine.speak_with_settings("hello", 5, 80) is None
+    engine.warm_up([], threading.Event())
+    engine.silence()
+    assert client.log == [("speak", "hello", 50, 60), ("warm_up", 50, 60), ("cancel",)]
+    assert popen == []
+
+
+def test_espeak_falls_back_to_spd_say(popen):
+    ssip_client = core_module("speech_dispatcher.ssip_client")
+    engine = espeak_engine().EspeakEngine(
+        FakeSSIPClient(ssip_client.SSIPError("not running"))
+    )
+    engine.speak_with_settings("hello", 0, 50)
+    assert popen[0].args == ["spd-say", "hello", "--rate", "0", "--volume", "0"]
+    engine.silence()
+    assert popen[0].killed
+
+
+def test_espeak_doesnt_repeat_what_may_be_spoken(popen):
+    ssip_client = core_module("speech_dispatcher.ssip_client")
+    engine = espeak_engine().EspeakEngine(
+        FakeSSIPClient(ssip_client.SSIPNoReply("timed out"))
+    )
+    engine.speak_with_settings("hello", 0, 50)
+    assert popen == []
+
+
+class FakeSpVoice:
+    """Enough of SAPI.SpVoice to log every call into it"""
+
+    def __init__(self):
+        self.log = []
+        self.voices = [
+            SimpleNamespace(GetDescription=lambda name=name: name)
+            for name in ("David", "Zira")
+        ]
+        self.Voice = self.voices[0]
+        self.AudioOutput = "speakers"
+        self.Status = SimpleNamespace(RunningState=1)
+
+    def __setattr__(self, name, value):
+        if name in ("Rate", "Volume", "Voice"):
+            self.log.append((name, value))
+        super().__setattr__(name, value)
+
+    def GetVoices(self):
+        return self.voices
+
+    def Speak(self, text: str, flags: int):
+        self.log.append(("Speak", text, flags))
+
+
+@pytest.fixture
+def sapi5(monkeypatch):
+    module = core_module("tts_engine.sapi5_engine")
+    voice = FakeSpVoice()
+    monkeypatch.setattr(
+        module,
+        "win32com",
+        SimpleNamespace(client=SimpleNamespace(Dispatch=lambda name: voice)),
+        raising=False,
+    )
+    monkeypatch.setattr(
+        module, "pywintypes", SimpleNamespace(com_error=OSError), raising=False
+    )
+    voice.log.clear()
+    return module, module.SAPI5(), voice
+
+
+def test_sapi5_writes_properties_once(sapi5):
+    module, engine, voice = sapi5
+    is_speaking = engine.speak_with_settings("a < b", 5.4, 80)
+    engine.speak_with_settings("again", 5.4, 80)
+    engine.set_pitch(3)
+    engine.speak("higher")
+    flags = module.SVSFlagsAsync | module.SVSFIsXML
+    assert voice.log == [
+        ("Rate", 5),
+        ("Volume", 80),
+        ("Speak", '<pitch absmiddle="0">a &lt; b</pitch>', flags),
+        ("Speak", '<pitch absmiddle="0">again</pitch>', flags),
+        ("Speak", '<pitch absmiddle="3">higher</pitch>', flags),
+    ]
+    assert not is_speaking()
+    voice.Status.RunningState = module.SRSEIsSpeaking
+    assert is_speaking()
+
+
+def test_sapi5_silence_voices_and_warm_up(sapi5):
+    module, engine, voice = sapi5
+    engine.silence()
+    engine.warm_up(["command mode"], threading.Event())
+    assert voice.log == [
+        ("Speak", "", module.SVSFlagsAsync | module.SVSFPurgeBeforeSpeak),
+        ("Speak", "", module.SVSFlagsAsync),
+    ]
+    assert engine.list_voices() == ["David", "Zira"]
+    engine.set_voice("Zira")
+    assert engine.get_voice() == "Zira"
+
+
+def test_say_rate_is_words_per_minute(popen):
+    engine = core_module("tts_engine.say_engine").SayEngine()
+    still_speaking = engine.speak_with_settings("hello", 10, 50)
+    engine.speak_with_settings("slower", -10, 50)
+    assert [process.args for process in popen] == [
+        ["say", "-r", "350", "hello"],
+        ["say", "-r", "88", "slower"],
+    ]
+    assert still_speaking()
+    engine.silence()
+    assert popen[1].killed and not popen[0].killed
+
+
+def test_say_warm_up_says_nothing(popen):
+    engine = core_module("tts_engine.say_engine").SayEngine()
+    engine.warm_up(["command mode"], threading.Event())
+    engine.silence()
+    assert popen[0].args == ["say", "-r", "175", ""]
+    assert not popen[0].killed
@@ -1,3 +1,4 @@
+import time
 from typing import ClassVar, Optional
 
 from talon import actions, app, registry, scope, settings, speech_system, ui
@@ -11,6 +12,33 @@ class CallbackState:
     # the title actually hasn't changed, i.e. when a text file is saved
     last_title: ClassVar[Optional[str]] = None
 
+    # The app and title waiting to be echoed together, and when either last
+    # changed. Switching apps changes the title too, often more than once
+    pending_app: ClassVar[Optional[str]] = None
+    pending_title: ClassVar[Optional[str]] = None
+    context_changed_at: ClassVar[float] = 0.0
+
+
+# Everything announced with fixed text, i.e. here and in core-agnostic.py and
+# overrides.py, so the voice can get ready to say it before it is needed
+FIXED_ANNOUNCEMENTS = [
+    "Talon listening",
+    "Talon asleep",
+    "Talon mixed mode",
+    "Talon command mode",
+    "Talon dictation mode",
+    "echo enabled",
+    "echo disabled",
+    "echo context enabled",
+    "echo context disabled",
+    "braille enabled",
+    "braille disabled",
+    "Keypress sound on",
+    "Keypress sound off",
+    "Keypresses enabled",
+    "Keypresses disabled",
+]
+
 
 def on_phrase(parsed_phrase):
     if actions.speech.enabled() and actions.user.echo_dictation_enabled():
@@ -18,24 +46,42 @@ def on_phrase(parsed_phrase):
         if words:
             command_chain = " ".join(words)
 
-            # Not all tts engines support canceling
-            # Easier to just catch the exception
-            try:
-                actions.user.cancel_current_speaker()
-            # Logging is handled individually by engine. Ignore here
-            except Exception:
-                pass
-
-            actions.user.tts(command_chain)
+            # Interrupts everything but errors and mode changes
+            actions.user.tts(command_chain, priority="echo")
 
             if settings.get("user.braille_output"):
                 actions.user.braille(command_chain)
 
 
+def echo_context_change(app_name: Optional[str] = None, title: Optional[str] = None):
+    """
+    Echo the app and title once they stop changing, as one utterance. Every
+    change replaces the one still waiting
+    """
+    debounce = settings.get("user.echo_context_debounce")
+    now = time.monotonic()
+    if now - CallbackState.context_changed_at > debounce:
+        # What was waiting has been said by now, so start again
+        CallbackState.pending_app = None
+        CallbackState.pending_title = None
+    CallbackState.context_changed_at = now
+
+    if app_name is not None:
+        CallbackState.pending_app = app_name
+    if title is not None:
+        CallbackState.pending_title = title
+    text = " ".join(
+        part
+        for part in (CallbackState.pending_app, CallbackState.pending_title)
+        if part
+    )
+    actions.user.tts(text, priority="context", key="context", delay=debounce)
+
+
 def on_app_switch(app):
     if not actions.user.echo_context_enabled():
         return
-    actions.user.echo_context()
+    echo_context_change(app_name=actions.app.name())
 
 
 def on_title_switch(win):
@@ -52,7 +98,7 @@ def on_title_switch(win):
         return
 
     CallbackState.last_title = active_window_title
-    actions.user.tts(f"{active_window_title}")
+    echo_context_change(title=active_window_title)
 
 
 def on_update_contexts():
@@ -111,7 +157,7 @@ def on_update_contexts():
         CallbackState.last_mode = "dictation"
 
     if speak and message_to_speak != "":
-        actions.user.tts(message_to_speak)
+        actions.user.tts(message_to_speak, priority="mode")
 
 
 def on_ready():
@@ -128,7 +174,10 @@ def on_ready():
     # We don't have a setting specifically for echoing at startup
     # but we can still use the same setting since it is semantically relevant
     if actions.user.echo_dictation_enabled():
-        actions.user.tts("Talon user scripts loaded")
+        actions.user.tts("Talon user scripts loaded", priority="mode")
+
+    # In the background, after anything said above
+    actions.user.tts_warm_up(FIXED_ANNOUNCEMENTS)
 
 
 app.register("ready", on_ready)
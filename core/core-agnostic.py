@@ -3,17 +3,35 @@ This file contains actions that are core to the talon tts system
 and are agnostic to the tts voice being used or the operating system
 """
 
+import threading
 from typing import Callable, ClassVar, Optional
 
 from talon import Context, Module, actions, app, settings
 
+from ..lib.running import replace_running
+from .speech_queue.speech_queue import SpeechQueue
+from .text_normalization.text_normalization import normalizer
+from .tts_engine.tts_engine import TTSEngine
+
 mod = Module()
 ctx = Context()
 
 
-class AgnosticState:
-    # Store the handle for the subprocess that will cancel the current speaker
-    speaker_cancel_callback: ClassVar[Optional[Callable]] = None
+# Everything said goes through here. Its thread is the only one that uses the
+# tts engine, so whoever speaks never waits for the engine, i.e. to start a process
+speech_queue = SpeechQueue(
+    lambda text: actions.user.tts_engine_speak(text),
+    lambda: actions.user.tts_engine_cancel(),
+    interrupt=lambda: actions.user.tts_engine_interrupt(),
+)
+# Stops the queue from before a reload, so only one thread speaks
+replace_running("speech_queue", speech_queue)
+speech_queue.start()
+
+
+class WarmUpState:
+    # Set to stop the warm up that is running, if any
+    stop: ClassVar[threading.Event] = threading.Event()
 
 
 # We want to get the settings from the talon file but then update
@@ -30,24 +48,24 @@ app.register("ready", initialize_settings)
 
 @mod.action_class
 class Actions:
-    def set_cancel_callback(callback: Callable):
+    def cancel_current_speaker():
+        """Cancels the current speaker and everything waiting to be said"""
+        speech_queue.cancel()
+
+    def tts_engine_cancel():
         """
-        Sets the callback to call when the current speaker is cancelled. Only
-        necessary to set if the tts is coming from a subprocess where we need to store a handle
+        Stops the tts engine speaking. Only the speech queue calls this, on its
+        own thread, so use cancel_current_speaker instead
         """
-        AgnosticState.speaker_cancel_callback = callback
-
-    def cancel_current_speaker():
-        """Cancels the current speaker"""
-        if not AgnosticState.speaker_cancel_callback:
-            return
+        actions.user.tts_engine().silence()
 
-        try:
-            AgnosticState.speaker_cancel_callback()
-        except Exception as e:
-            print(e)
-        finally:
-            AgnosticState.speaker_cancel_callback = None
+    def tts_engine_interrupt():
+        """
+        Cuts off the tts engine for something more important. Only the speech
+        queue calls this, on its own thread. By default it is the same as
+        tts_engine_cancel
+        """
+        actions.user.tts_engine_cancel()
 
     def braille(text: str):
         """Output braille with the screenreader"""
@@ -56,10 +74,10 @@ class Actions:
     def toggle_braille():
         """Toggles braille on and off"""
         if actions.user.braille_enabled():
-            actions.user.tts("braille disabled")
+            actions.user.tts("braille disabled", priority="mode")
             ctx.settings["user.echo_braille"] = False
         else:
-            actions.user.tts("braille enabled")
+            actions.user.tts("braille enabled", priority="mode")
             ctx.settings["user.echo_braille"] = True
 
     def echo_dictation_enabled() -> bool:
@@ -90,20 +108,20 @@ class Actions:
         """Toggles echo dictation on and off"""
 
         if actions.user.echo_dictation_enabled():
-            actions.user.tts("echo disabled")
+            actions.user.tts("echo disabled", priority="mode")
             ctx.settings["user.echo_dictation"] = False
         else:
-            actions.user.tts("echo enabled")
+            actions.user.tts("echo enabled", priority="mode")
             ctx.settings["user.echo_dictation"] = True
 
     def toggle_echo_context() -> None:
         """Toggles echo context on and off"""
 
         if actions.user.echo_context_enabled():
-            actions.user.tts("echo context disabled")
+            actions.user.tts("echo context disabled", priority="mode")
             ctx.settings["user.echo_context"] = False
         else:
-            actions.user.tts("echo context enabled")
+            actions.user.tts("echo context enabled", priority="mode")
             ctx.settings["user.echo_context"] = True
 
     def toggle_echo_all() -> None:
@@ -115,41 +133,109 @@ class Actions:
         )
 
         if any([dictation, context]):
-            actions.user.tts("echo disabled")
+            actions.user.tts("echo disabled", priority="mode")
             ctx.settings["user.echo_dictation"] = False
             ctx.settings["user.echo_context"] = False
         else:
-            actions.user.tts("echo enabled")
+            actions.user.tts("echo enabled", priority="mode")
             ctx.settings["user.echo_dictation"] = True
             ctx.settings["user.echo_context"] = True
 
-    def tts(text: str, interrupt: bool = True):
-        """text to speech with robot voice"""
+    def tts(
+        text: str,
+        interrupt: bool = True,
+        priority: str = "echo",
+        key: Optional[str] = None,
+        delay: float = 0,
+    ):
+        """
+        text to speech with robot voice. Priority is error, mode, echo or
+        context, from most to least important. Interrupting only cuts off
+        what is as important or less. Anything with the same key that hasn't
+        started yet is replaced. With a key, delay is how many seconds to wait
+        for something newer to replace it
+        """
+        if priority == "error" and not settings.get("user.speak_errors"):
+            return
+        speech_queue.submit(text, priority, interrupt, key, delay)
+
+    def tts_engine_speak(text: str) -> Optional[Callable]:
+        """
+        Speaks with the tts engine for this context. Only the speech queue
+        calls this, on its own thread, so use tts instead. Returns a function
+        that says whether the engine is still speaking, if it can tell
+        """
+        # Rate and volume are only sent to the engine if they changed
+        return actions.user.tts_engine().speak_with_settings(
+            actions.user.tts_normalize(text),
+            settings.get("user.tts_speed"),
+            settings.get("user.tts_volume"),
+        )
+
+    def tts_engine() -> TTSEngine:
+        """
+        The tts engine for this context. Some engines have to be used on the
+        thread that created them, so only use it on the speech queue's thread,
+        i.e. through tts_run_on_engine
+        """
         raise NotImplementedError(
             "Sight-Free-Talon Error: TTS not implemented in this context"
         )
 
+    def tts_normalize(text: str) -> str:
+        """Gets text ready for a tts engine to say, i.e. naming punctuation and shortening links"""
+        return normalizer(
+            settings.get("user.tts_punctuation"),
+            settings.get("user.tts_shorten_links"),
+            settings.get("user.tts_shorten_numbers"),
+        )(text)
+
+    def tts_run_on_engine(callback: Callable):
+        """Calls back on the speech queue's thread, i.e. to change the engine's voice"""
+        speech_queue.run(callback)
+
     def espeak(text: str):
         """text to speech with espeak"""
-        actions.user.tts("Espeak Not Supported In This Context")
+        actions.user.tts("Espeak Not Supported In This Context", priority="error")
         raise NotImplementedError
 
     def toggle_reader():
         """Toggles the screen reader on and off"""
-        actions.user.tts("Toggle Reader Not Supported In This Context")
-        raise NotImplementedError
-
-    def base_win_tts(text: str, interrupt: bool):
-        """Base function for windows tts. We expose this
-        so we can share the speaker object across files since
-        it won't get overridden by the other tts functions"""
+        actions.user.tts(
+            "Toggle Reader Not Supported In This Context", priority="error"
+        )
         raise NotImplementedError
 
     def switch_voice():
         """Switches the tts voice"""
-        actions.user.tts("Switching Not Supported In This Context")
+        actions.user.tts("Switching Not Supported In This Context", priority="error")
         raise NotImplementedError
 
     def piper(text: str):
         """Text to speech with a piper model"""
         raise NotImplementedError
+
+    def tts_warm_up(phrases: list[str]):
+        """Gets the tts voice ready to say these phrases straight away, in the background"""
+        actions.user.tts_cancel_warm_up()
+        stop = WarmUpState.stop = threading.Event()
+        # Cached under the text the engine is actually given
+        phrases = [actions.user.tts_normalize(phrase) for phrase in phrases]
+        rate, volume = settings.get("user.tts_speed"), settings.get("user.tts_volume")
+
+        def warm_up():
+            engine = actions.user.tts_engine()
+            # So the voice is set up with the rate and volume it will use
+            engine.set_rate(rate)
+            engine.set_volume(volume)
+            engine.warm_up(phrases, stop)
+
+        actions.user.tts_run_on_engine(warm_up)
+
+    def tts_cancel_warm_up():
+        """Stops getting the tts voice ready, i.e. before switching to another"""
+        WarmUpState.stop.set()
+
+    def tts_report():
+        """Speaks how quickly the tts voice has been responding"""
+        actions.user.tts("Voice Report Not Supported In This Context", priority="error")
@@ -1,9 +1,25 @@
 import os
-import subprocess
-from typing import ClassVar, Literal
+from typing import ClassVar, Literal, Optional
 
 from talon import Context, actions, settings
 
+from ..lib.running import replace_running
+from .callbacks import FIXED_ANNOUNCEMENTS
+from .piper_tts.pcm_cache import PCMCache
+from .piper_tts.piper_client import (
+    WORKER_PATH,
+    AudioSink,
+    PiperError,
+    PiperWorker,
+    aplay_command,
+    find_piper_python,
+    model_sample_rate,
+)
+from .speech_dispatcher.ssip_client import SSIPClient
+from .tts_engine.espeak_engine import EspeakEngine
+from .tts_engine.piper_engine import PiperEngine
+from .tts_engine.tts_engine import TTSEngine
+
 ctxLinux = Context()
 ctxLinux.matches = r"""
 os: linux
@@ -12,6 +28,65 @@ os: linux
 
 class LinuxState:
     speaker: ClassVar[Literal["espeak", "piper"]] = "espeak"
+    # Started on first use, and kept running with the model loaded after that
+    piper_worker: ClassVar[Optional[PiperWorker]] = None
+
+
+PIPER_MODEL_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "additional_voices", "models"
+)
+PIPER_MODELS = ["en_US-amy-low.onnx", "en_US-lessac-medium.onnx"]
+# You have to install piper with pipx
+PIPER_PATH = os.path.expanduser("~/.local/bin/piper")
+PIPER_LENGTH_SCALE = 0.5
+PIPER_CACHE_MEMORY_BYTES = 16 * 1024 * 1024
+PIPER_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "talon-sightless",
+    "piper",
+)
+
+
+def get_piper_worker() -> PiperWorker:
+    if LinuxState.piper_worker is None:
+        python = find_piper_python(PIPER_PATH)
+        if python is None:
+            raise PiperError(f"Couldn't find the Python that {PIPER_PATH} runs in")
+        model = os.path.join(PIPER_MODEL_DIR, PIPER_MODELS[0])
+        cache = PCMCache(
+            PIPER_CACHE_MEMORY_BYTES,
+            PIPER_CACHE_DIR,
+            settings.get("user.piper_cache_disk_mb") * 1024 * 1024,
+        )
+        LinuxState.piper_worker = PiperWorker(
+            [python, WORKER_PATH, "--model", model],
+            AudioSink(aplay_command, model_sample_rate(model)),
+            voice=PIPER_MODELS[0],
+            cache=cache,
+        )
+    return LinuxState.piper_worker
+
+
+# One connection to speech-dispatcher for all espeak speech
+espeak_engine = EspeakEngine(SSIPClient())
+piper_engine = PiperEngine(
+    get_piper_worker,
+    [PIPER_PATH, "--model", os.path.join(PIPER_MODEL_DIR, PIPER_MODELS[0])],
+    PIPER_LENGTH_SCALE,
+)
+ENGINES: dict[str, TTSEngine] = {"espeak": espeak_engine, "piper": piper_engine}
+# Stops piper and its player from before a reload, which the new module would
+# otherwise start a second time
+replace_running("piper_engine", piper_engine)
+
+
+def speak_with(engine: TTSEngine, text: str):
+    """Only call this on the speech queue's thread, like any use of an engine"""
+    engine.speak_with_settings(
+        actions.user.tts_normalize(text),
+        settings.get("user.tts_speed"),
+        settings.get("user.tts_volume"),
+    )
 
 
 @ctxLinux.action_class("user")
@@ -22,70 +97,33 @@ class UserActions:
 
     def switch_voice():
         """Switches the tts voice"""
+        actions.user.tts_cancel_warm_up()
         if LinuxState.speaker == "espeak":
             LinuxState.speaker = "piper"
-            actions.user.tts("Switched to piper")
+            actions.user.tts("Switched to piper", priority="mode")
         else:
             LinuxState.speaker = "espeak"
-            actions.user.tts("Switched to espeak")
+            actions.user.tts("Switched to espeak", priority="mode")
+        actions.user.tts_warm_up(FIXED_ANNOUNCEMENTS)
 
-    def tts(text: str, interrupt: bool = True):
-        """Text to speech with a robotic/narrator voice"""
-        if interrupt:
-            actions.user.cancel_current_speaker()
+    def tts_engine() -> TTSEngine:
+        """The tts voice chosen with switch_voice"""
+        return ENGINES[LinuxState.speaker]
 
-        match LinuxState.speaker:
-            case "espeak":
-                actions.user.espeak(text)
-            case "piper":
-                actions.user.piper(text)
-            case _:
-                raise ValueError(f"Unknown speaker {LinuxState.speaker}")
+    def tts_engine_cancel():
+        """Stops both voices, since the other may still be speaking after switching"""
+        for engine in ENGINES.values():
+            engine.silence()
 
     def espeak(text: str):
         """Text to speech with a robotic/narrator voice"""
-        rate = settings.get("user.tts_speed")
-        # convert -10 to 10 to -100 to 100
-        rate = rate * 10
-
-        # text = remove_special(text)
-
-        volume = settings.get("user.tts_volume")
+        actions.user.tts_run_on_engine(lambda: speak_with(espeak_engine, text))
 
-        # volume is from 1 to 100, convert it to -100 to 100
-        volume = int(volume - 50) * 2
-
-        proc = subprocess.Popen(
-            ["spd-say", text, "--rate", str(rate), "--volume", str(volume)]
-        )
-        actions.user.set_cancel_callback(proc.kill)
+    def tts_report():
+        """Speaks how quickly the tts voice has been responding"""
+        engine = ENGINES[LinuxState.speaker]
+        actions.user.tts_run_on_engine(lambda: actions.user.tts(engine.report()))
 
     def piper(text: str):
         """Text to speech with a robotic/narrator voice"""
-        # change the directory to the directory of this file
-        # so we can run the command from the correct directory
-        model_dir = os.path.join(
-            os.path.dirname(os.path.realpath(__file__)), "additional_voices", "models"
-        )
-        # You have to install piper with pipx
-        piper = os.path.expanduser("~/.local/bin/piper")
-
-        os.chdir(model_dir)
-
-        modes = ["en_US-amy-low.onnx", "en_US-lessac-medium.onnx"]
-        # high = 22050
-        # Hz for playback in low quality
-        low = 16000
-
-        #  we need this more verbose representation here so we don't use the
-        # shell and have risks of shell expansion
-        command1 = ["echo", f"{text}"]
-        command2 = [piper, "--model", modes[0], "--length_scale", "0.5", "--output_raw"]
-        command3 = ["aplay", "-r", str(low), "-c", "1", "-f", "S16_LE", "-t", "raw"]
-
-        echo = subprocess.Popen(command1, stdout=subprocess.PIPE)
-        piper = subprocess.Popen(command2, stdin=echo.stdout, stdout=subprocess.PIPE)
-        echo.stdout.close()
-        aplay = subprocess.Popen(command3, stdin=piper.stdout)
-        piper.stdout.close()
-        actions.user.set_cancel_callback(aplay.kill)
+        actions.user.tts_run_on_engine(lambda: speak_with(piper_engine, text))
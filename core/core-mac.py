@@ -1,24 +1,19 @@
-import subprocess
+from talon import Context
 
-from talon import Context, actions, settings
+from .tts_engine.say_engine import SayEngine
+from .tts_engine.tts_engine import TTSEngine
 
 ctxMac = Context()
 ctxMac.matches = r"""
 os: mac
 """
 
+# Converts tts_speed to words per minute, and only when it changes
+say_engine = SayEngine()
+
 
 @ctxMac.action_class("user")
 class UserActions:
-    def tts(text: str, interrupt: bool = True):
+    def tts_engine() -> TTSEngine:
         """Text to speech with a robotic/narrator voice"""
-
-        if interrupt:
-            actions.user.cancel_current_speaker()
-
-        speed = settings.get("user.tts_speed")
-        # TODO: our speed is from -10 to 10 for espeak but needs
-        # to be converted into words per min for say.
-
-        proc = subprocess.Popen(["say", text])
-        actions.user.set_cancel_callback(proc.kill)
+        return say_engine
@@ -43,11 +43,11 @@ class ActionsToCall:
         global sound_on_keypress
         sound_on_keypress = not sound_on_keypress
         message = f"Keypress sound {'on' if sound_on_keypress else 'off'}"
-        actions.user.tts(message)
+        actions.user.tts(message, priority="mode")
 
     def toggle_keypresses():
         """Toggles whether or not to pass keypresses through to the OS"""
         global sound_on_keypress
         sound_on_keypress = not sound_on_keypress
         message = f"Keypresses {'enabled' if sound_on_keypress else 'disabled'}"
-        actions.user.tts(message)
+        actions.user.tts(message, priority="mode")
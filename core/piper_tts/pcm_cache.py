@@ -0,0 +1,178 @@
+"""
+Remembers the audio piper synthesized for short utterances, keyed by the text,
+voice and speed, so the phrases we say over and over, i.e. mode changes and
+app names, are only synthesized once. This doesn't import talon, so it can be
+used outside of it
+"""
+
+import collections
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+# Longer text, i.e. dictation, is rarely said twice and would push out
+# everything worth keeping
+CACHE_MAX_CHARACTERS = 200
+
+
+class PCMCache:
+    """
+    An LRU of raw audio in memory, in front of an optional LRU on disk that
+    lasts across restarts. Both are capped by size in bytes
+    """
+
+    def __init__(
+        self,
+        memory_bytes: int,
+        directory: Optional[str] = None,
+        disk_bytes: int = 0,
+    ):
+        self.memory_bytes = memory_bytes
+        self.memory: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+        self.memory_size = 0
+        self.directory = directory if disk_bytes > 0 else None
+        self.disk_bytes = disk_bytes
+        # The size of each file on disk, least recently used first. Read from
+        # the directory the first time it is needed
+        self.disk: Optional[collections.OrderedDict[str, int]] = None
+        self.disk_size = 0
+        self.lock = threading.Lock()
+        self.disk_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, voice: str, rate: float) -> Optional[str]:
+        """None if the text is too long to be worth caching"""
+        if len(text) > CACHE_MAX_CHARACTERS:
+            return None
+        return hashlib.sha256(json.dumps([voice, rate, text]).encode()).hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        """Whether the key is cached, without counting as a lookup"""
+        if key in self.memory:
+            return True
+        if self.directory is None:
+            return False
+        with self.disk_lock:
+            return key in self._load_disk()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+
+        audio = self._read_disk(key)
+        with self.lock:
+            if audio is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        with self.lock:
+            self._remember(key, audio)
+        self._write_disk(key, audio)
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.memory_bytes:
+            return
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_size -= len(old)
+        self.memory[key] = audio
+        self.memory_size += len(audio)
+        while self.memory_size > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def _load_disk(self) -> collections.OrderedDict[str, int]:
+        if self.disk is not None:
+            return self.disk
+        self.disk = collections.OrderedDict()
+        self.disk_size = 0
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = [
+                entry
+                for entry in os.scandir(self.directory)
+                if entry.name.endswith(".pcm")
+            ]
+        except OSError as error:
+            print(f"Couldn't read the speech cache in {self.directory}: {error}")
+            entries = []
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            size = entry.stat().st_size
+            self.disk[entry.name[: -len(".pcm")]] = size
+            self.disk_size += size
+        return self.disk
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if self.directory is None:
+            return None
+        with self.disk_lock:
+            disk = self._load_disk()
+            if key not in disk:
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+                # The modified time is what orders the files after a restart
+                os.utime(path)
+            except OSError:
+                self.disk_size -= disk.pop(key)
+                return None
+            disk.move_to_end(key)
+            return audio
+
+    def _write_disk(self, key: str, audio: bytes):
+        if self.directory is None or len(audio) > self.disk_bytes:
+            return
+        with self.disk_lock:
+            disk = self._load_disk()
+            if key in disk:
+                return
+            path = self._path(key)
+            try:
+                # Written to the side first so a crash never leaves half a file
+                with open(path + ".tmp", "wb") as f:
+                    f.write(audio)
+                os.replace(path + ".tmp", path)
+            except OSError as error:
+                print(f"Couldn't save to the speech cache: {error}")
+                return
+            disk[key] = len(audio)
+            self.disk_size += len(audio)
+            while self.disk_size > self.disk_bytes:
+                evicted, size = disk.popitem(last=False)
+                self.disk_size -= size
+                try:
+                    os.remove(self._path(evicted))
+                except OSError:
+                    pass
+
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def report(self) -> str:
+        report = (
+            f"Cache hit rate {self.hit_rate():.0%}: {self.memory_hits} from memory, "
+            f"{self.disk_hits} from disk, {self.misses} synthesized; "
+            f"{self.memory_size / 1e6:.1f}MB in memory"
+        )
+        if self.directory is not None:
+            report += f", {self.disk_size / 1e6:.1f}MB on disk"
+        return report
@@ -0,0 +1,471 @@
+"""
+Keeps one piper process running with its model loaded, instead of starting
+echo | piper | aplay for every utterance, and plays what it says through one
+long running audio sink. This doesn't import talon, so it can be tested with
+a fake synthesizer and sink
+"""
+
+import collections
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from typing import IO, Callable, Optional
+
+from .pcm_cache import PCMCache
+from .piper_worker import FRAME_HEADER
+
+WORKER_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "piper_worker.py"
+)
+
+# Audio is written to the sink this many bytes at a time, so a cancel never
+# waits for more than this to be written. 2048 bytes is 64ms at 16kHz
+AUDIO_CHUNK = 2048
+
+# Give up on the worker after it exits this many times in a row without
+# loading its model, i.e. when piper isn't installed properly
+PIPER_MAX_FAILURES = 3
+
+# How often prerendering checks if whatever is being spoken has finished
+PRERENDER_POLL_INTERVAL = 0.05
+PRERENDER_ATTEMPTS = 3
+
+# How long the worker gets to exit after its stdin is closed before it is killed
+PIPER_STOP_TIMEOUT = 1.0
+
+
+class PiperError(Exception):
+    """The piper worker couldn't be started"""
+
+
+def find_piper_python(piper: str) -> Optional[str]:
+    """The Python that pipx installed piper in, from the shebang of its launcher"""
+    try:
+        with open(piper, "rb") as f:
+            first_line = f.readline().decode().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if not first_line.startswith("#!"):
+        return None
+    python = first_line[2:].strip()
+    return python if os.path.isfile(python) else None
+
+
+def model_sample_rate(model: str) -> Optional[int]:
+    """The sample rate from the config piper keeps next to each model"""
+    try:
+        with open(f"{model}.json") as f:
+            return json.load(f)["audio"]["sample_rate"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def aplay_command(sample_rate: int) -> list[str]:
+    return [
+        "aplay",
+        "-q",
+        "-r",
+        str(sample_rate),
+        "-c",
+        "1",
+        "-f",
+        "S16_LE",
+        "-t",
+        "raw",
+    ]
+
+
+class AudioSink:
+    """
+    A player, i.e. aplay, that raw audio is piped into. It is kept running
+    between utterances and only restarted after a flush, which is the one way
+    to drop what it has already buffered
+    """
+
+    def __init__(
+        self, command: Callable[[int], list[str]], sample_rate: Optional[int] = None
+    ):
+        self.command = command
+        # Known up front so cached audio can play before piper has started
+        self.sample_rate = sample_rate
+        self.process: Optional[subprocess.Popen] = None
+        # Bumped by every flush, so audio from before it is never written after
+        self.generation = 0
+        # Whether anything was written since the last flush
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.starts = 0
+
+    def _stdin(self, generation: int) -> Optional[IO[bytes]]:
+        with self.lock:
+            if generation != self.generation:
+                return None
+            if self.process is None or self.process.poll() is not None:
+                self.process = subprocess.Popen(
+                    self.command(self.sample_rate), stdin=subprocess.PIPE, bufsize=0
+                )
+                self.starts += 1
+            self.dirty = True
+            return self.process.stdin
+
+    def write(self, audio: bytes, generation: int) -> bool:
+        """Returns false if the sink was flushed since the generation was read"""
+        stdin = self._stdin(generation)
+        if stdin is None:
+            return False
+        try:
+            stdin.write(audio)
+        except (OSError, ValueError):
+            # Flushed while we were writing
+            return False
+        return True
+
+    def flush(self):
+        """Drop any audio that is still buffered or playing"""
+        with self.lock:
+            self.generation += 1
+            if not self.dirty:
+                return
+            self.dirty = False
+            process, self.process = self.process, None
+        if process is not None:
+            process.kill()
+            process.stdin.close()
+            process.wait()
+
+    def stop(self):
+        """Kill the player even if nothing was written, i.e. on reload"""
+        with self.lock:
+            self.generation += 1
+            self.dirty = False
+            process, self.process = self.process, None
+        if process is not None:
+            process.kill()
+            process.stdin.close()
+            process.wait()
+
+
+class Utterance:
+    """
+    Audio for one utterance, as it arrives from piper or all at once from the
+    cache. None in the chunks marks the end
+    """
+
+    def __init__(
+        self,
+        id: int,
+        generation: int,
+        cache_key: Optional[str],
+        prerender: bool = False,
+    ):
+        self.id = id
+        # Only synthesized into the cache, not played
+        self.prerender = prerender
+        # The sink generation when it was sent, so a flush drops it
+        self.generation = generation
+        self.cache_key = cache_key
+        self.sent_at = time.perf_counter()
+        self.chunks: queue.SimpleQueue[Optional[bytes]] = queue.SimpleQueue()
+        # Kept to be cached once the utterance is complete
+        self.audio: list[bytes] = []
+        self.played = threading.Event()
+
+    def finish(self):
+        self.chunks.put(None)
+        if self.prerender:
+            # There is no player to say it is done
+            self.played.set()
+
+
+class PiperWorker:
+    """
+    Supervises the piper worker process, starting it again if it exits, and
+    plays the audio it sends back. Utterances are played in the order they
+    were sent on one player thread, whether they come from piper or the
+    cache, until a cancel drops all of them
+    """
+
+    def __init__(
+        self,
+        command: list[str],
+        sink: AudioSink,
+        voice: str = "",
+        cache: Optional[PCMCache] = None,
+    ):
+        self.command = command
+        self.sink = sink
+        self.voice = voice
+        self.cache = cache
+        self.process: Optional[subprocess.Popen] = None
+        self.lock = threading.Lock()
+        self.next_id = 0
+        # Utterances piper is still synthesizing, by id
+        self.synthesizing: dict[int, Utterance] = {}
+        # None tells the player thread to exit
+        self.playback: queue.SimpleQueue[Optional[Utterance]] = queue.SimpleQueue()
+        self.player: Optional[threading.Thread] = None
+        # Utterances spoken that haven't finished playing yet
+        self.pending = 0
+        self.prerendering: Optional[Utterance] = None
+        self.time_to_first_audio: collections.deque[float] = collections.deque(
+            maxlen=100
+        )
+        self.starts = 0
+        self.failures = 0
+        # Set for good by stop, so nothing starts piper again afterwards
+        self.stopped = False
+
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Start the worker if it isn't running, without waiting for its model to load"""
+        with self.lock:
+            self._start()
+
+    def _start(self):
+        if self.running():
+            return
+        if self.stopped:
+            raise PiperError("The piper worker was stopped")
+        if self.failures >= PIPER_MAX_FAILURES:
+            raise PiperError(f"piper exited {self.failures} times without starting")
+        try:
+            process = subprocess.Popen(
+                self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+        except OSError as error:
+            self.failures += 1
+            raise PiperError(f"Couldn't start piper: {error}")
+        self.process = process
+        self.starts += 1
+        self._finish_synthesizing()
+        threading.Thread(
+            target=self._read, args=(process,), name="piper-audio", daemon=True
+        ).start()
+
+    def _finish_synthesizing(self):
+        # Nothing more is coming for these, so don't leave the player waiting
+        for utterance in self.synthesizing.values():
+            utterance.finish()
+        self.synthesizing.clear()
+
+    def _send(self, request: dict):
+        self.process.stdin.write(json.dumps(request).encode() + b"\n")
+        self.process.stdin.flush()
+
+    def speak(self, text: str, length_scale: float = 1.0) -> Utterance:
+        # piper speaks a line at a time
+        text = " ".join(text.split())
+        cache_key = self.cache and self.cache.key(text, self.voice, length_scale)
+        audio = cache_key and self.cache.get(cache_key)
+        with self.lock:
+            if self.stopped:
+                raise PiperError("The piper worker was stopped")
+            self._yield_prerender()
+            self.next_id += 1
+            self.pending += 1
+            utterance = Utterance(self.next_id, self.sink.generation, cache_key)
+            if audio:
+                # Straight to the sink without starting piper at all
+                utterance.chunks.put(audio)
+                utterance.finish()
+            else:
+                self._synthesize(utterance, text, length_scale)
+            self.playback.put(utterance)
+            if self.player is None or not self.player.is_alive():
+                self.player = threading.Thread(
+                    target=self._play, name="piper-player", daemon=True
+                )
+                self.player.start()
+        return utterance
+
+    def _synthesize(self, utterance: Utterance, text: str, length_scale: float):
+        request = {"id": utterance.id, "text": text, "length_scale": length_scale}
+        for attempt in range(2):
+            self._start()
+            try:
+                self._send(request)
+                self.synthesizing[utterance.id] = utterance
+                return
+            except OSError:
+                # It exited since we last checked, so start it again
+                self.process.kill()
+                self.process = None
+                if attempt:
+                    raise PiperError("piper exited while we were sending to it")
+
+    def _yield_prerender(self):
+        # Real speech shouldn't wait behind something we are only caching
+        prerendering, self.prerendering = self.prerendering, None
+        if prerendering is None or prerendering.id not in self.synthesizing:
+            return
+        del self.synthesizing[prerendering.id]
+        prerendering.finish()
+        try:
+            # Nothing after it was sent yet, so this only cancels the prerender
+            self._send({"cancel": prerendering.id})
+        except OSError:
+            pass
+
+    def prerender(self, texts: list[str], length_scale: float, stop: threading.Event):
+        """
+        Synthesize texts into the cache without playing them, i.e. at startup.
+        Waits while anything is being spoken, and is cancelled by anything
+        spoken after it starts, trying again once that is done. Blocks until
+        they are all cached or stop is set
+        """
+        # Loads the model now, so whatever isn't cached is quick to say too
+        self.start()
+        if self.cache is None:
+            return
+        for text in texts:
+            text = " ".join(text.split())
+            cache_key = self.cache.key(text, self.voice, length_scale)
+            # Interrupted prerenders are tried again, but not forever
+            attempts = 0
+            while (
+                cache_key
+                and cache_key not in self.cache
+                and attempts < PRERENDER_ATTEMPTS
+                and not stop.is_set()
+                and not self.stopped
+            ):
+                if self.pending:
+                    stop.wait(PRERENDER_POLL_INTERVAL)
+                    continue
+                with self.lock:
+                    if self.pending:
+                        continue
+                    self.next_id += 1
+                    utterance = Utterance(
+                        self.next_id, self.sink.generation, cache_key, prerender=True
+                    )
+                    self._synthesize(utterance, text, length_scale)
+                    self.prerendering = utterance
+                    attempts += 1
+                while not utterance.played.wait(PRERENDER_POLL_INTERVAL):
+                    if stop.is_set():
+                        with self.lock:
+                            if self.prerendering is utterance:
+                                self._yield_prerender()
+                        return
+
+    def cancel(self):
+        """Stop speaking, without restarting piper or reloading its model"""
+        with self.lock:
+            if self.synthesizing and self.running():
+                try:
+                    self._send({"cancel": self.next_id})
+                except OSError:
+                    pass
+            self._finish_synthesizing()
+            # Under the lock, so nothing spoken after this is flushed with it
+            self.sink.flush()
+
+    def stop(self):
+        """Stop piper and the player for good, i.e. when Talon reloads"""
+        with self.lock:
+            self.stopped = True
+            process, self.process = self.process, None
+            self._finish_synthesizing()
+            self.playback.put(None)
+        if process is not None:
+            # Closing its stdin is enough for the worker to exit, unless it is
+            # stuck partway through an utterance
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            try:
+                process.wait(PIPER_STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.sink.stop()
+
+    def _read(self, process: subprocess.Popen):
+        out = process.stdout
+        hello = out.readline()
+        if not hello:
+            self._exited(process, loaded=False)
+            return
+        self.sink.sample_rate = json.loads(hello)["sample_rate"]
+        with self.lock:
+            self.failures = 0
+
+        while True:
+            header = out.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                break
+            id, length = FRAME_HEADER.unpack(header)
+            audio = out.read(length) if length else None
+            with self.lock:
+                # Not there if it was cancelled
+                utterance = self.synthesizing.get(id)
+                if utterance is None:
+                    continue
+                if audio is None:
+                    del self.synthesizing[id]
+            if audio is not None:
+                if not utterance.prerender:
+                    utterance.chunks.put(audio)
+                if utterance.cache_key:
+                    utterance.audio.append(audio)
+                continue
+
+            if utterance.cache_key and utterance.generation == self.sink.generation:
+                self.cache.put(utterance.cache_key, b"".join(utterance.audio))
+            utterance.finish()
+        self._exited(process, loaded=True)
+
+    def _play(self):
+        while True:
+            utterance = self.playback.get()
+            if utterance is None:
+                return
+            first = True
+            while True:
+                audio = utterance.chunks.get()
+                if audio is None or utterance.generation != self.sink.generation:
+                    break
+                if first:
+                    first = False
+                    self.time_to_first_audio.append(
+                        time.perf_counter() - utterance.sent_at
+                    )
+                for start in range(0, len(audio), AUDIO_CHUNK):
+                    chunk = audio[start : start + AUDIO_CHUNK]
+                    if not self.sink.write(chunk, utterance.generation):
+                        break
+            with self.lock:
+                self.pending -= 1
+            utterance.played.set()
+
+    def _exited(self, process: subprocess.Popen, loaded: bool):
+        process.wait()
+        with self.lock:
+            if not loaded:
+                self.failures += 1
+            if self.process is process:
+                self.process = None
+                self._finish_synthesizing()
+        if process.returncode:
+            print(f"piper exited with code {process.returncode}")
+
+    def report(self) -> str:
+        if not self.time_to_first_audio:
+            report = "Nothing spoken yet"
+        else:
+            ordered = sorted(self.time_to_first_audio)
+            report = (
+                f"Time to first audio p50 {ordered[len(ordered) // 2] * 1000:.0f}ms, "
+                f"max {ordered[-1] * 1000:.0f}ms, over the last {len(ordered)}; "
+                f"started piper {self.starts} times, the sink {self.sink.starts} times"
+            )
+        if self.cache is not None:
+            report += f"\n{self.cache.report()}"
+        return report
@@ -0,0 +1,88 @@
+"""
+Keeps a piper voice model loaded and synthesizes every utterance it is sent,
+instead of piper loading the model again for each one. This runs as a script
+in the Python that piper is installed in, i.e. pipx's, not in Talon. Talon
+loads this file too, which is fine since piper is only imported in main()
+
+Requests are JSON, one per line on stdin:
+    {"id": 1, "text": "Hello", "length_scale": 0.5} to speak
+    {"cancel": 1} to stop every utterance up to and including that id
+It first writes one JSON line with the sample rate, then frames of raw 16 bit
+mono audio, each an id and a length followed by the audio. An empty frame
+ends each utterance, even one that was cancelled
+"""
+
+import argparse
+import json
+import queue
+import struct
+import sys
+import threading
+
+# An utterance id and how many bytes of audio follow. piper_client.py uses this too
+FRAME_HEADER = struct.Struct(">II")
+
+
+def synthesize(voice, text: str, length_scale: float):
+    """The audio for each sentence in turn, from any piper version"""
+    if hasattr(voice, "synthesize_stream_raw"):
+        yield from voice.synthesize_stream_raw(text, length_scale=length_scale)
+        return
+    # piper 1.3 and later
+    from piper import SynthesisConfig
+
+    config = SynthesisConfig(length_scale=length_scale)
+    for chunk in voice.synthesize(text, syn_config=config):
+        yield chunk.audio_int16_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A long running piper")
+    parser.add_argument("--model", required=True)
+    args = parser.parse_args()
+
+    from piper import PiperVoice
+
+    voice = PiperVoice.load(args.model)
+    out = sys.stdout.buffer
+    out.write(json.dumps({"sample_rate": voice.config.sample_rate}).encode() + b"\n")
+    out.flush()
+
+    requests: queue.Queue = queue.Queue()
+    # Everything up to this id was cancelled. Stdin is read on its own thread
+    # so a cancel arrives while we are still synthesizing
+    cancelled = [0]
+
+    def read_requests():
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if "cancel" in request:
+                cancelled[0] = max(cancelled[0], request["cancel"])
+            else:
+                requests.put(request)
+        # Talon closed our stdin, i.e. because it exited or reloaded
+        requests.put(None)
+
+    threading.Thread(target=read_requests, daemon=True).start()
+
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        utterance = request["id"]
+        if utterance > cancelled[0]:
+            for audio in synthesize(
+                voice, request["text"], request.get("length_scale", 1.0)
+            ):
+                if utterance <= cancelled[0]:
+                    break
+                out.write(FRAME_HEADER.pack(utterance, len(audio)) + audio)
+                out.flush()
+        out.write(FRAME_HEADER.pack(utterance, 0))
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
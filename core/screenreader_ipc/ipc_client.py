@@ -1,23 +1,618 @@
 import ipaddress
+import itertools
 import json
 import os
+import queue
+import select
 import socket
 import threading
-from typing import Optional, Tuple, assert_never
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Optional, Tuple, assert_never
 
-from talon import Context, Module, actions, cron, settings
+from talon import Context, Module, actions, app, cron, settings
 
+from ...lib.HTMLbuilder import Builder
+from ...lib.running import replace_running
+from .ipc_metrics import IPCMetrics
+from .ipc_protocol import (
+    COMPACT_ENCODING,
+    COMPACT_PROTOCOL_VERSION,
+    COMPACT_STATUS_VALUES,
+    GENERATION_PROTOCOL_VERSION,
+    PIPELINED_PROTOCOL_VERSION,
+    FrameReader,
+    decode_compact_response,
+    encode_compact_request,
+    encode_frame,
+    encode_json_request,
+    is_compact,
+)
 from .ipc_schema import (
     IPC_COMMAND,
+    IPC_REQUEST,
     IPCClientResponse,
     IPCServerResponse,
-    ResponseBundle,
     ServerSpec,
     ServerStatusResult,
 )
+from .ipc_subscription import MISSING, ScreenreaderMirror, SubscriptionChannel
+from .ipc_timeouts import CircuitBreaker, RoundTripEstimator
 
 mod = Module()
-lock = threading.Lock()
+
+# Seconds to wait for the server to accept the connection or answer a request
+# until we have measured how long it actually takes
+IPC_TIMEOUT = 0.2
+# Bounds for the timeout once it follows the measured round trips
+IPC_MIN_TIMEOUT = 0.1
+IPC_MAX_TIMEOUT = 2.0
+# Timeouts in a row before we stop trying for a while
+IPC_BREAKER_THRESHOLD = 3
+IPC_BREAKER_COOL_DOWN = 5.0
+# How much longer than the timeout a blocking send waits for the worker
+# thread, in case it is stuck, before giving up on the request
+IPC_WAIT_MARGIN = 0.5
+# Seconds a cached read is trusted for. Changes made in NVDA's own dialogs
+# don't bump the generation until they are saved, so nothing else tells us
+READ_CACHE_MAX_AGE = 2.0
+
+
+class IPCSession:
+    """One socket to the server and the requests still waiting for a response on it"""
+
+    def __init__(self, sock: socket.socket, endpoint: Tuple[str, int]):
+        self.sock = sock
+        self.endpoint = endpoint
+        self.reader = FrameReader()
+        # Insertion ordered, so the first entry is always the oldest request.
+        # Each entry also has the perf_counter times the bundle was submitted
+        # and written at
+        self.pending: dict[int, Tuple[Future, list[IPC_REQUEST], float, float]] = {}
+        # When the server has gone too long without answering anything pending
+        self.deadline: Optional[float] = None
+
+
+class IPCConnection:
+    """
+    A long lived, pipelined connection to the screenreader addon server.
+    Reusing the socket means we only pay for the TCP handshake once
+    instead of twice per phrase. Bundles are written as soon as they are
+    submitted without waiting for earlier responses, and each response is
+    matched back to its request by id. Servers too old for ids answer in
+    order, so their responses are matched first in first out.
+    If the server restarts or drops the connection, we transparently
+    reconnect on the next request. Deadlines follow the measured round trip
+    time, and after repeated timeouts requests fail straight away for a
+    cool down. Only the IPC worker thread uses this
+    """
+
+    def __init__(
+        self,
+        on_failure: Callable[[], None] = lambda: None,
+        on_response: Callable[[list[IPC_REQUEST], IPCServerResponse], None] = (
+            lambda commands, response: None
+        ),
+    ):
+        self.session: Optional[IPCSession] = None
+        self.request_ids = itertools.count(1)
+        # Called whenever requests fail because of the connection itself
+        self.on_failure = on_failure
+        # Called with every response the server sends, before it is checked
+        self.on_response = on_response
+        self.rtt = RoundTripEstimator(IPC_TIMEOUT, IPC_MIN_TIMEOUT, IPC_MAX_TIMEOUT)
+        self.breaker = CircuitBreaker(IPC_BREAKER_THRESHOLD, IPC_BREAKER_COOL_DOWN)
+
+    def connect(self, ip: str, port: int) -> IPCSession:
+        self.close()
+        # The handshake is a round trip too, so it gets the same deadline
+        sock = socket.create_connection((ip, port), timeout=self.rtt.timeout())
+        # Requests are tiny so we don't want Nagle's algorithm to hold them back
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.session = IPCSession(sock, (ip, port))
+        return self.session
+
+    def close(self, client_response=IPCClientResponse.GENERAL_ERROR, failed=False):
+        """
+        Close the connection and fail anything still waiting for a response.
+        failed is for when sending failed, which is a failure even if nothing
+        was waiting, i.e. when we couldn't connect at all
+        """
+        session, self.session = self.session, None
+        pending = {}
+        if session is not None:
+            pending = session.pending
+            try:
+                session.sock.close()
+            except OSError:
+                pass
+
+        # A server closing an idle connection is expected, so we only
+        # treat it as a failure if requests were lost
+        if failed or pending:
+            self.on_failure()
+        for future, commands, started, _ in pending.values():
+            settle(future, commands, started, client_response)
+
+    def _timed_out(self, failed=False):
+        self.rtt.timed_out()
+        self.breaker.timed_out()
+        self.close(IPCClientResponse.TIMED_OUT, failed)
+
+    def send(
+        self,
+        future: Future,
+        ip: str,
+        port: int,
+        commands: list[IPC_REQUEST],
+        command_ids: Optional[dict[str, int]] = None,
+        pipelined: bool = False,
+        started: Optional[float] = None,
+    ):
+        """
+        Write a bundle without waiting for its response. The future is
+        completed with the checked results once the response arrives
+        """
+        if started is None:
+            started = time.perf_counter()
+        # Nothing is sent, so the screenreader isn't kept waiting either
+        if not self.breaker.allow():
+            settle(future, commands, started, IPCClientResponse.NO_RESPONSE)
+            return
+        reused = self.session is not None and self.session.endpoint == (ip, port)
+        try:
+            session = self.session if reused else self.connect(ip, port)
+            try:
+                self._write(session, future, commands, command_ids, pipelined, started)
+            except socket.timeout:
+                raise
+            except OSError:
+                # A reused socket may have been closed by the server since the
+                # last phrase, i.e. if NVDA restarted. Only then is it safe to retry
+                if not reused:
+                    raise
+                session = self.connect(ip, port)
+                self._write(session, future, commands, command_ids, pipelined, started)
+        except socket.timeout:
+            self._timed_out(failed=True)
+            settle(future, commands, started, IPCClientResponse.TIMED_OUT)
+        except Exception as fallback_error:
+            self.close(failed=True)
+            print(fallback_error, commands)
+            settle(future, commands, started, IPCClientResponse.GENERAL_ERROR)
+
+    def _write(
+        self,
+        session: IPCSession,
+        future: Future,
+        commands: list[IPC_REQUEST],
+        command_ids: Optional[dict[str, int]],
+        pipelined: bool,
+        started: float,
+    ):
+        request_id = next(self.request_ids) % 2**32
+        payload = encode_request(
+            commands, command_ids, request_id if pipelined else None
+        )
+        session.sock.sendall(encode_frame(payload))
+        if not session.pending:
+            session.deadline = time.monotonic() + self.rtt.timeout()
+        session.pending[request_id] = (future, commands, started, time.perf_counter())
+
+    def timeout(self) -> Optional[float]:
+        """How long until the oldest pending request times out, if any"""
+        if self.session is None or self.session.deadline is None:
+            return None
+        return max(0.0, self.session.deadline - time.monotonic())
+
+    def check_deadline(self):
+        session = self.session
+        if session and session.deadline and session.deadline <= time.monotonic():
+            self._timed_out()
+
+    def read_responses(self):
+        """Resolve every response that has arrived. Call when the socket is readable"""
+        session = self.session
+        try:
+            if session.reader.recv_from(session.sock) == 0:
+                self.close()
+                return
+            frame = session.reader.next_frame()
+            while frame is not None:
+                self._resolve(session, frame)
+                frame = session.reader.next_frame()
+        except (OSError, ValueError, KeyError) as error:
+            print("Error reading from screenreader", error)
+            self.close()
+
+    def _resolve(self, session: IPCSession, frame: memoryview):
+        request_id, server_response = decode_response(frame)
+        if request_id is None and session.pending:
+            request_id = next(iter(session.pending))
+        entry = session.pending.pop(request_id, None)
+        # Any response shows the server is alive, so the remaining
+        # requests get a full timeout from now
+        session.deadline = (
+            time.monotonic() + self.rtt.timeout() if session.pending else None
+        )
+
+        if entry is None:
+            print(f"Received a response for unknown request {request_id}")
+            return
+        future, commands, started, written = entry
+        self.rtt.sample(time.perf_counter() - written)
+        self.breaker.succeeded()
+        if server_response["processedCommands"] is None:
+            server_response["processedCommands"] = list(commands)
+        try:
+            self.on_response(commands, server_response)
+        except Exception as error:
+            # The request still gets its results
+            print(f"Error handling a screenreader response: {error}")
+        settle(future, commands, started, IPCClientResponse.SUCCESS, server_response)
+
+
+class EndpointCache:
+    """
+    Caches the endpoint advertised in an addon server spec file.
+    Once loaded, the endpoint is reused without touching the filesystem
+    until a connection failure invalidates it. Only then do we stat the file,
+    and we only parse it again if its inode or modification time changed,
+    i.e. the server restarted and wrote a new one
+    """
+
+    def __init__(self, spec_file: str):
+        self.spec_file = spec_file
+        self.file_key: Optional[Tuple[int, int]] = None
+        self.endpoint: Optional[Tuple[str, str, frozenset[str]]] = None
+        # Integer id of each command if the server accepts the compact encoding
+        self.command_ids: Optional[dict[str, int]] = None
+        # Commands whose results only change along with the config generation
+        self.read_only_commands: frozenset[str] = frozenset()
+        # Whether the server matches responses to requests by id
+        self.pipelined = False
+        self.valid = False
+        # Resolving an address can hit DNS, so remember each answer
+        self.resolved_addresses: dict[str, str] = {}
+        # Called whenever a failure suggests the server may be gone
+        self.invalidate_listeners: list[Callable[[], None]] = []
+
+    def add_invalidate_listener(self, callback: Callable[[], None]):
+        self.invalidate_listeners.append(callback)
+
+    def invalidate(self):
+        self.valid = False
+        for listener in self.invalidate_listeners:
+            listener()
+
+    def resolve(self, address: str) -> str:
+        if address in self.resolved_addresses:
+            return self.resolved_addresses[address]
+
+        try:
+            if address == "localhost":
+                ip = ipaddress.ip_address(socket.gethostbyname(address))
+            else:
+                ip = ipaddress.ip_address(address)
+            assert ip.is_private, "Address is not a local IP address"
+        except ValueError:
+            raise ValueError(f"Invalid screenreader IP address: {address}")
+
+        self.resolved_addresses[address] = str(ip)
+        return self.resolved_addresses[address]
+
+    def get(self) -> Tuple[str, str, frozenset[str]]:
+        """Return the ip, port and valid commands. Raises FileNotFoundError if there is no server"""
+        if self.valid:
+            return self.endpoint
+
+        stat = os.stat(self.spec_file)
+        file_key = (stat.st_ino, stat.st_mtime_ns)
+        if file_key != self.file_key:
+            with open(self.spec_file, "r") as f:
+                spec: ServerSpec = json.load(f)
+
+            self.endpoint = (
+                self.resolve(spec["address"]),
+                spec["port"],
+                frozenset(spec["valid_commands"]),
+            )
+            protocol_version = spec.get("protocol_version", 1)
+            # Compact ids are the index of each command in the advertised list
+            supports_compact = (
+                protocol_version >= COMPACT_PROTOCOL_VERSION
+                and COMPACT_ENCODING in spec.get("encodings", [])
+            )
+            self.command_ids = (
+                {command: i for i, command in enumerate(spec["valid_commands"])}
+                if supports_compact
+                else None
+            )
+            self.pipelined = protocol_version >= PIPELINED_PROTOCOL_VERSION
+            self.read_only_commands = (
+                frozenset(spec.get("read_only_commands", []))
+                if protocol_version >= GENERATION_PROTOCOL_VERSION
+                else frozenset()
+            )
+            self.file_key = file_key
+
+        self.valid = True
+        return self.endpoint
+
+
+nvda_endpoint = EndpointCache(
+    os.path.expanduser("~\\AppData\\Roaming\\nvda\\talon_server_spec.json")
+)
+
+
+def command_name(command: IPC_REQUEST) -> str:
+    # Commands with arguments are a list that starts with the command name
+    return command[0] if isinstance(command, list) else command
+
+
+class ReadCache:
+    """
+    Remembers what read only commands returned, along with the config
+    generation the server reported when they ran. The server bumps the
+    generation whenever a setting changes, so a read can be answered locally
+    for as long as the newest generation we have heard of is the one it was
+    read at. Every response and push tells us the newest generation.
+    A push means something changed in NVDA, so it clears the cache even at
+    the same generation, and entries expire after a short while regardless
+    """
+
+    def __init__(
+        self,
+        max_age: float = READ_CACHE_MAX_AGE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.generation: Optional[int] = None
+        # The value of each read and the clock time it expires at
+        self.values: dict[Any, Tuple[Any, float]] = {}
+        self.max_age = max_age
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # Lookups come from Talon's threads and updates from the IPC threads
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(command: IPC_REQUEST):
+        return command if isinstance(command, str) else tuple(command)
+
+    def _observe(self, generation: Optional[int]) -> bool:
+        """Returns true if the generation is the newest one we have heard of"""
+        if generation is None:
+            return False
+        if self.generation is None or generation > self.generation:
+            self.values.clear()
+            self.generation = generation
+        return generation == self.generation
+
+    def observe(self, generation: Optional[int]):
+        with self.lock:
+            self._observe(generation)
+
+    def on_push(self, generation: Optional[int]):
+        with self.lock:
+            self._observe(generation)
+            self.values.clear()
+
+    def store(self, commands: list[IPC_REQUEST], values: list, generation: int):
+        with self.lock:
+            # Responses can arrive after a newer generation was pushed to us
+            if not self._observe(generation):
+                return
+            expires = self.clock() + self.max_age
+            for command, value in zip(commands, values):
+                try:
+                    self.values[self.key(command)] = (value, expires)
+                except TypeError:
+                    # Arguments that can't be hashed, i.e. a nested list
+                    pass
+
+    def invalidate(self):
+        with self.lock:
+            self.values.clear()
+
+    def lookup_prefix(
+        self, commands: list[IPC_REQUEST], read_only: frozenset[str]
+    ) -> list[Tuple[IPC_REQUEST, Any]]:
+        """
+        Return the cached results for the reads at the start of a bundle.
+        Reads after a change in the same bundle have to see that change,
+        so those are always sent
+        """
+        served = []
+        with self.lock:
+            now = self.clock()
+            for command in commands:
+                if command_name(command) not in read_only:
+                    break
+                try:
+                    value, expires = self.values.get(self.key(command), (MISSING, 0))
+                except TypeError:
+                    break
+                if value is MISSING or now >= expires:
+                    break
+                served.append((command, value))
+
+            self.hits += len(served)
+            self.misses += sum(
+                1
+                for command in commands[len(served) :]
+                if command_name(command) in read_only
+            )
+        return served
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        rate = f"{self.hits / total:.0%}" if total else "n/a"
+        return (
+            f"Screenreader read cache: {self.hits} hits, {self.misses} misses "
+            f"({rate} hit rate), {len(self.values)} entries "
+            f"at generation {self.generation}"
+        )
+
+
+nvda_read_cache = ReadCache()
+
+
+def cache_reads(commands: list[IPC_REQUEST], response: IPCServerResponse):
+    """Remember the results of bundles that only read NVDA's settings"""
+    generation = response.get("generation")
+    read_only = nvda_endpoint.read_only_commands
+    if all(command_name(c) in read_only for c in commands) and all(
+        status is ServerStatusResult.SUCCESS for status in response["statusResults"]
+    ):
+        nvda_read_cache.store(commands, response["returnedValues"], generation)
+    else:
+        nvda_read_cache.observe(generation)
+
+
+connection = IPCConnection(on_failure=nvda_endpoint.invalidate, on_response=cache_reads)
+
+
+class IPCWorker:
+    """
+    Owns the connection and runs every IPC exchange on one dedicated thread,
+    so callers like Talon's speech thread never block on socket work unless
+    they choose to wait. Bundles are sent strictly in submission order, so a
+    bundle submitted at the start of a phrase always reaches the screenreader
+    before a later one. Between submissions the thread waits on the socket, so
+    responses are picked up without a second thread
+    """
+
+    def __init__(self, connection: IPCConnection):
+        self.connection = connection
+        self.requests: queue.SimpleQueue = queue.SimpleQueue()
+        self.thread: Optional[threading.Thread] = None
+        self.start_lock = threading.Lock()
+        self.stopped = False
+        # Writing to this socket pair wakes the thread up to run a submission
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        self.wakeup_sender.setblocking(False)
+
+    def on_worker_thread(self) -> bool:
+        return threading.current_thread() is self.thread
+
+    def submit(self, fn: Callable, *args) -> Future:
+        future = Future()
+
+        # Waiting on our own queue from the worker thread would deadlock,
+        # i.e. if a completion callback sends another bundle synchronously
+        if self.on_worker_thread():
+            self._run_one(future, fn, args)
+            return future
+
+        with self.start_lock:
+            if self.stopped:
+                future.cancel()
+                return future
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self._run, name="screenreader-ipc", daemon=True
+                )
+                self.thread.start()
+            self.requests.put((future, fn, args))
+        self._wake()
+        return future
+
+    def stop(self):
+        """Let the thread exit, i.e. when Talon reloads this file and starts another"""
+        with self.start_lock:
+            self.stopped = True
+        self._wake()
+
+    def _wake(self):
+        try:
+            self.wakeup_sender.send(b"\0")
+        except BlockingIOError:
+            # Plenty of wakeups are already waiting to be read
+            pass
+
+    def wait(self, future: Future):
+        """Block until a future completes, without deadlocking on the worker thread"""
+        # The worker thread is the one that would complete it, so keep
+        # servicing the connection until it does
+        while self.on_worker_thread() and not future.done():
+            self._step()
+        try:
+            return future.result(self.connection.rtt.timeout() + IPC_WAIT_MARGIN)
+        except TimeoutError:
+            # The worker thread should have timed it out by now, so don't keep
+            # the caller, i.e. Talon's main thread, waiting on it any longer
+            complete(future, IPCClientResponse.TIMED_OUT)
+            return future.result()
+
+    def _run_one(self, future: Future, fn: Callable, args: tuple):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as error:
+            future.set_exception(error)
+
+    def _step(self):
+        sockets = [self.wakeup_receiver]
+        session = self.connection.session
+        if session is not None:
+            sockets.append(session.sock)
+
+        readable, _, _ = select.select(sockets, [], [], self.connection.timeout())
+        if session is not None and session.sock in readable:
+            self.connection.read_responses()
+        if self.wakeup_receiver in readable:
+            try:
+                while self.wakeup_receiver.recv(1024):
+                    pass
+            except BlockingIOError:
+                pass
+        while True:
+            try:
+                future, fn, args = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            self._run_one(future, fn, args)
+        self.connection.check_deadline()
+
+    def _run(self):
+        while not self.stopped:
+            try:
+                self._step()
+            except Exception as error:
+                # Keep going, or anything queued would wait until the next
+                # submission starts a new thread. The connection may be halfway
+                # through a response, so start it over, which fails what was on it
+                print(f"Error in the screenreader IPC thread: {error}")
+                self.connection.close()
+        # Fails anything still waiting on a response, and cancels anything
+        # that wasn't sent, rather than leaving them to time out
+        self.connection.close()
+        while True:
+            try:
+                future, _, _ = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+
+
+worker = IPCWorker(connection)
+replace_running("screenreader_ipc.worker", worker)
+
+# NVDA pushes every whitelisted setting and lifecycle event to us, so reads
+# can be answered locally and nothing has to poll while the subscription is up
+nvda_mirror = ScreenreaderMirror()
+nvda_subscription = SubscriptionChannel(nvda_endpoint, nvda_mirror, IPC_TIMEOUT)
+# Pushes tell us about new generations before the next response would
+nvda_subscription.add_listener(
+    lambda message: nvda_read_cache.on_push(message.get("generation"))
+)
+
+if os.name == "nt":
+    replace_running("screenreader_ipc.nvda_subscription", nvda_subscription)
+    app.register("ready", nvda_subscription.start)
 
 
 def handle_ipc_result(
@@ -75,6 +670,179 @@ def handle_ipc_result(
     )
 
 
+# Compact status codes mapped straight to enum members
+COMPACT_STATUS_RESULTS = tuple(
+    ServerStatusResult.generate_from(value) for value in COMPACT_STATUS_VALUES
+)
+
+
+def encode_request(
+    commands: list[IPC_REQUEST],
+    command_ids: Optional[dict[str, int]],
+    request_id: Optional[int] = None,
+) -> bytes:
+    # Commands with arguments can't be packed, so those bundles fall back to JSON
+    if command_ids is not None and all(isinstance(c, str) for c in commands):
+        return encode_compact_request([command_ids[c] for c in commands], request_id)
+    return encode_json_request(commands, request_id)
+
+
+def decode_response(frame: memoryview) -> Tuple[Optional[int], IPCServerResponse]:
+    """Return the request id the response is for, if it has one, and the response"""
+    if is_compact(frame):
+        request_id, statuses, values, generation = decode_compact_response(
+            frame, COMPACT_STATUS_RESULTS
+        )
+        # Compact responses are in request order, so the commands aren't echoed
+        # back. They are filled in once we know which request this answers
+        response: IPCServerResponse = {
+            "processedCommands": None,
+            "returnedValues": values,
+            "statusResults": statuses,
+        }
+        if generation is not None:
+            response["generation"] = generation
+        return request_id, response
+
+    raw_response: IPCServerResponse = json.loads(str(frame, "utf-8"))
+    raw_response["statusResults"] = [
+        ServerStatusResult.generate_from(status)
+        for status in raw_response["statusResults"]
+    ]
+    return raw_response.pop("id", None), raw_response
+
+
+# Every bundle ends up in settle on the worker thread, so this is the only writer
+ipc_metrics = IPCMetrics(success=ServerStatusResult.SUCCESS)
+
+
+def settle(
+    future: Future,
+    commands: list[IPC_REQUEST],
+    started: float,
+    client_response: IPCClientResponse,
+    server_response: Optional[IPCServerResponse] = None,
+):
+    """Record how a request went, then complete its future with the checked results or the error"""
+    ipc_metrics.record(
+        [command_name(command) for command in commands],
+        client_response,
+        server_response["statusResults"] if server_response else None,
+        time.perf_counter() - started,
+    )
+    complete(future, client_response, server_response)
+
+
+def complete(
+    future: Future,
+    client_response: IPCClientResponse,
+    server_response: Optional[IPCServerResponse] = None,
+):
+    """Complete a future with the checked results or the error, unless it already is"""
+    try:
+        try:
+            result = handle_ipc_result(client_response, server_response)
+        except Exception as error:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        # Cancelled, or whoever was waiting gave up on it
+        pass
+
+
+def add_latency_table(builder: Builder, heading: str, kind: str, summaries: dict):
+    builder.h2(heading)
+    if not summaries:
+        builder.p("Nothing recorded yet")
+        return
+    builder.start_table([kind, "Count", "Mean ms", "p50 ms", "p99 ms", "Max ms"])
+    for name, summary in sorted(summaries.items()):
+        builder.add_row(
+            [name, summary["count"]]
+            + [
+                summary.get(key, "")
+                for key in ("mean_ms", "p50_ms", "p99_ms", "max_ms")
+            ]
+        )
+    builder.end_table()
+
+
+def render_metrics(client: dict, server: Optional[dict], timeouts: list[str]):
+    """Open a page with the latency histograms and error counts from both ends"""
+    builder = Builder()
+    builder.title("Screenreader IPC metrics")
+    builder.h1("Screenreader IPC metrics")
+    builder.p(
+        "Latencies are counted in fixed buckets, so percentiles are the upper bound of their bucket"
+    )
+    add_latency_table(
+        builder, "Client latency by outcome", "Outcome", client["by_outcome"]
+    )
+    add_latency_table(
+        builder, "Client latency by command", "Command", client["by_command"]
+    )
+
+    builder.h2("Timeouts")
+    builder.ul(*timeouts)
+
+    builder.h2("Errors reported by the server")
+    if client["server_errors"]:
+        builder.ul(
+            *(f"{error}: {count}" for error, count in client["server_errors"].items())
+        )
+    else:
+        builder.p("None")
+
+    if server is None:
+        builder.h2("Server")
+        builder.p("The screenreader addon server did not report any metrics")
+    else:
+        add_latency_table(
+            builder, "Server time by command", "Command", server["commands"]
+        )
+        add_latency_table(
+            builder, "Server time by request", "Request", server["requests"]
+        )
+    builder.render()
+
+
+def prepend_results(results: list[Tuple[IPC_REQUEST, Any]], future: Future) -> Future:
+    """Return a future for the given results followed by those of another future"""
+    combined = Future()
+
+    def combine(done: Future):
+        error = done.exception()
+        try:
+            if error is not None:
+                combined.set_exception(error)
+            else:
+                combined.set_result(results + done.result())
+        except InvalidStateError:
+            # Whoever was waiting gave up on it
+            pass
+
+    future.add_done_callback(combine)
+    return combined
+
+
+def submit_commands(
+    ip: str,
+    port: int,
+    commands: list[IPC_REQUEST],
+    command_ids: Optional[dict[str, int]] = None,
+    pipelined: bool = False,
+) -> Future:
+    """Queue a bundle on the shared connection and return a future for the checked results"""
+    future = Future()
+    # Timed from here so the metrics include the wait for the worker thread
+    started = time.perf_counter()
+    worker.submit(
+        connection.send, future, ip, port, commands, command_ids, pipelined, started
+    )
+    return future
+
+
 @mod.action_class
 class Actions:
     def addon_server_endpoint() -> Tuple[str, str, str]:
@@ -82,25 +850,75 @@ class Actions:
 
     # We use a list and not a dict since we can have duplicate commands in the same payload
     def send_ipc_commands(
-        commands: list[IPC_COMMAND],
-    ) -> list[Tuple[IPC_COMMAND, Optional[any]]]:
+        commands: list[IPC_REQUEST],
+    ) -> list[Tuple[IPC_REQUEST, Optional[any]]]:
         """Sends a bundle of commands to the screenreader"""
-        actions.user.tts("No screenreader running to send commands to")
+        actions.user.tts(
+            "No screenreader running to send commands to", priority="error"
+        )
         raise NotImplementedError
 
+    def send_ipc_commands_async(
+        commands: list[IPC_REQUEST], callback: Optional[Callable] = None
+    ) -> Optional[Future]:
+        """
+        Queues a bundle of commands for the screenreader without blocking.
+        Returns a future for the results, and calls callback with that
+        future once it completes. Bundles are sent in the order they are queued
+        """
+        actions.user.tts(
+            "No screenreader running to send commands to", priority="error"
+        )
+        raise NotImplementedError
+
+    def addon_server_available() -> bool:
+        """Returns true if the screenreader addon server is ready for commands"""
+        return False
+
     # We need a separate command for single commands since we can't easily
     # pass in a list via a .talon file and thus this allows a single string instead
     def send_ipc_command(
-        command: IPC_COMMAND,
+        command: IPC_REQUEST,
     ) -> Optional[any]:
         """
         Sends a single command to the screenreader.
         This is its own function since it is a clearer API than passing in
         a list for a single command
         """
-        actions.user.tts("No screenreader running to send commands to")
+        actions.user.tts(
+            "No screenreader running to send commands to", priority="error"
+        )
         raise NotImplementedError
 
+    def get_screenreader_config(path: str) -> any:
+        """Reads a whitelisted screenreader setting, i.e. 'keyboard.speakTypedWords'"""
+        return actions.user.send_ipc_command(["getConfig", path])
+
+    def ipc_read_cache_report() -> str:
+        """Prints and returns the hit rate of the cache of screenreader reads"""
+        report = nvda_read_cache.report()
+        print(report)
+        return report
+
+    def ipc_metrics_report():
+        """Opens a page with the latency and error counts of screenreader IPC"""
+        server = None
+        if actions.user.addon_server_available():
+            try:
+                if "getMetrics" in actions.user.addon_server_endpoint()[2]:
+                    server = actions.user.send_ipc_command("getMetrics")
+            except Exception as error:
+                print(f"Could not get metrics from the screenreader: {error}")
+        render_metrics(
+            ipc_metrics.snapshot(),
+            server,
+            [connection.rtt.report(), connection.breaker.report()],
+        )
+
+    def set_screenreader_config(path: str, value: any):
+        """Changes a whitelisted screenreader setting, i.e. 'keyboard.speakTypedWords'"""
+        actions.user.send_ipc_command(["setConfig", path, value])
+
 
 NVDAContext = Context()
 NVDAContext.matches = r"""
@@ -112,32 +930,33 @@ tag: user.nvda_running
 class NVDAActions:
     def addon_server_endpoint() -> Tuple[str, str, str]:
         """Returns the address, port, and valid commands for the addon server"""
-        SPEC_FILE = os.path.expanduser(
-            "~\\AppData\\Roaming\\nvda\\talon_server_spec.json"
-        )
-
-        with open(SPEC_FILE, "r") as f:
-            spec: ServerSpec = json.load(f)
-            address = spec["address"]
-            port = spec["port"]
-            valid_commands = spec["valid_commands"]
+        return nvda_endpoint.get()
 
+    def addon_server_available() -> bool:
+        """Returns true if the addon server has advertised an endpoint"""
         try:
-            if address == "localhost":
-                ip = ipaddress.ip_address(socket.gethostbyname(address))
-            else:
-                ip = ipaddress.ip_address(address)
-            assert ip.is_private, "Address is not a local IP address"
-        except ValueError:
-            raise ValueError(f"Invalid NVDA IP address: {address}")
-
-        return address, port, valid_commands
+            nvda_endpoint.get()
+            return True
+        except FileNotFoundError:
+            return False
 
     # Should be used only for single commands or debugging
     def send_ipc_commands(
-        commands: list[IPC_COMMAND],
-    ) -> list[Tuple[IPC_COMMAND, Optional[any]]]:
+        commands: list[IPC_REQUEST],
+    ) -> list[Tuple[IPC_REQUEST, Optional[any]]]:
         """Sends a list of commands or a single command string to the NVDA screenreader"""
+        future = actions.user.send_ipc_commands_async(commands)
+        if future is None:
+            return
+        # Block until we receive a response
+        # We don't want to execute commands until
+        # we know the screen reader has the proper settings
+        return worker.wait(future)
+
+    def send_ipc_commands_async(
+        commands: list[IPC_REQUEST], callback: Optional[Callable] = None
+    ) -> Optional[Future]:
+        """Queues a bundle of commands for NVDA and returns a future for the results"""
 
         # this function can still be called if NVDA is running, since cron
         # is ran 400ms after the check, so we can check again here after the
@@ -162,58 +981,39 @@ class NVDAActions:
                     )
 
             cron.after("2s", check_if_shutdown)
+            return
 
         for command in commands:
-            if command not in valid_commands:
+            if command_name(command) not in valid_commands:
                 raise ValueError(f"Server cannot process command: {command}")
 
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(0.2)
-        encoded = json.dumps(commands).encode()
-
-        # Default response if nothing is set
-        response: ResponseBundle = {
-            "client": IPCClientResponse.NO_RESPONSE,
-            "server": None,
-        }
-
-        # Although the screenreader server will block while processing commands,
-        # having a lock client-side prevents errors when sending multiple commands
-        with lock:
-            try:
-                sock.connect((ip, int(port)))
-                sock.sendall(encoded)
-                # Block until we receive a response
-                # We don't want to execute commands until
-                # we know the screen reader has the proper settings
-                raw_data = sock.recv(1024)
-
-                raw_response: IPCServerResponse = json.loads(raw_data.decode("utf-8"))
-                raw_response["statusResults"] = [
-                    ServerStatusResult.generate_from(status)
-                    for status in raw_response["statusResults"]
-                ]
-                response["client"] = IPCClientResponse.SUCCESS
-                response["server"] = raw_response
-            except KeyError as enum_decode_error:
-                print("Error decoding enum", enum_decode_error, response)
-                response["client"] = IPCClientResponse.GENERAL_ERROR
-            except socket.timeout:
-                response["client"] = IPCClientResponse.TIMED_OUT
-            except Exception as fallback_error:
-                response["client"] = IPCClientResponse.GENERAL_ERROR
-                print(
-                    fallback_error,
-                    response,
-                )
-            finally:
-                sock.close()
+        read_only = nvda_endpoint.read_only_commands
+        cached = nvda_read_cache.lookup_prefix(commands, read_only)
+        remaining = commands[len(cached) :]
+        if not remaining:
+            future = Future()
+            future.set_result(cached)
+        else:
+            # Our own change makes what we cached stale before the server
+            # can tell us about the new generation
+            if any(command_name(c) not in read_only for c in remaining):
+                nvda_read_cache.invalidate()
+            future = submit_commands(
+                ip,
+                int(port),
+                remaining,
+                nvda_endpoint.command_ids,
+                nvda_endpoint.pipelined,
+            )
+            if cached:
+                future = prepend_results(cached, future)
 
-        checked_result = handle_ipc_result(response["client"], response["server"])
-        return checked_result
+        if callback:
+            future.add_done_callback(callback)
+        return future
 
     def send_ipc_command(
-        command: IPC_COMMAND,
+        command: IPC_REQUEST,
     ) -> Optional[any]:
         """Sends a single command to the screenreader"""
         result: list[Tuple] = actions.user.send_ipc_commands([command])
@@ -224,6 +1024,21 @@ class NVDAActions:
         _, value = result[FIRST_AND_ONLY_COMMAND := 0]
         return value
 
+    def get_screenreader_config(path: str) -> any:
+        """Reads a whitelisted NVDA setting, from the pushed mirror if we are subscribed"""
+        value = nvda_mirror.get(path)
+        if value is not MISSING:
+            return value
+        return actions.user.send_ipc_command(["getConfig", path])
+
+    def set_screenreader_config(path: str, value: any):
+        """Changes a whitelisted NVDA setting"""
+        actions.user.send_ipc_command(["setConfig", path, value])
+        # The push confirming this may not have arrived yet, so a read right
+        # after the write would otherwise see the old value
+        if nvda_subscription.connected:
+            nvda_mirror.update(path, value)
+
 
 ORCAContext = Context()
 ORCAContext.matches = r"""
@@ -0,0 +1,123 @@
+"""
+Low overhead counters and latency histograms for the IPC client.
+Everything is recorded from the IPC worker thread alone, so nothing needs
+a lock. Readers on other threads may see a snapshot one update behind
+"""
+
+import bisect
+from collections import defaultdict
+from typing import Any, Optional
+
+# Upper bound of each bucket in seconds. One more bucket catches anything slower
+BUCKET_BOUNDS = (
+    50e-6,
+    100e-6,
+    250e-6,
+    500e-6,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    10e-3,
+    25e-3,
+    50e-3,
+    100e-3,
+    250e-3,
+    1.0,
+)
+
+
+class LatencyHistogram:
+    """Counts samples into fixed buckets, so recording never allocates"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """The upper bound of the bucket holding the given fraction of samples, capped at the slowest one"""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "p50_ms": round(self.percentile(0.5) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+def label(key: Any) -> str:
+    return str(getattr(key, "value", key))
+
+
+class IPCMetrics:
+    """
+    Latency of every bundle by the commands in it and by how the client
+    saw it end, i.e. success or timedOut, and counts of the errors the server
+    reported for each command. A command's latency is that of the whole
+    bundle it was sent in
+    """
+
+    def __init__(self, success: Any = "success"):
+        # Outcomes and statuses are kept as given, i.e. enum members, and
+        # only turned into strings when a snapshot is taken
+        self.success = success
+        self.by_command: defaultdict[str, LatencyHistogram] = defaultdict(
+            LatencyHistogram
+        )
+        self.by_outcome: defaultdict[Any, LatencyHistogram] = defaultdict(
+            LatencyHistogram
+        )
+        self.server_errors: defaultdict[tuple[str, Any], int] = defaultdict(int)
+
+    def record(
+        self,
+        names: list[str],
+        outcome: Any,
+        statuses: Optional[list],
+        seconds: float,
+    ):
+        self.by_outcome[outcome].record(seconds)
+        for name in names:
+            self.by_command[name].record(seconds)
+        for name, status in zip(names, statuses or ()):
+            if status != self.success:
+                self.server_errors[(name, status)] += 1
+
+    def snapshot(self) -> dict:
+        # Copying the items is a single step for the interpreter, so this
+        # is safe even while the worker thread adds a new key
+        return {
+            "by_outcome": {
+                label(outcome): histogram.summary()
+                for outcome, histogram in list(self.by_outcome.items())
+            },
+            "by_command": {
+                name: histogram.summary()
+                for name, histogram in list(self.by_command.items())
+            },
+            "server_errors": {
+                f"{name} {label(status)}": count
+                for (name, status), count in list(self.server_errors.items())
+            },
+        }
@@ -0,0 +1,221 @@
+"""
+Wire format shared by the Talon client and the screenreader addon servers.
+
+Every message is a frame: a 4 byte big endian length header followed by
+that many bytes of payload. The payload is either JSON or, if the server
+advertises it, a compact struct packed encoding. The NVDA addon keeps its own copy of this
+logic since it is packaged separately, so any change here must be mirrored there
+"""
+
+import json
+import socket
+import struct
+from typing import Optional
+
+FRAME_HEADER = struct.Struct(">I")
+# Guard against a corrupt header making us allocate an absurd buffer
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+class FrameTooLargeError(ValueError):
+    pass
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """Prefix a payload with its length so it can be read back incrementally"""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameTooLargeError(f"Frame of {len(payload)} bytes is too large")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+class FrameReader:
+    """
+    Incrementally reassembles frames from a stream socket.
+    Data is received straight into one reusable buffer and complete
+    frames are handed out as memoryviews over it, so no intermediate
+    bytes objects are created. A returned frame is only valid until the
+    next call on the reader
+    """
+
+    def __init__(self, initial_size: int = 4096):
+        self.buffer = bytearray(initial_size)
+        self.start = 0
+        self.end = 0
+
+    def _reserve(self, size: int):
+        """Make sure there is room for at least size more bytes after the data"""
+        if len(self.buffer) - self.end >= size:
+            return
+
+        pending = self.end - self.start
+        if pending + size <= len(self.buffer):
+            # Compact in place. Same length slice assignment never resizes the
+            # buffer so it is safe even if a caller still holds an old frame view
+            self.buffer[0:pending] = self.buffer[self.start : self.end]
+        else:
+            grown = bytearray(max(len(self.buffer) * 2, pending + size))
+            grown[0:pending] = self.buffer[self.start : self.end]
+            self.buffer = grown
+        self.start, self.end = 0, pending
+
+    def feed(self, data: bytes):
+        """Append already received data, mostly useful with non socket transports"""
+        self._reserve(len(data))
+        self.buffer[self.end : self.end + len(data)] = data
+        self.end += len(data)
+
+    def recv_from(self, sock: socket.socket, size: int = 4096) -> int:
+        """Receive once from the socket. Returns 0 if the peer closed the connection"""
+        self._reserve(size)
+        received = sock.recv_into(memoryview(self.buffer)[self.end :], size)
+        self.end += received
+        return received
+
+    def next_frame(self) -> Optional[memoryview]:
+        """Pop the next complete frame if one has fully arrived"""
+        pending = self.end - self.start
+        if pending < FRAME_HEADER.size:
+            return None
+
+        (length,) = FRAME_HEADER.unpack_from(self.buffer, self.start)
+        if length > MAX_FRAME_SIZE:
+            raise FrameTooLargeError(f"Frame of {length} bytes is too large")
+        if pending < FRAME_HEADER.size + length:
+            # Make sure the rest of the frame will fit without another copy
+            self._reserve(FRAME_HEADER.size + length - pending)
+            return None
+
+        payload_start = self.start + FRAME_HEADER.size
+        self.start = payload_start + length
+        frame = memoryview(self.buffer)[payload_start : self.start]
+        if self.start == self.end:
+            self.start = self.end = 0
+        return frame
+
+    def read_frame(self, sock: socket.socket) -> memoryview:
+        """Block until a full frame has been received from the socket"""
+        frame = self.next_frame()
+        while frame is None:
+            if self.recv_from(sock) == 0:
+                raise ConnectionResetError("Peer closed the connection mid frame")
+            frame = self.next_frame()
+        return frame
+
+
+# Servers that speak protocol version 2 or later advertise the encodings they
+# accept in their spec file. JSON is always supported as a fallback
+COMPACT_PROTOCOL_VERSION = 2
+JSON_ENCODING = "json"
+COMPACT_ENCODING = "compact"
+# Version 3 added request ids, so several bundles can be in flight on one
+# connection and answered in any order. Requests without an id are still
+# answered strictly in the order they were sent
+PIPELINED_PROTOCOL_VERSION = 3
+# Version 4 added a config generation to every response and push. It goes
+# up whenever a whitelisted setting changes, so reads can be cached until then
+GENERATION_PROTOCOL_VERSION = 4
+PROTOCOL_VERSION = GENERATION_PROTOCOL_VERSION
+
+# Compact frames start with a byte that can never begin a JSON document, so
+# either side can tell the two encodings apart from the first byte alone
+COMPACT_MAGIC = 0xC1
+COMPACT_VERSION = 1
+# Same as version 1, with a request id after the header
+COMPACT_PIPELINED_VERSION = 2
+# magic, version, number of commands
+COMPACT_HEADER = struct.Struct(">BBH")
+COMPACT_REQUEST_ID = struct.Struct(">I")
+COMPACT_COMMAND_ID = struct.Struct(">H")
+# status code, value tag
+COMPACT_RESULT = struct.Struct(">BB")
+COMPACT_INT = struct.Struct(">q")
+COMPACT_LENGTH = struct.Struct(">I")
+# Follows the results from servers that speak protocol version 4 or later
+COMPACT_GENERATION = struct.Struct(">Q")
+
+# Status results are sent as their index in this tuple
+COMPACT_STATUS_VALUES = (
+    "success",
+    "serverError",
+    "commandError",
+    "runtimeError",
+    "jsonEncodeError",
+)
+
+# Tags describing how each returned value is packed
+VALUE_NONE, VALUE_FALSE, VALUE_TRUE, VALUE_INT, VALUE_JSON = range(5)
+
+
+def is_compact(frame: memoryview) -> bool:
+    return len(frame) > 0 and frame[0] == COMPACT_MAGIC
+
+
+def encode_json_request(commands: list, request_id: Optional[int] = None) -> bytes:
+    if request_id is None:
+        return json.dumps(commands).encode()
+    return json.dumps({"id": request_id, "commands": commands}).encode()
+
+
+def encode_compact_request(
+    command_ids: list[int], request_id: Optional[int] = None
+) -> bytes:
+    """Pack a bundle of commands as their integer ids"""
+    version = COMPACT_VERSION if request_id is None else COMPACT_PIPELINED_VERSION
+    payload = bytearray(COMPACT_HEADER.pack(COMPACT_MAGIC, version, len(command_ids)))
+    if request_id is not None:
+        payload += COMPACT_REQUEST_ID.pack(request_id)
+    for command_id in command_ids:
+        payload += COMPACT_COMMAND_ID.pack(command_id)
+    return bytes(payload)
+
+
+def decode_compact_response(
+    frame: memoryview, status_table: tuple = COMPACT_STATUS_VALUES
+) -> tuple[Optional[int], list, list, Optional[int]]:
+    """
+    Unpack a compact response into its request id, its status results, its
+    returned values and the config generation. The id and generation are None
+    if the server didn't send them. Each status code is looked up in
+    status_table, so callers can pass a table of their own enum members to skip
+    converting the values again
+    """
+    magic, version, count = COMPACT_HEADER.unpack_from(frame, 0)
+    offset = COMPACT_HEADER.size
+    if magic != COMPACT_MAGIC or version not in (
+        COMPACT_VERSION,
+        COMPACT_PIPELINED_VERSION,
+    ):
+        raise ValueError(f"Unsupported compact frame version {version}")
+
+    request_id = None
+    if version == COMPACT_PIPELINED_VERSION:
+        (request_id,) = COMPACT_REQUEST_ID.unpack_from(frame, offset)
+        offset += COMPACT_REQUEST_ID.size
+
+    statuses, values = [], []
+    for _ in range(count):
+        status, tag = COMPACT_RESULT.unpack_from(frame, offset)
+        offset += COMPACT_RESULT.size
+        statuses.append(status_table[status])
+
+        if tag == VALUE_NONE:
+            values.append(None)
+        elif tag == VALUE_FALSE:
+            values.append(False)
+        elif tag == VALUE_TRUE:
+            values.append(True)
+        elif tag == VALUE_INT:
+            values.append(COMPACT_INT.unpack_from(frame, offset)[0])
+            offset += COMPACT_INT.size
+        elif tag == VALUE_JSON:
+            (length,) = COMPACT_LENGTH.unpack_from(frame, offset)
+            offset += COMPACT_LENGTH.size
+            values.append(json.loads(str(frame[offset : offset + length], "utf-8")))
+            offset += length
+        else:
+            raise ValueError(f"Unknown compact value tag {tag}")
+
+    generation = None
+    if len(frame) - offset >= COMPACT_GENERATION.size:
+        (generation,) = COMPACT_GENERATION.unpack_from(frame, offset)
+    return request_id, statuses, values, generation
@@ -1,7 +1,9 @@
 import enum
-from typing import Any, List, Literal, Optional, TypedDict
+from typing import Any, List, Literal, NotRequired, Optional, TypedDict, Union
 
-# Exhaustive list of commands that can be sent to the NVDA addon server
+# Commands that can be sent to the NVDA addon server. This is only used for type hints.
+# The addon generates its commands from its own dispatch table and advertises
+# them in the spec file, which is what the client validates against at runtime
 
 IPC_COMMAND = Literal[
     "disableSpeechInterruptForCharacters",
@@ -13,14 +15,30 @@ IPC_COMMAND = Literal[
     "disableSpeakTypedCharacters",
     "enableSpeakTypedCharacters",
     "getSpeakTypedCharacters",
+    "getConfig",
+    "setConfig",
+    "pushKeyboardState",
+    "popKeyboardState",
+    "subscribe",
+    "unsubscribe",
+    "getMetrics",
     "debug",
 ]
 
+# Commands that take arguments are sent as a list of the command followed by its
+# arguments, i.e. ["setConfig", "keyboard.speakTypedWords", False]
+IPC_REQUEST = Union[IPC_COMMAND, List[Any]]
+
 
 class ServerSpec(TypedDict):
     address: str
     port: str
     valid_commands: List[IPC_COMMAND]
+    # Dotted config paths that can be used with getConfig and setConfig
+    config_paths: List[str]
+    # Missing on servers older than protocol version 2, which only speak JSON
+    protocol_version: NotRequired[int]
+    encodings: NotRequired[List[str]]
 
 
 class ServerStatusResult(enum.Enum):
@@ -32,18 +50,40 @@ class ServerStatusResult(enum.Enum):
 
     @staticmethod
     def generate_from(value: str):
-        for member in ServerStatusResult:
-            if member.value == value:
-                return member
-        raise KeyError(f"Invalid status result: {value}")
+        try:
+            return STATUS_RESULTS_BY_VALUE[value]
+        except KeyError:
+            raise KeyError(f"Invalid status result: {value}")
+
+
+# Precomputed so decoding a status is a dict lookup instead of a scan of the enum
+STATUS_RESULTS_BY_VALUE = {member.value: member for member in ServerStatusResult}
 
 
 class IPCServerResponse(TypedDict):
+    # Echoes the id of pipelined requests, see ipc_protocol.py
+    id: NotRequired[int]
+    # Goes up whenever a setting changes. Missing before protocol version 4
+    generation: NotRequired[int]
     processedCommands: List[str]
     returnedValues: List[Any]
     statusResults: List[ServerStatusResult]
 
 
+class IPCPushMessage(TypedDict):
+    """
+    Sent unprompted to a connection that subscribed, i.e.
+    {"push": "config", "path": "keyboard.speakTypedWords", "value": False}
+    or {"push": "event", "event": "profileSwitch"}
+    """
+
+    push: Literal["config", "event"]
+    generation: NotRequired[int]
+    path: NotRequired[str]
+    value: NotRequired[Any]
+    event: NotRequired[str]
+
+
 class IPCClientResponse(enum.Enum):
     NO_RESPONSE = "noResponse"
     TIMED_OUT = "timedOut"
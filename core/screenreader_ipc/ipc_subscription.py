@@ -0,0 +1,155 @@
+"""
+Keeps a local mirror of screenreader settings up to date from the pushes
+sent by the addon server, so Talon doesn't have to poll or ask for them.
+This doesn't import talon, so it can be used outside of it, i.e. in benchmarks
+"""
+
+import json
+import socket
+import threading
+from typing import Any, Callable, Optional
+
+from .ipc_protocol import FrameReader, encode_frame
+from .ipc_schema import IPCPushMessage
+
+# Returned by the mirror for settings it doesn't know
+MISSING = object()
+# Backoff between attempts to subscribe while the server is unavailable
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 10.0
+
+
+class ScreenreaderMirror:
+    """
+    The latest value of every subscribed setting. Only the subscription
+    thread writes to it, and it is cleared as soon as the subscription drops,
+    so a stale value is never returned
+    """
+
+    def __init__(self):
+        self.values: dict[str, Any] = {}
+
+    def get(self, path: str, default: Any = MISSING) -> Any:
+        return self.values.get(path, default)
+
+    def replace(self, values: dict[str, Any]):
+        # Swap the whole dict so readers never see a half filled mirror
+        self.values = dict(values)
+
+    def update(self, path: str, value: Any):
+        self.values[path] = value
+
+    def clear(self):
+        self.values = {}
+
+
+class SubscriptionChannel:
+    """
+    A second long lived connection to the addon server that only receives
+    pushes. It is kept apart from the request connection so a push can never
+    be mistaken for the response to a request. Listeners are called on the
+    subscription thread with every push, as well as "connected" and
+    "disconnected" events when the subscription starts and drops
+    """
+
+    def __init__(self, endpoint, mirror: ScreenreaderMirror, timeout: float):
+        # Anything with get() and invalidate() like the client's EndpointCache
+        self.endpoint = endpoint
+        self.mirror = mirror
+        self.timeout = timeout
+        self.listeners: list[Callable[[IPCPushMessage], None]] = []
+        self.connected = False
+        self.sock: Optional[socket.socket] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def add_listener(self, callback: Callable[[IPCPushMessage], None]):
+        self.listeners.append(callback)
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self._run, name="screenreader-subscription", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        # Closing the socket unblocks the thread if it is waiting for a push
+        sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _notify(self, message: IPCPushMessage):
+        for listener in self.listeners:
+            try:
+                listener(message)
+            except Exception as error:
+                print(f"Error in screenreader subscription listener: {error}")
+
+    def _subscribe(self, ip: str, port: int) -> FrameReader:
+        self.sock = socket.create_connection((ip, port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = FrameReader()
+
+        # Subscribing without topics means every setting and event
+        self.sock.sendall(encode_frame(json.dumps([["subscribe"]]).encode()))
+        response = json.loads(str(reader.read_frame(self.sock), "utf-8"))
+        if response["statusResults"] != ["success"]:
+            raise ValueError(f"Subscription refused: {response['statusResults']}")
+        self.mirror.replace(response["returnedValues"][0])
+
+        # Pushes can be hours apart, so only the subscription itself has a deadline
+        self.sock.settimeout(None)
+        return reader
+
+    def _handle_push(self, message: IPCPushMessage):
+        if message["push"] == "config":
+            self.mirror.update(message["path"], message["value"])
+        self._notify(message)
+
+    def _run(self):
+        delay = RECONNECT_MIN_DELAY
+        while not self.stopped.is_set():
+            try:
+                ip, port, valid_commands = self.endpoint.get()
+                # Older addons can't push, so there is nothing to subscribe to
+                if "subscribe" not in valid_commands:
+                    raise ValueError("The addon server does not support subscriptions")
+                reader = self._subscribe(ip, int(port))
+            except (OSError, ValueError, KeyError):
+                self._close()
+                self.endpoint.invalidate()
+                self.stopped.wait(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+
+            delay = RECONNECT_MIN_DELAY
+            self.connected = True
+            self._notify({"push": "event", "event": "connected"})
+            try:
+                while True:
+                    frame = reader.read_frame(self.sock)
+                    self._handle_push(json.loads(str(frame, "utf-8")))
+            except (OSError, ValueError):
+                # The server stopped or restarted
+                pass
+            finally:
+                self._close()
+                self.connected = False
+                self.mirror.clear()
+                self.endpoint.invalidate()
+                self._notify({"push": "event", "event": "disconnected"})
+
+    def _close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
@@ -0,0 +1,116 @@
+"""
+Timeouts for the IPC client that follow how fast the server actually is,
+instead of one fixed number that is too long when the screenreader hangs
+and too short when the machine is busy. Both classes are only used from the
+IPC worker thread. This doesn't import talon, so it can be used outside of it
+"""
+
+import time
+from typing import Callable, Optional
+
+# The same smoothing factors TCP uses to estimate its retransmission timeout
+RTT_GAIN = 1 / 8
+RTTVAR_GAIN = 1 / 4
+RTTVAR_WEIGHT = 4
+
+
+class RoundTripEstimator:
+    """
+    Tracks a smoothed round trip time and how much it varies, and derives
+    the timeout from both, like TCP does. Every timeout doubles it until the
+    next response, so a server that is just slow gets more time on each try
+    """
+
+    def __init__(self, initial: float, minimum: float, maximum: float):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        self.backoff = 1
+
+    def sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += RTTVAR_GAIN * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += RTT_GAIN * (rtt - self.srtt)
+        self.backoff = 1
+
+    def timed_out(self):
+        if self.timeout() < self.maximum:
+            self.backoff *= 2
+
+    def timeout(self) -> float:
+        if self.srtt is None:
+            estimate = self.initial
+        else:
+            estimate = self.srtt + RTTVAR_WEIGHT * self.rttvar
+        return min(self.maximum, max(self.minimum, estimate) * self.backoff)
+
+    def report(self) -> str:
+        if self.srtt is None:
+            return f"No round trips yet, timeout {self.timeout() * 1000:.0f}ms"
+        return (
+            f"Smoothed round trip {self.srtt * 1000:.3f}ms, "
+            f"variation {self.rttvar * 1000:.3f}ms, "
+            f"timeout {self.timeout() * 1000:.0f}ms"
+        )
+
+
+class CircuitBreaker:
+    """
+    Fails requests straight away for a cool down after the server times out
+    several times in a row, instead of making every phrase wait for the full
+    timeout. Once the cool down is over it is half open: only the next request
+    is let through as a probe, and everything else still fails straight away.
+    The probe succeeding closes it, and it timing out opens it again. If the
+    probe ends some other way, i.e. the connection is refused, another is let
+    through after another cool down
+    """
+
+    def __init__(
+        self,
+        threshold: int,
+        cool_down: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.threshold = threshold
+        self.cool_down = cool_down
+        self.clock = clock
+        self.failures = 0
+        self.open_until = 0.0
+        # True while the one request let through after a cool down is in flight
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.failures < self.threshold:
+            return True
+        now = self.clock()
+        if now < self.open_until:
+            return False
+        self.probing = True
+        self.open_until = now + self.cool_down
+        return True
+
+    def succeeded(self):
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def timed_out(self):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.threshold:
+            self.open_until = self.clock() + self.cool_down
+
+    def report(self) -> str:
+        if self.failures < self.threshold:
+            return f"Closed, {self.failures} timeouts in a row"
+        remaining = self.open_until - self.clock()
+        if remaining <= 0:
+            return "Half open, letting the next request through"
+        if self.probing:
+            return f"Half open, waiting on one request for up to {remaining:.1f}s"
+        return f"Failing fast for another {remaining:.1f}s"
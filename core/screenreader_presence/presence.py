@@ -0,0 +1,44 @@
+from typing import Callable
+
+from talon import Context, app, cron
+
+from ...lib.running import replace_running
+from .presence_monitor import POLL_MAX_INTERVAL, PresenceMonitor, ProbeResult
+
+# Every *_running tag is set here, from the one monitor
+ctx = Context()
+
+# The tag for each screenreader the monitor knows about
+RUNNING_TAGS: dict[str, str] = {}
+
+
+def apply_running_tags(present: frozenset[str]):
+    ctx.tags = sorted(RUNNING_TAGS[name] for name in present)
+
+
+def on_presence_change(present: frozenset[str]):
+    # Tags have to be changed on Talon's main thread
+    cron.after("0ms", lambda: apply_running_tags(present))
+
+
+presence_monitor = PresenceMonitor(on_presence_change)
+
+
+def watch_screenreader(
+    name: str,
+    tag: str,
+    probe: Callable[[], ProbeResult],
+    max_interval: float = POLL_MAX_INTERVAL,
+):
+    """
+    Keep a screenreader's running tag up to date. The probe is called on the
+    monitor's thread and returns its pid if known, or just whether it is running
+    """
+    RUNNING_TAGS[name] = tag
+    presence_monitor.add(name, probe, max_interval)
+
+
+# Stops the monitor from before a reload, which would set tags on a context
+# that no longer exists
+replace_running("screenreader_presence.monitor", presence_monitor)
+app.register("ready", presence_monitor.start)
@@ -0,0 +1,271 @@
+"""
+Works out which screenreaders are running from the signals that tell us
+when they start or stop, and only polls where there are none, backing off
+while nothing changes. This doesn't import talon, so it can be tested outside
+of it, i.e. against a fake screenreader process
+"""
+
+import os
+import select
+import socket
+import threading
+import time
+from typing import Callable, Optional, Union
+
+# Seconds between probes of a screenreader that nothing tells us about. The
+# interval doubles every time nothing changed, up to the maximum
+POLL_MIN_INTERVAL = 0.5
+POLL_MAX_INTERVAL = 8.0
+# The most a screenreader with no signal at all can go stale for, which is
+# how often they were all checked before the monitor
+POLL_UNSIGNALLED_MAX_INTERVAL = 3.0
+
+# A probe returns the pid of the screenreader if it knows it, or else just
+# whether it is running
+ProbeResult = Union[bool, int, None]
+
+
+def open_pidfd(pid: int) -> Optional[int]:
+    """A descriptor that becomes readable once the process exits, on Linux 5.3 and later"""
+    if not hasattr(os, "pidfd_open"):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        # The process already exited, or the kernel is too old
+        return None
+
+
+def find_process(name: str) -> Optional[int]:
+    """The pid of a running process with the given name, by scanning /proc"""
+    try:
+        entries = os.scandir("/proc")
+    except OSError:
+        return None
+    with entries:
+        for entry in entries:
+            if not entry.name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry.name}/comm") as f:
+                    if f.read().rstrip("\n") == name:
+                        return int(entry.name)
+            except OSError:
+                # Exited while we were scanning
+                continue
+    return None
+
+
+class CachedProbe:
+    """
+    Remembers what a probe returned for a short time, so the several checks
+    in one phrase only cost one real query. Anything that suggests the answer
+    changed should invalidate it
+    """
+
+    def __init__(
+        self,
+        probe: Callable[[], ProbeResult],
+        ttl: Callable[[], float],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.probe = probe
+        self.ttl = ttl
+        self.clock = clock
+        # The answer and when it expires, replaced together so another
+        # thread never sees one without the other
+        self.cached: Optional[tuple[ProbeResult, float]] = None
+        self.queries = 0
+
+    def __call__(self) -> ProbeResult:
+        cached = self.cached
+        if cached is not None and self.clock() < cached[1]:
+            return cached[0]
+        return self.refresh()
+
+    def refresh(self) -> ProbeResult:
+        """Query the probe now, and cache the answer"""
+        self.queries += 1
+        result = self.probe()
+        self.cached = (result, self.clock() + self.ttl())
+        return result
+
+    def invalidate(self):
+        self.cached = None
+
+
+class ReaderState:
+    def __init__(
+        self, name: str, probe: Callable[[], ProbeResult], max_interval: float
+    ):
+        self.name = name
+        self.probe = probe
+        self.max_interval = max_interval
+        self.present = False
+        self.pid: Optional[int] = None
+        self.pidfd: Optional[int] = None
+        # A process that exited can still be found until its parent reaps it
+        self.exited_pid: Optional[int] = None
+        # Set while something else, i.e. an IPC subscription, will tell us
+        # when the screenreader stops
+        self.watched = False
+        self.interval = POLL_MIN_INTERVAL
+        self.next_poll = 0.0
+
+    def polled(self) -> bool:
+        """Running screenreaders we will hear about stopping don't need polling"""
+        return not (self.present and (self.pidfd is not None or self.watched))
+
+    def close_pidfd(self):
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+
+
+class PresenceMonitor:
+    """
+    Probes each screenreader on its own thread whenever a signal says it may
+    have started or stopped: notify() for things like a spec file appearing,
+    set_watched() for a connection that drops when it stops, and process exit
+    through a pidfd when the probe knows the pid. on_change is called on that
+    thread with the names of the running screenreaders whenever they change
+    """
+
+    def __init__(
+        self,
+        on_change: Callable[[frozenset[str]], None],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.on_change = on_change
+        self.clock = clock
+        self.readers: dict[str, ReaderState] = {}
+        self.notified: set[str] = set()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        # Writing to this socket pair wakes the thread up to probe right away
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        self.wakeup_sender.setblocking(False)
+
+    def add(
+        self,
+        name: str,
+        probe: Callable[[], ProbeResult],
+        max_interval: float = POLL_MAX_INTERVAL,
+    ):
+        """Cheap probes can pass a shorter max_interval so starts are noticed sooner"""
+        with self.lock:
+            self.readers[name] = ReaderState(name, probe, max_interval)
+        self.notify(name)
+
+    def notify(self, name: Optional[str] = None):
+        """Something suggests a screenreader, or any of them if no name is given, started or stopped"""
+        with self.lock:
+            self.notified.update([name] if name else self.readers)
+        self._wake()
+
+    def set_watched(self, name: str, watched: bool):
+        """Note whether something else will tell us when the screenreader stops"""
+        with self.lock:
+            self.readers[name].watched = watched
+            self.notified.add(name)
+        self._wake()
+
+    def present(self) -> frozenset[str]:
+        return frozenset(
+            name for name, reader in list(self.readers.items()) if reader.present
+        )
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self._run, name="screenreader-presence", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        """Let the thread exit, i.e. when Talon reloads, closing every pidfd"""
+        self.stopped.set()
+        self._wake()
+        # Otherwise the thread closes them on its way out
+        if self.thread is None or not self.thread.is_alive():
+            self._close_pidfds()
+
+    def _close_pidfds(self):
+        for reader in list(self.readers.values()):
+            reader.close_pidfd()
+
+    def _wake(self):
+        try:
+            self.wakeup_sender.send(b"\0")
+        except BlockingIOError:
+            # Plenty of wakeups are already waiting to be read
+            pass
+
+    def _probe(self, reader: ReaderState) -> bool:
+        """Returns true if the screenreader started or stopped"""
+        try:
+            result = reader.probe()
+        except Exception as error:
+            print(f"Error checking if {reader.name} is running: {error}")
+            result = False
+
+        # bool is an int too, so only a real int is a pid
+        pid = result if type(result) is int else None
+        if pid is not None and pid == reader.exited_pid:
+            pid = result = None
+        if pid != reader.pid:
+            reader.close_pidfd()
+            reader.pid = pid
+            if pid is not None:
+                reader.pidfd = open_pidfd(pid)
+
+        present = result is not None and result is not False
+        changed = present != reader.present
+        reader.present = present
+        # Something happened, so it is worth looking again soon
+        if changed:
+            reader.interval = POLL_MIN_INTERVAL
+        else:
+            reader.interval = min(reader.interval * 2, reader.max_interval)
+        reader.next_poll = self.clock() + reader.interval
+        return changed
+
+    def _step(self):
+        readers = list(self.readers.values())
+        polled = [reader.next_poll for reader in readers if reader.polled()]
+        timeout = max(0.0, min(polled) - self.clock()) if polled else None
+        pidfds = [reader.pidfd for reader in readers if reader.pidfd is not None]
+
+        readable, _, _ = select.select([self.wakeup_receiver, *pidfds], [], [], timeout)
+        try:
+            while self.wakeup_receiver.recv(1024):
+                pass
+        except BlockingIOError:
+            pass
+
+        with self.lock:
+            notified, self.notified = self.notified, set()
+            # Picks up readers added while we waited, which are always notified
+            readers = list(self.readers.values())
+        now = self.clock()
+        exited = [r for r in readers if r.pidfd is not None and r.pidfd in readable]
+        for reader in exited:
+            reader.exited_pid = reader.pid
+        due = [
+            reader
+            for reader in readers
+            if reader.name in notified
+            or reader in exited
+            or (reader.polled() and reader.next_poll <= now)
+        ]
+        if any([self._probe(reader) for reader in due]):
+            self.on_change(self.present())
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self._step()
+        self._close_pidfds()
@@ -0,0 +1,213 @@
+"""
+Finds screenreader processes on Linux without reading every /proc entry on
+every check. This doesn't import talon, so it can be tested outside of it
+"""
+
+import collections
+import os
+import select
+import socket
+import struct
+import threading
+from typing import Callable, Optional
+
+# Linux's process events connector, see include/uapi/linux/cn_proc.h
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+PROC_CN_MCAST_LISTEN = 1
+NLMSG_DONE = 3
+PROC_EVENT_EXEC = 0x00000002
+CAP_NET_ADMIN = 12
+NLMSG_HEADER = struct.Struct("=IHHII")
+CN_MSG_HEADER = struct.Struct("=IIIIHH")
+# what, cpu and timestamp, followed by the pid and tgid for an exec
+PROC_EVENT_EXEC_DATA = struct.Struct("=IIQII")
+
+
+def read_comm(pid: int, proc: str = "/proc") -> Optional[str]:
+    """The name of a process, or None if it has exited"""
+    try:
+        with open(f"{proc}/{pid}/comm") as f:
+            return f.read().rstrip("\n")
+    except OSError:
+        return None
+
+
+class ProcessIndex:
+    """
+    Finds a process by name, reading the name of each pid at most twice.
+    The kernel reports the last pid it handed out in /proc/loadavg, so a
+    check where no process has started since the last one is a single small
+    read no matter how many processes are running. Otherwise only the new
+    pids are read. Each pid is read again on the next check before it is
+    trusted, since a child has its parent's name until it calls exec
+    """
+
+    def __init__(self, name: str, proc: str = "/proc"):
+        self.name = name
+        self.proc = proc
+        self.last_pid: Optional[str] = None
+        # Pids that had another name on two checks in a row
+        self.known: set[int] = set()
+        # Pids that have only been checked once
+        self.young: set[int] = set()
+        self.found: Optional[int] = None
+        # Pids we were told about from another thread, checked on the next find
+        self.offered: collections.deque[int] = collections.deque()
+        # How many names have been read, to measure how much work checks take
+        self.reads = 0
+
+    def _comm(self, pid: int) -> Optional[str]:
+        self.reads += 1
+        return read_comm(pid, self.proc)
+
+    def _latest_pid(self) -> Optional[str]:
+        try:
+            with open(f"{self.proc}/loadavg") as f:
+                return f.read().split()[-1]
+        except (OSError, IndexError):
+            return None
+
+    def offer(self, pid: int):
+        """
+        Check a pid on the next find, even if we already know it. A process
+        event can tell us about an exec that didn't start a new process
+        """
+        self.offered.append(pid)
+
+    def find(self) -> Optional[int]:
+        while self.offered:
+            pid = self.offered.popleft()
+            if self._comm(pid) == self.name:
+                self.found = pid
+        if self.found is not None:
+            if self._comm(self.found) == self.name:
+                return self.found
+            self.found = None
+
+        latest_pid = self._latest_pid()
+        new: set[int] = set()
+        # Without a latest pid to compare, i.e. in a container, always rescan
+        if latest_pid is None or latest_pid != self.last_pid:
+            self.last_pid = latest_pid
+            pids = {int(name) for name in os.listdir(self.proc) if name.isdigit()}
+            # Forget pids that exited, so a reused one is checked again
+            self.known &= pids
+            new = pids - self.known - self.young
+
+        young, self.young = self.young, set()
+        for pid in new | young:
+            comm = self._comm(pid)
+            if comm is None:
+                continue
+            if comm == self.name:
+                self.found = pid
+            elif pid in young:
+                self.known.add(pid)
+            else:
+                self.young.add(pid)
+        return self.found
+
+
+def can_listen_for_process_events() -> bool:
+    """Listening to the process events connector needs CAP_NET_ADMIN"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("CapEff:"):
+                    return bool(int(line.split()[1], 16) & (1 << CAP_NET_ADMIN))
+    except (OSError, ValueError):
+        pass
+    return False
+
+
+class ExecListener:
+    """
+    Calls back with the pid of every process that calls exec, as the kernel
+    reports it through the netlink process events connector. Only works with
+    CAP_NET_ADMIN, so it is an optional speed up on top of polling
+    """
+
+    def __init__(self, callback: Callable[[int], None]):
+        self.callback = callback
+        self.sock: Optional[socket.socket] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        # Closing the socket doesn't wake a thread blocked reading it, this does
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+
+    def start(self) -> bool:
+        """Returns false if process events aren't available"""
+        if not can_listen_for_process_events():
+            self.stop()
+            return False
+        try:
+            self.sock = socket.socket(
+                socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR
+            )
+            self.sock.bind((0, CN_IDX_PROC))
+            op = struct.pack("=I", PROC_CN_MCAST_LISTEN)
+            message = (
+                NLMSG_HEADER.pack(
+                    NLMSG_HEADER.size + CN_MSG_HEADER.size + len(op),
+                    NLMSG_DONE,
+                    0,
+                    0,
+                    0,
+                )
+                + CN_MSG_HEADER.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(op), 0)
+                + op
+            )
+            self.sock.send(message)
+        except (OSError, AttributeError):
+            # Not Linux, or the connector isn't built into the kernel
+            self.stop()
+            return False
+
+        self.thread = threading.Thread(
+            target=self._run, name="screenreader-exec-events", daemon=True
+        )
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop listening, i.e. when Talon reloads the file that started us"""
+        self.stopped.set()
+        try:
+            self.wakeup_sender.send(b"\0")
+        except OSError:
+            pass
+        # Otherwise the thread closes everything on its way out
+        if self.thread is None or not self.thread.is_alive():
+            self._close()
+
+    def _close(self):
+        sock, self.sock = self.sock, None
+        if sock:
+            sock.close()
+        self.wakeup_receiver.close()
+        self.wakeup_sender.close()
+
+    def _run(self):
+        offset = NLMSG_HEADER.size + CN_MSG_HEADER.size
+        try:
+            while not self.stopped.is_set():
+                readable, _, _ = select.select(
+                    [self.sock, self.wakeup_receiver], [], []
+                )
+                if self.sock not in readable:
+                    continue
+                data = self.sock.recv(4096)
+                if len(data) < offset + PROC_EVENT_EXEC_DATA.size:
+                    continue
+                what, _, _, _, tgid = PROC_EVENT_EXEC_DATA.unpack_from(data, offset)
+                if what == PROC_EVENT_EXEC:
+                    try:
+                        self.callback(tgid)
+                    except Exception as error:
+                        print(f"Error handling process event: {error}")
+        except OSError as error:
+            print(f"Stopped listening for process events: {error}")
+        finally:
+            self._close()
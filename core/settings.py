@@ -2,6 +2,8 @@ from typing import Literal
 
 from talon import Module
 
+from .text_normalization.text_normalization import PunctuationLevel
+
 mod = Module()
 
 mod.setting(
@@ -54,6 +56,13 @@ mod.setting(
     desc="If True, starts the screenreader on Talon startup",
 )
 
+mod.setting(
+    "nvda_running_ttl",
+    type=float,
+    default=1.0,
+    desc="Seconds to trust the last check of whether NVDA is running, so one phrase only asks NVDA once",
+)
+
 mod.setting(
     "nvda_key",
     type=str,
@@ -61,6 +70,34 @@ mod.setting(
     desc="The key that is used as the NVDA key",
 )
 
+mod.setting(
+    "echo_context_debounce",
+    type=float,
+    default=0.3,
+    desc="Seconds to wait for the app and window title to settle before echoing them together",
+)
+
+mod.setting(
+    "tts_punctuation",
+    type=PunctuationLevel,
+    default="off",
+    desc="How much punctuation the tts voice says: off, none, some, most or all",
+)
+
+mod.setting(
+    "tts_shorten_links",
+    type=bool,
+    default=False,
+    desc="If True, the tts voice only says the site of a link",
+)
+
+mod.setting(
+    "tts_shorten_numbers",
+    type=bool,
+    default=False,
+    desc="If True, the tts voice says how many digits a long number has instead of every digit",
+)
+
 mod.setting(
     "speak_errors",
     type=bool,
@@ -99,6 +136,13 @@ mod.setting(
     desc="The key that is used as the Orca modifier key",
 )
 
+mod.setting(
+    "piper_cache_disk_mb",
+    type=int,
+    default=64,
+    desc="How much synthesized piper speech to keep on disk across restarts, 0 to keep none",
+)
+
 mod.setting("announce_mode_updates", type=bool, default=True)
 
 mod.setting("addon_debug", type=bool, default=False)
@@ -0,0 +1,227 @@
+"""
+A client for speech-dispatcher's SSIP protocol that keeps one socket open,
+instead of starting spd-say for every utterance and killing it to cancel.
+This doesn't import talon, so it can be tested against a fake server
+"""
+
+import os
+import select
+import socket
+import threading
+from typing import Optional
+
+# How long to wait for speech-dispatcher to answer a command
+SSIP_TIMEOUT = 1.0
+
+SSIP_CLIENT_NAME = "user:talon:sightless"
+
+
+class SSIPError(Exception):
+    """speech-dispatcher refused a command, or couldn't be reached"""
+
+
+class SSIPNoReply(SSIPError):
+    """
+    A command was sent but its reply never came, so speech-dispatcher may
+    still carry it out. Sending it again could say the same thing twice
+    """
+
+
+def default_address() -> str:
+    """
+    Where speech-dispatcher listens, following the same rules as its own
+    clients: SPEECHD_ADDRESS if set, otherwise its socket in the runtime dir
+    """
+    address = os.environ.get("SPEECHD_ADDRESS")
+    if address:
+        return address
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or os.path.expanduser("~/.cache")
+    path = os.path.join(runtime_dir, "speech-dispatcher", "speechd.sock")
+    return f"unix_socket:{path}"
+
+
+def open_socket(address: str) -> socket.socket:
+    """Connect to an address like unix_socket:/path or inet_socket:host:port"""
+    method, _, rest = address.partition(":")
+    if method == "unix_socket":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        target = rest
+    elif method == "inet_socket":
+        host, _, port = rest.rpartition(":")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        target = (host or "127.0.0.1", int(port or 6560))
+    else:
+        raise SSIPError(f"Unknown speech-dispatcher address '{address}'")
+    sock.settimeout(SSIP_TIMEOUT)
+    try:
+        sock.connect(target)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def escape_text(text: str) -> bytes:
+    """
+    The body of a SPEAK command. A line with just a dot ends the message, so
+    lines starting with a dot get another one, like SMTP
+    """
+    lines = text.replace("\r\n", "\n").split("\n")
+    escaped = ["." + line if line.startswith(".") else line for line in lines]
+    return ("\r\n".join(escaped) + "\r\n.\r\n").encode("utf-8")
+
+
+class SSIPClient:
+    """
+    One connection to speech-dispatcher, opened on first use and again
+    whenever it drops. Rate and volume are only sent when they change, since
+    the server remembers them for the connection. Cancelling is a single write:
+    its reply is read before the next command instead of waited for
+    """
+
+    def __init__(self, address: Optional[str] = None):
+        self.address = address
+        self.sock: Optional[socket.socket] = None
+        self.buffer = b""
+        self.lock = threading.Lock()
+        # What the server has for this connection, so we can skip resending it
+        self.rate: Optional[int] = None
+        self.volume: Optional[int] = None
+        # Commands written whose replies haven't been read yet
+        self.unread_replies = 0
+        self.connects = 0
+        self.writes = 0
+
+    def speak(self, text: str, rate: int, volume: int):
+        """Queue text to be spoken, with rate and volume from -100 to 100"""
+        with self.lock:
+            self._with_reconnect(self._speak, text, rate, volume)
+
+    def warm_up(self, rate: int, volume: int):
+        """Connect and set the voice now, so the next utterance is just a SPEAK"""
+        with self.lock:
+            self._with_reconnect(self._set_voice, rate, volume)
+
+    def cancel(self):
+        """Stop the current message and anything queued after it"""
+        with self.lock:
+            if self.sock is None:
+                # Nothing we said can still be playing
+                return
+            try:
+                self._write(b"CANCEL self\r\n")
+                self.unread_replies += 1
+            except OSError:
+                self._close()
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                try:
+                    self._write(b"QUIT\r\n")
+                except OSError:
+                    pass
+            self._close()
+
+    def _with_reconnect(self, fn, *args):
+        # The server may have dropped a connection that was open, i.e. when
+        # speech-dispatcher exits after being idle. Only failing to connect or
+        # to write is tried again, since then nothing reached the server
+        if self.sock is not None and self._dropped():
+            self._close()
+        reconnected = self.sock is None
+        while True:
+            try:
+                if self.sock is None:
+                    self._connect()
+                return fn(*args)
+            except (OSError, SSIPError) as error:
+                self._close()
+                if reconnected or isinstance(error, SSIPError):
+                    raise
+                reconnected = True
+
+    def _dropped(self) -> bool:
+        """
+        Whether the server closed the connection while we weren't reading.
+        Replies that already arrived, i.e. to a cancel, are kept for later
+        """
+        try:
+            while select.select([self.sock], [], [], 0)[0]:
+                data = self.sock.recv(4096)
+                if not data:
+                    return True
+                self.buffer += data
+        except OSError:
+            return True
+        return False
+
+    def _connect(self):
+        self.sock = open_socket(self.address or default_address())
+        self.connects += 1
+        self._command(f"SET self CLIENT_NAME {SSIP_CLIENT_NAME}")
+
+    def _close(self):
+        sock, self.sock = self.sock, None
+        if sock is not None:
+            sock.close()
+        self.buffer = b""
+        self.rate = self.volume = None
+        self.unread_replies = 0
+
+    def _speak(self, text: str, rate: int, volume: int):
+        self._set_voice(rate, volume)
+        self._command("SPEAK")
+        self._write(escape_text(text))
+        self._read_reply()
+
+    def _set_voice(self, rate: int, volume: int):
+        if rate != self.rate:
+            self._command(f"SET self RATE {rate}")
+            self.rate = rate
+        if volume != self.volume:
+            self._command(f"SET self VOLUME {volume}")
+            self.volume = volume
+
+    def _write(self, data: bytes):
+        self.sock.sendall(data)
+        self.writes += 1
+
+    def _command(self, command: str) -> list[str]:
+        self._write(command.encode("utf-8") + b"\r\n")
+        return self._read_reply()
+
+    def _read_line(self) -> bytes:
+        while b"\r\n" not in self.buffer:
+            try:
+                data = self.sock.recv(4096)
+            except OSError as error:
+                raise SSIPNoReply(f"No reply from speech-dispatcher: {error}")
+            if not data:
+                raise SSIPNoReply("speech-dispatcher closed the connection")
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b"\r\n", 1)
+        return line
+
+    def _read_reply(self) -> list[str]:
+        """
+        Read the reply to the last command, after any we skipped. A reply is
+        lines of 'NNN-text' ending with one 'NNN text', where 2xx and 3xx
+        codes are success
+        """
+        while True:
+            lines = []
+            while True:
+                line = self._read_line().decode("utf-8", "replace")
+                lines.append(line[4:])
+                if line[3:4] != "-":
+                    break
+            if self.unread_replies == 0:
+                break
+            # Only cancels are left unread, and failing to cancel doesn't matter
+            self.unread_replies -= 1
+
+        if line[:1] not in ("2", "3"):
+            raise SSIPError(f"speech-dispatcher error: {line}")
+        return lines
@@ -0,0 +1,265 @@
+"""
+Orders everything we say by how important it is, and hands it to the tts
+engine one utterance at a time from a single worker thread, so whoever asks
+to speak never waits for the engine. This doesn't import talon, so it can be
+tested with a fake engine
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+# Lower is more important. An utterance that interrupts only cuts off what is
+# as important or less, so i.e. echoing a phrase never cuts off an error
+PRIORITIES = {"error": 0, "mode": 1, "echo": 2, "context": 3}
+
+# How often to check if the engine finished speaking, when it can tell us and
+# something is waiting to be said after it
+SPEAKING_POLL_INTERVAL = 0.02
+
+# What an engine returns from speaking: a check for whether it is still
+# speaking, or None if it can't tell, i.e. when it queues speech itself
+StillSpeaking = Optional[Callable[[], bool]]
+
+
+class Utterance:
+    def __init__(
+        self, text: str, priority: str, sequence: int, key: Optional[str] = None
+    ):
+        self.text = text
+        self.priority = priority
+        self.rank = PRIORITIES[priority]
+        self.sequence = sequence
+        # A newer utterance with the same key replaces this one until it starts
+        self.key = key
+
+    def __lt__(self, other: "Utterance") -> bool:
+        return (self.rank, self.sequence) < (other.rank, other.sequence)
+
+    def __repr__(self) -> str:
+        return f"Utterance({self.text!r}, {self.priority!r})"
+
+
+class SpeechQueue:
+    """
+    Utterances wait here until the engine is free, most important first and
+    then in the order they were submitted. The worker thread is the only one
+    that calls the engine. Everything it does is in step(), so tests can call
+    that directly instead of starting the thread, with a fake clock for
+    anything delayed
+    """
+
+    def __init__(
+        self,
+        speak: Callable[[str], StillSpeaking],
+        cancel: Callable[[], None],
+        clock: Callable[[], float] = time.monotonic,
+        interrupt: Optional[Callable[[], None]] = None,
+    ):
+        self.speak = speak
+        self.cancel_engine = cancel
+        # Cuts off what is being said for something more important. Only
+        # cancel() has to silence the engine, so an engine that also speaks
+        # for someone else, i.e. a screen reader, can leave that alone
+        self.interrupt_engine = interrupt or cancel
+        self.clock = clock
+        self.queue: list[Utterance] = []
+        # Delayed utterances by key, with whether they interrupt and when they
+        # are due. They only join the queue once nothing newer replaced them
+        self.delayed: dict[str, tuple[Utterance, bool, float]] = {}
+        self.sequence = itertools.count()
+        # What the engine was last asked to say, and how to check if it still is
+        self.current: Optional[Utterance] = None
+        self.still_speaking: StillSpeaking = None
+        # The rank of the most important interrupt since the last step, or -1
+        # to cancel whatever is speaking no matter how important
+        self.preempt: Optional[int] = None
+        # Functions to run on the worker thread, i.e. because the engine has to
+        # be used from the thread that created it
+        self.calls: list[Callable[[], None]] = []
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = False
+
+    def submit(
+        self,
+        text: str,
+        priority: str = "echo",
+        interrupt: bool = True,
+        key: Optional[str] = None,
+        delay: float = 0,
+    ):
+        """
+        Queue text to be said. If it interrupts, anything queued that is as
+        important or less is dropped, and so is what is being said, unless
+        that is more important. Anything with the same key that hasn't started
+        yet is replaced. With a key and a delay, it waits that long for
+        something newer with the same key, and interrupts once it is due
+        """
+        with self.condition:
+            utterance = Utterance(text, priority, next(self.sequence), key)
+            if key is not None:
+                self.delayed.pop(key, None)
+                # One that was due but hasn't started is as stale as one waiting
+                self._drop_key(key)
+            if key is not None and delay > 0:
+                self.delayed[key] = (utterance, interrupt, self.clock() + delay)
+            else:
+                self._enqueue(utterance, interrupt)
+            self.condition.notify()
+
+    def _enqueue(self, utterance: Utterance, interrupt: bool):
+        if interrupt:
+            queue = [queued for queued in self.queue if queued.rank < utterance.rank]
+            if len(queue) < len(self.queue):
+                heapq.heapify(queue)
+                self.queue = queue
+            if self.preempt is None or utterance.rank < self.preempt:
+                self.preempt = utterance.rank
+        heapq.heappush(self.queue, utterance)
+
+    def _drop_key(self, key: str):
+        queue = [queued for queued in self.queue if queued.key != key]
+        if len(queue) < len(self.queue):
+            heapq.heapify(queue)
+            self.queue = queue
+
+    def _release_due(self):
+        """Queue the delayed utterances that are due, the earliest first"""
+        now = self.clock()
+        due = sorted(
+            (due_at, utterance.sequence, key)
+            for key, (utterance, _, due_at) in self.delayed.items()
+            if due_at <= now
+        )
+        for _, _, key in due:
+            utterance, interrupt, _ = self.delayed.pop(key)
+            self._enqueue(utterance, interrupt)
+
+    def _next_due(self) -> Optional[float]:
+        """Seconds until the next delayed utterance is due, if there is one"""
+        if not self.delayed:
+            return None
+        due_at = min(due_at for _, _, due_at in self.delayed.values())
+        return max(0.0, due_at - self.clock())
+
+    def cancel(self):
+        """Drop everything queued and stop whatever is being said"""
+        with self.condition:
+            self.queue.clear()
+            self.delayed.clear()
+            self.preempt = -1
+            self.condition.notify()
+
+    def run(self, fn: Callable[[], None]):
+        """Call fn on the worker thread, before anything else is said"""
+        with self.condition:
+            self.calls.append(fn)
+            self.condition.notify()
+
+    def pending(self) -> list[Utterance]:
+        with self.condition:
+            return sorted(self.queue)
+
+    def _is_speaking(self) -> Optional[bool]:
+        """None if the engine can't tell us"""
+        still_speaking = self.still_speaking
+        if self.current is None:
+            return False
+        if still_speaking is None:
+            return None
+        try:
+            return still_speaking()
+        except Exception:
+            return False
+
+    def _has_work(self, waiting: bool) -> bool:
+        """Whether to step now, or wait to be notified or for the timeout"""
+        return (
+            bool(self.calls)
+            or self.preempt is not None
+            or (bool(self.queue) and not waiting)
+            or self._next_due() == 0
+        )
+
+    def _timeout(self, waiting: bool) -> Optional[float]:
+        # While the engine is speaking, check now and then if it finished
+        timeouts = [self._next_due(), SPEAKING_POLL_INTERVAL if waiting else None]
+        timeouts = [timeout for timeout in timeouts if timeout is not None]
+        return min(timeouts) if timeouts else None
+
+    def step(self) -> bool:
+        """
+        Run calls, handle interrupts, and hand the engine the next utterance
+        if it is free. Returns true if an utterance is still waiting for the
+        engine to finish speaking
+        """
+        with self.condition:
+            self._release_due()
+            calls, self.calls = self.calls, []
+            preempt, self.preempt = self.preempt, None
+        for fn in calls:
+            self._call(fn)
+
+        if preempt is not None:
+            current = self.current
+            # Only keep speaking something more important than the interrupt,
+            # and only if it may still be speaking
+            keep = (
+                preempt >= 0
+                and current is not None
+                and current.rank < preempt
+                and self._is_speaking() is not False
+            )
+            if not keep:
+                self._call(self.cancel_engine if preempt < 0 else self.interrupt_engine)
+                self.current, self.still_speaking = None, None
+
+        # Engines that can't tell us when they finish queue speech themselves
+        if self._is_speaking():
+            with self.condition:
+                return bool(self.queue)
+
+        with self.condition:
+            if not self.queue:
+                return False
+            utterance = heapq.heappop(self.queue)
+            self.current, self.still_speaking = utterance, None
+        still_speaking = self._call(lambda: self.speak(utterance.text))
+        with self.condition:
+            if self.current is utterance:
+                self.still_speaking = still_speaking
+            return bool(self.queue)
+
+    def _call(self, fn: Callable):
+        try:
+            return fn()
+        except Exception:
+            print("Error in the tts engine:")
+            traceback.print_exc()
+            return None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="tts", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def _run(self):
+        waiting = False
+        while True:
+            with self.condition:
+                if not self.stopped and not self._has_work(waiting):
+                    self.condition.wait(self._timeout(waiting))
+                if self.stopped:
+                    return
+            waiting = self.step()
@@ -0,0 +1,139 @@
+"""
+Cleans up text before a tts engine says it, if you ask it to: symbols are
+named or dropped depending on how much punctuation you want to hear, links are
+shortened to their site, long numbers to how many digits they have, and runs
+of the same symbol to one. By default the text is left as it is. This doesn't
+import talon, so it can be used outside of it
+"""
+
+import functools
+import re
+from typing import Literal
+
+# "off" leaves symbols for the engine, like before any of this existed
+PunctuationLevel = Literal["off", "none", "some", "most", "all"]
+
+# Each level names these symbols, on top of those from the levels before it.
+# At "none" they are all dropped. Sentence punctuation and apostrophes are
+# only named at "all", and kept as they are otherwise since engines pause on them
+SOME_SYMBOLS = {
+    "@": "at",
+    "&": "and",
+    "%": "percent",
+    "#": "number",
+    "$": "dollar",
+    "+": "plus",
+    "=": "equals",
+    "*": "star",
+    "/": "slash",
+    "\\": "backslash",
+    "|": "bar",
+    "~": "tilde",
+    "^": "caret",
+    "<": "less than",
+    ">": "greater than",
+    "_": "underscore",
+}
+MOST_SYMBOLS = {
+    "(": "left paren",
+    ")": "right paren",
+    "[": "left bracket",
+    "]": "right bracket",
+    "{": "left brace",
+    "}": "right brace",
+    '"': "quote",
+    "`": "backtick",
+    "-": "dash",
+}
+ALL_SYMBOLS = {
+    ".": "dot",
+    ",": "comma",
+    "?": "question",
+    "!": "bang",
+    ";": "semicolon",
+    ":": "colon",
+    "'": "apostrophe",
+}
+
+# Numbers with more digits than this are said as how many digits they have,
+# i.e. ids and hashes, while phone numbers and amounts are still read out
+NUMBER_MAX_DIGITS = 12
+# More of the same symbol in a row than this is said once, i.e. ----- or ====
+REPEAT_MAX = 3
+
+# Where a link ends, leaving out punctuation that ends the sentence it is in
+LINK_END = r"(?:[/?#:]\S*?)?(?=[.,;:!?)\]'\"]*(?:\s|$))"
+# Each pattern starts with something re can search for quickly, which makes
+# these passes together a few times faster than one pattern for everything
+WEB_LINK = re.compile(r"https?://(?:www\.)?(?P<site>[^\s/?#:]+?)" + LINK_END)
+BARE_LINK = re.compile(r"www\.(?P<site>[^\s/?#:]+?)" + LINK_END)
+LONG_NUMBER = re.compile(rf"[0-9]{{{NUMBER_MAX_DIGITS + 1},}}")
+REPEATED_SYMBOL = re.compile(rf"([!-/:-@\[-`{{-~])\1{{{REPEAT_MAX},}}")
+
+
+def _named_symbols(level: PunctuationLevel) -> dict[str, str]:
+    named = {}
+    if level in ("some", "most", "all"):
+        named |= SOME_SYMBOLS
+    if level in ("most", "all"):
+        named |= MOST_SYMBOLS
+    if level == "all":
+        named |= ALL_SYMBOLS
+    return named
+
+
+class TextNormalizer:
+    """
+    Built once for each combination of options, so the translate table and
+    patterns are ready before anything is said
+    """
+
+    def __init__(
+        self,
+        punctuation: PunctuationLevel = "off",
+        shorten_links: bool = False,
+        shorten_numbers: bool = False,
+    ):
+        self.punctuation = punctuation
+        named = _named_symbols(punctuation)
+        # Symbols that are dropped become spaces. Only ever replacing one
+        # character with one keeps str.translate on its fast path
+        self.dropped = {
+            ord(symbol): " "
+            for symbol in SOME_SYMBOLS | MOST_SYMBOLS
+            if symbol not in named and punctuation != "off"
+        }
+        self.names = {symbol: f" {name} " for symbol, name in named.items()}
+        self.named = re.compile(f"([{re.escape(''.join(named))}])") if named else None
+        self.shorten_links = shorten_links
+        self.shorten_numbers = shorten_numbers
+
+    def __call__(self, text: str) -> str:
+        if self.shorten_links:
+            # The site is named with everything else, so its dots stay
+            text = WEB_LINK.sub(r" link \g<site> ", text)
+            text = BARE_LINK.sub(r" link \g<site> ", text)
+        if self.shorten_numbers:
+            text = LONG_NUMBER.sub(
+                lambda match: f" {len(match.group())} digit number ", text
+            )
+        if self.punctuation == "off":
+            return text
+        text = REPEATED_SYMBOL.sub(r"\1", text).translate(self.dropped)
+        if self.named is None:
+            return text
+        # Every other part is a symbol to name. This is a few times faster than
+        # a translate table with names, which makes str.translate look up
+        # every character in Python
+        parts = self.named.split(text)
+        parts[1::2] = map(self.names.__getitem__, parts[1::2])
+        return "".join(parts)
+
+
+@functools.lru_cache(maxsize=8)
+def normalizer(
+    punctuation: PunctuationLevel = "off",
+    shorten_links: bool = False,
+    shorten_numbers: bool = False,
+) -> TextNormalizer:
+    return TextNormalizer(punctuation, shorten_links, shorten_numbers)
@@ -0,0 +1,76 @@
+"""
+espeak through speech-dispatcher, falling back to spd-say when it isn't
+running. This doesn't import talon, so it can be used outside of it
+"""
+
+import subprocess
+import threading
+from typing import Optional
+
+from ..speech_dispatcher.ssip_client import SSIPClient, SSIPNoReply
+from .tts_engine import StillSpeaking, TTSEngine
+
+
+class EspeakEngine(TTSEngine):
+    """
+    speech-dispatcher queues what we send it, so speaking doesn't say when it
+    finishes. The client only sends rate and volume when they differ from
+    what the connection has, which it has to check again after reconnecting
+    """
+
+    name = "espeak"
+    has_rate = True
+    has_volume = True
+
+    def __init__(self, client: Optional[SSIPClient] = None):
+        super().__init__()
+        self.client = client or SSIPClient()
+        # Rate and volume in speech-dispatcher's units, from -100 to 100
+        self.ssip_rate = 0
+        self.ssip_volume = 0
+        self.fallback: Optional[subprocess.Popen] = None
+
+    def _write_rate(self, value: float):
+        # This has to be a whole number
+        self.ssip_rate = int(value * 10)
+
+    def _write_volume(self, value: float):
+        self.ssip_volume = int(value - 50) * 2
+
+    def speak(self, text: str) -> StillSpeaking:
+        try:
+            self.client.speak(text, self.ssip_rate, self.ssip_volume)
+        except SSIPNoReply as error:
+            # It may be speaking it anyway, so spd-say could say it twice
+            print(f"Not falling back to spd-say: {error}")
+        except Exception as error:
+            # spd-say starts speech-dispatcher if it isn't running yet, so the
+            # next utterance can connect to it
+            print(f"Falling back to spd-say: {error}")
+            self.fallback = subprocess.Popen(
+                [
+                    "spd-say",
+                    text,
+                    "--rate",
+                    str(self.ssip_rate),
+                    "--volume",
+                    str(self.ssip_volume),
+                ]
+            )
+        return None
+
+    def silence(self):
+        self.client.cancel()
+        fallback, self.fallback = self.fallback, None
+        if fallback is not None:
+            fallback.kill()
+
+    def warm_up(self, phrases: list[str], stop: threading.Event):
+        # Connects and sets the voice, so the next utterance is just a SPEAK
+        self.client.warm_up(self.ssip_rate, self.ssip_volume)
+
+    def report(self) -> Optional[str]:
+        return (
+            f"Connected to speech-dispatcher {self.client.connects} times, "
+            f"{self.client.writes} writes"
+        )
@@ -0,0 +1,102 @@
+"""
+piper through the worker that keeps its model loaded, falling back to
+starting piper for each utterance. This doesn't import talon, so it can be
+used outside of it
+"""
+
+import subprocess
+import threading
+from typing import Callable, Optional
+
+from ..piper_tts.piper_client import PiperError, PiperWorker, aplay_command
+from .tts_engine import StillSpeaking, TTSEngine
+
+# Hz for playback when falling back, which is what the low quality models use
+PIPER_FALLBACK_SAMPLE_RATE = 16000
+
+
+class PiperEngine(TTSEngine):
+    """
+    The worker is started on first use. Its cache is keyed by the length
+    scale, which stays fixed, so rate and volume aren't supported
+    """
+
+    name = "piper"
+    reports_speaking = True
+
+    def __init__(
+        self,
+        get_worker: Callable[[], PiperWorker],
+        piper_command: list[str],
+        length_scale: float,
+    ):
+        super().__init__()
+        self.get_worker = get_worker
+        # piper and its model, to start for each utterance if the worker can't
+        self.piper_command = piper_command
+        self.length_scale = length_scale
+        self.worker: Optional[PiperWorker] = None
+        self.fallback: Optional[subprocess.Popen] = None
+
+    def speak(self, text: str) -> StillSpeaking:
+        try:
+            self.worker = self.get_worker()
+            utterance = self.worker.speak(text, self.length_scale)
+            return lambda: not utterance.played.is_set()
+        except PiperError as error:
+            print(f"Falling back to starting piper for each utterance: {error}")
+        return self._speak_with_new_piper(text)
+
+    def _speak_with_new_piper(self, text: str) -> StillSpeaking:
+        #  we need this more verbose representation here so we don't use the
+        # shell and have risks of shell expansion
+        echo = subprocess.Popen(["echo", text], stdout=subprocess.PIPE)
+        piper = subprocess.Popen(
+            self.piper_command
+            + ["--length_scale", str(self.length_scale), "--output_raw"],
+            stdin=echo.stdout,
+            stdout=subprocess.PIPE,
+        )
+        echo.stdout.close()
+        aplay = subprocess.Popen(
+            aplay_command(PIPER_FALLBACK_SAMPLE_RATE), stdin=piper.stdout
+        )
+        piper.stdout.close()
+        self.fallback = aplay
+        return lambda: aplay.poll() is None
+
+    def silence(self):
+        if self.worker is not None:
+            self.worker.cancel()
+        fallback, self.fallback = self.fallback, None
+        if fallback is not None:
+            fallback.kill()
+
+    def stop(self):
+        """Stop the worker and anything started for an utterance, i.e. on reload"""
+        self.silence()
+        if self.worker is not None:
+            self.worker.stop()
+
+    def warm_up(self, phrases: list[str], stop: threading.Event):
+        self.worker = self.get_worker()
+        # Prerendering blocks until it's done, and loads the model first
+        threading.Thread(
+            target=self._prerender,
+            args=(self.worker, phrases, stop),
+            name="piper-prerender",
+            daemon=True,
+        ).start()
+
+    def _prerender(
+        self, worker: PiperWorker, phrases: list[str], stop: threading.Event
+    ):
+        try:
+            worker.prerender(phrases, self.length_scale, stop)
+        except Exception as error:
+            print(f"Couldn't prerender with piper: {error}")
+
+    def report(self) -> Optional[str]:
+        if self.worker is None:
+            return "piper hasn't been used yet"
+        return self.worker.report()
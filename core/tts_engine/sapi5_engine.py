@@ -0,0 +1,108 @@
+"""
+The Windows voice, through the Microsoft speech API version 5. This doesn't
+import talon, so it can be used outside of it
+"""
+
+import os
+from collections import OrderedDict
+
+from .tts_engine import StillSpeaking, TTSEngine
+
+if os.name == "nt":
+    import pywintypes
+    import win32com.client
+
+
+SVSFDefault = 0
+SVSFlagsAsync = 1
+SVSFPurgeBeforeSpeak = 2
+SVSFIsFilename = 4
+SVSFIsXML = 8
+SVSFIsNotXML = 16
+SVSFPersistXML = 32
+
+SRSEIsSpeaking = 2
+
+
+class SAPI5(TTSEngine):
+    """
+    Supports the microsoft speech API version 5. It is a COM object, so it
+    has to be created and used on the same thread, and every property written
+    is a call into it
+    """
+
+    has_volume = True
+    has_rate = True
+    has_pitch = True
+    has_voices = True
+    reports_speaking = True
+    name = "sapi5"
+    priority = 101
+    system_output = True
+
+    def __init__(self):
+        super().__init__()
+        try:
+            # self.object = load_com("SAPI.SPVoice")
+            self.object = win32com.client.Dispatch("SAPI.SpVoice")
+
+            self._voices = self._available_voices()
+        except (pywintypes.com_error, TypeError):
+            raise Exception
+        self._pitch = 0
+
+    def _available_voices(self):
+        _voices = OrderedDict()
+        for v in self.object.GetVoices():
+            _voices[v.GetDescription()] = v
+        return _voices
+
+    def list_voices(self):
+        return list(self._voices.keys())
+
+    def get_voice(self):
+        return self.object.Voice.GetDescription()
+
+    def set_voice(self, value):
+        self.object.Voice = self._voices[value]
+        # For some reason SAPI5 does not reset audio after changing the voice
+        # By setting the audio device after changing voices seems to fix this
+        # This was noted from information at:
+        # http://lists.nvaccess.org/pipermail/nvda-dev/2011-November/022464.html
+        self.object.AudioOutput = self.object.AudioOutput
+
+    def _write_rate(self, value):
+        self.object.Rate = round(value)
+
+    def _write_volume(self, value):
+        self.object.Volume = round(value)
+
+    # Pitch is sent with each utterance, so there is nothing to write
+
+    def speak(self, text, interrupt=False) -> StillSpeaking:
+        if interrupt:
+            self.silence()
+        # We need to do the pitch in XML here
+        textOutput = '<pitch absmiddle="%d">%s</pitch>' % (
+            round(self._pitch),
+            text.replace("<", "&lt;"),
+        )
+        self.object.Speak(textOutput, SVSFlagsAsync | SVSFIsXML)
+        return self.is_speaking
+
+    def silence(self):
+        self.object.Speak("", SVSFlagsAsync | SVSFPurgeBeforeSpeak)
+
+    def warm_up(self, phrases, stop):
+        # The COM object was created on this thread to get here. Speaking
+        # nothing opens the audio output, which otherwise delays the first
+        # utterance
+        self.object.Speak("", SVSFlagsAsync)
+
+    def is_speaking(self):
+        return self.object.Status.RunningState == SRSEIsSpeaking
+
+    def is_active(self):
+        if self.object:
+            return True
+        return False
@@ -0,0 +1,48 @@
+"""
+macOS's say, one process for each utterance. This doesn't import talon, so it
+can be used outside of it
+"""
+
+import subprocess
+import threading
+from typing import Optional
+
+from .tts_engine import StillSpeaking, TTSEngine
+
+# Words per minute say uses by default, which is a rate of 0. Every 10 faster
+# or slower doubles or halves it
+SAY_DEFAULT_WORDS_PER_MINUTE = 175
+
+
+class SayEngine(TTSEngine):
+    """
+    Each say speaks on its own, so speaking says when it finishes and the
+    speech queue waits for it before starting the next one
+    """
+
+    name = "say"
+    has_rate = True
+    reports_speaking = True
+
+    def __init__(self):
+        super().__init__()
+        self.words_per_minute = SAY_DEFAULT_WORDS_PER_MINUTE
+        self.process: Optional[subprocess.Popen] = None
+
+    def _write_rate(self, value: float):
+        self.words_per_minute = round(SAY_DEFAULT_WORDS_PER_MINUTE * 2 ** (value / 10))
+
+    def speak(self, text: str) -> StillSpeaking:
+        process = subprocess.Popen(["say", "-r", str(self.words_per_minute), text])
+        self.process = process
+        return lambda: process.poll() is None
+
+    def silence(self):
+        process, self.process = self.process, None
+        if process is not None:
+            process.kill()
+
+    def warm_up(self, phrases: list[str], stop: threading.Event):
+        # Saying nothing loads the voice from disk, so the first say that
+        # speaks doesn't have to. Not kept in self.process for silence to kill
+        subprocess.Popen(["say", "-r", str(self.words_per_minute), ""])
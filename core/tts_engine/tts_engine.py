@@ -0,0 +1,175 @@
+"""
+What every tts engine looks like to the rest of the code, modeled on how
+core-windows.py used SAPI5. This doesn't import talon, so engines can be used
+and tested outside of it
+"""
+
+import threading
+from typing import Callable, Optional
+
+# What speak() returns: a check for whether the engine is still speaking, or
+# None if it can't tell. The speech queue uses it to know when to go on
+StillSpeaking = Optional[Callable[[], bool]]
+
+
+class TTSEngine:
+    """
+    Rate goes from -10 to 10 and volume from 0 to 100 for every engine, and
+    each converts them to its own. They are remembered, and only sent to the
+    engine when they change, so speaking usually costs nothing but speak()
+    """
+
+    name = "engine"
+    has_rate = False
+    has_volume = False
+    has_pitch = False
+    has_voices = False
+    # Whether speak() returns a check for when it finishes. Engines that don't
+    # are expected to queue speech themselves
+    reports_speaking = False
+    min_rate = -10
+    max_rate = 10
+    min_volume = 0
+    max_volume = 100
+    min_pitch = -10
+    max_pitch = 10
+
+    def __init__(self):
+        self._rate: Optional[float] = None
+        self._volume: Optional[float] = None
+        self._pitch: Optional[float] = None
+        # How many times a property was actually sent to the engine
+        self.writes = 0
+
+    def get_rate(self) -> Optional[float]:
+        return self._rate
+
+    def set_rate(self, value: float):
+        value = min(max(value, self.min_rate), self.max_rate)
+        if not self.has_rate or value == self._rate:
+            return
+        self._write_rate(value)
+        self._rate = value
+        self.writes += 1
+
+    def get_volume(self) -> Optional[float]:
+        return self._volume
+
+    def set_volume(self, value: float):
+        value = min(max(value, self.min_volume), self.max_volume)
+        if not self.has_volume or value == self._volume:
+            return
+        self._write_volume(value)
+        self._volume = value
+        self.writes += 1
+
+    def get_pitch(self) -> Optional[float]:
+        return self._pitch
+
+    def set_pitch(self, value: float):
+        value = min(max(value, self.min_pitch), self.max_pitch)
+        if not self.has_pitch or value == self._pitch:
+            return
+        self._write_pitch(value)
+        self._pitch = value
+        self.writes += 1
+
+    # Each of these is only called when the value changed
+    def _write_rate(self, value: float):
+        pass
+
+    def _write_volume(self, value: float):
+        pass
+
+    def _write_pitch(self, value: float):
+        pass
+
+    def list_voices(self) -> list[str]:
+        return []
+
+    def get_voice(self) -> Optional[str]:
+        return None
+
+    def set_voice(self, value: str):
+        raise NotImplementedError(f"{self.name} can't switch voices")
+
+    def speak_with_settings(
+        self, text: str, rate: float, volume: float
+    ) -> StillSpeaking:
+        """Speak after updating whichever of rate and volume changed"""
+        self.set_rate(rate)
+        self.set_volume(volume)
+        return self.speak(text)
+
+    def speak(self, text: str) -> StillSpeaking:
+        raise NotImplementedError
+
+    def silence(self):
+        """Stop speaking, and drop anything the engine queued"""
+
+    def warm_up(self, phrases: list[str], stop: threading.Event):
+        """
+        Get ready to say these phrases straight away, until stop is set. This
+        runs on the speech queue's thread, so anything slow has to go on a
+        thread of its own
+        """
+
+    def report(self) -> Optional[str]:
+        """How the engine has been doing, if it keeps track"""
+        return None
+
+
+class FakeEngine(TTSEngine):
+    """
+    Says nothing, and keeps a log of what it was asked to do instead, i.e.
+    ("speak", "hello") or ("rate", 8). Speaks until finish() is called
+    """
+
+    name = "fake"
+    has_rate = True
+    has_volume = True
+    has_pitch = True
+    has_voices = True
+    reports_speaking = True
+
+    def __init__(self, reports_speaking: bool = True):
+        super().__init__()
+        self.reports_speaking = reports_speaking
+        self.log: list[tuple[str, object]] = []
+        self.speaking = False
+        self.voices = ["fake one", "fake two"]
+        self.voice = self.voices[0]
+
+    def _write_rate(self, value: float):
+        self.log.append(("rate", value))
+
+    def _write_volume(self, value: float):
+        self.log.append(("volume", value))
+
+    def _write_pitch(self, value: float):
+        self.log.append(("pitch", value))
+
+    def list_voices(self) -> list[str]:
+        return list(self.voices)
+
+    def get_voice(self) -> Optional[str]:
+        return self.voice
+
+    def set_voice(self, value: str):
+        self.voice = value
+        self.log.append(("voice", value))
+
+    def speak(self, text: str) -> StillSpeaking:
+        self.log.append(("speak", text))
+        self.speaking = True
+        return (lambda: self.speaking) if self.reports_speaking else None
+
+    def silence(self):
+        self.log.append(("silence", None))
+        self.speaking = False
+
+    def finish(self):
+        self.speaking = False
+
+    def spoken(self) -> list[str]:
+        return [value for action, value in self.log if action == "speak"]
@@ -3,7 +3,10 @@
 
 import os
 
-from talon import Context, Module, actions, cron
+from talon import Context, Module, actions
+
+from ..core.screenreader_presence.presence import watch_screenreader
+from ..core.screenreader_presence.presence_monitor import POLL_UNSIGNALLED_MAX_INTERVAL
 
 # class Jaws():
 #     """Supports the Jaws for Windows screen reader."""
@@ -40,23 +43,18 @@ from talon import Context, Module, actions, cron
 
 
 mod = Module()
-ctx = Context()
 
 mod.tag("jaws_running", desc="If set, JAWS is running")
 
 
-@mod.scope
-def set_jaws_running_tag():
-    """Update tags based on if JAWS is running"""
-    # TODO edge case on startup this might not be set yet
-    try:
-        ctx.tags = ["user.jaws_running"] if actions.user.is_jaws_running() else []
-    except Exception:
-        ctx.tags = []
-
-
 if os.name == "nt":
-    cron.interval("3s", set_jaws_running_tag.update)
+    watch_screenreader(
+        "jaws",
+        "user.jaws_running",
+        lambda: actions.user.is_jaws_running(),
+        # Nothing tells us when JAWS starts or stops
+        max_interval=POLL_UNSIGNALLED_MAX_INTERVAL,
+    )
 
 
 @mod.action_class
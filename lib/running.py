@@ -0,0 +1,28 @@
+# Talon reloads a file by running it again as a new module, so anything the old
+# module started, i.e. a thread, keeps going unless something stops it. Modules
+# register what they start here, and the registration from the reloaded module
+# stops the old one. This doesn't import talon, so it can be used outside of it
+
+import threading
+from typing import Protocol
+
+
+class Stoppable(Protocol):
+    def stop(self): ...
+
+
+# Only reloaded if this file itself changes, which forgets what was running
+running: dict[str, Stoppable] = {}
+lock = threading.Lock()
+
+
+def replace_running(name: str, instance: Stoppable):
+    """Stop whatever was last registered under this name, i.e. by a previous load"""
+    with lock:
+        previous = running.get(name)
+        running[name] = instance
+    if previous is not None and previous is not instance:
+        try:
+            previous.stop()
+        except Exception as error:
+            print(f"Couldn't stop the previous {name}: {error}")
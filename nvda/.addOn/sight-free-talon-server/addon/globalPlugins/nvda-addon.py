@@ -1,30 +1,26 @@
+import bisect
+import collections
 import enum
 import json
 import os
+import queue
+import selectors
 import socket
+import struct
 import threading
 import time
 import traceback
 from datetime import datetime
 
 import config
-import globalPluginHandler
 import globalVars
 import tones
 
-# Exhaustive list of valid commands
-valid_commands = [
-    "disableSpeechInterruptForCharacters",
-    "enableSpeechInterruptForCharacters",
-    "getSpeechInterruptForCharacters",
-    "disableSpeakTypedWords",
-    "enableSpeakTypedWords",
-    "getSpeakTypedWords",
-    "disableSpeakTypedCharacters",
-    "enableSpeakTypedCharacters",
-    "getSpeakTypedCharacters",
-    "debug",
-]
+try:
+    import globalPluginHandler
+except ImportError:
+    # The server can also run standalone outside of NVDA, i.e. for load testing
+    globalPluginHandler = None
 
 
 class ResponseSchema:
@@ -60,87 +56,974 @@ def bind_to_available_port(server_socket, start_port, end_port):
     raise OSError(f"No available ports in the range {start_port}-{end_port}")
 
 
-# Process a command, return the command and result as well as the retrieved value, if applicable
-# Yes this is a big if/else block, but it's the most efficient way to handle the commands
-def handle_command(command: str):
-    command, value, result = command, None, None
-
-    if command == "getSpeechInterruptForCharacters":
-        value, result = (
-            config.conf["keyboard"]["speechInterruptForCharacters"],
-            StatusResult.SUCCESS,
+# Settings Talon may read and change through getConfig/setConfig.
+# Paths are dotted sections of config.conf, i.e. "keyboard.speakTypedWords"
+CONFIG_WHITELIST = frozenset(
+    [
+        "keyboard.speechInterruptForCharacters",
+        "keyboard.speechInterruptForEnter",
+        "keyboard.speakTypedWords",
+        "keyboard.speakTypedCharacters",
+        "keyboard.speakCommandKeys",
+        "speech.symbolLevel",
+        "speech.autoLanguageSwitching",
+        "reviewCursor.followFocus",
+        "reviewCursor.followCaret",
+        "mouse.enableMouseTracking",
+        "presentation.reportTooltips",
+        "presentation.reportHelpBalloons",
+    ]
+)
+
+# Boolean keyboard settings that each get a get, enable and disable command
+KEYBOARD_TOGGLES = (
+    "speechInterruptForCharacters",
+    "speakTypedWords",
+    "speakTypedCharacters",
+)
+
+# Maps each command name to the function that runs it. The command set is
+# generated from this table so dispatch is a single dict lookup no matter
+# how many commands there are, and the list we advertise in the spec file can
+# never drift from what we actually handle
+COMMAND_HANDLERS = {}
+# Commands whose handler also receives the client that sent them
+CLIENT_AWARE_COMMANDS = set()
+# Commands that may take a while, i.e. because NVDA reacts to the change.
+# Bundles containing them run in order on the command thread, so the event
+# loop stays free to answer other requests while they run
+SLOW_COMMANDS = set()
+# Commands that only read state, so they can be answered ahead of queued changes
+READ_ONLY_COMMANDS = set()
+
+
+def register_command(name, handler, with_client=False, slow=False, read_only=False):
+    if name in COMMAND_HANDLERS:
+        raise ValueError(f"Command {name} is registered twice")
+    COMMAND_HANDLERS[name] = handler
+    if with_client:
+        CLIENT_AWARE_COMMANDS.add(name)
+    if slow:
+        SLOW_COMMANDS.add(name)
+    if read_only:
+        READ_ONLY_COMMANDS.add(name)
+
+
+def resolve_config_path(path):
+    """Return the config section holding the setting and the setting name"""
+    if path not in CONFIG_WHITELIST:
+        raise KeyError(f"Config path {path} is not whitelisted")
+    *sections, key = path.split(".")
+    section = config.conf
+    for name in sections:
+        section = section[name]
+    return section, key
+
+
+def read_config(path):
+    section, key = resolve_config_path(path)
+    return section[key]
+
+
+def write_config(path, value):
+    """Change a setting without bumping the generation, i.e. while Talon types"""
+    section, key = resolve_config_path(path)
+    section[key] = value
+
+
+def get_config(path):
+    # While Talon types, this is what the setting goes back to afterwards
+    return keyboard_state.read(path)
+
+
+def set_config(path, value):
+    current = read_config(path)
+    if current is not None and type(value) is not type(current):
+        raise ValueError(
+            f"Expected {type(current).__name__} for {path}, got {type(value).__name__}"
         )
+    # Bumped outside of the keyboard lock, since the generation takes its own
+    # lock first and then reads through this one
+    if keyboard_state.write(path, value):
+        config_generation.bump(path, value)
+
+
+def debug():
+    tones.beep(640, 100)
+
+
+class KeyboardStateStack:
+    """
+    Saves the keyboard echo settings while Talon types and restores them after.
+    Pushes nest so overlapping phrases work: only the outermost push saves and
+    disables the settings, and only the matching last pop restores them.
+    Pushes are tracked per client so a client that disconnects mid phrase
+    can't leave the settings disabled. Disabling and restoring them isn't a
+    change anyone sees: while they are held, reads get the saved values and
+    writes change what gets restored, so the generation only goes up for real
+    changes
+    """
+
+    def __init__(self):
+        self.saved = {}
+        # How many pushes each client holds. Clients are removed once they
+        # hold none, so the stack is empty exactly when this is
+        self.owners = {}
+        # Pushes and pops run on the event loop, or on the command thread when
+        # they queue behind a client's slow requests, and releases always run
+        # there. Each one has to save or restore all the settings at once
+        self.lock = threading.Lock()
+
+    def push(self, client=None):
+        with self.lock:
+            if not self.owners:
+                for setting in KEYBOARD_TOGGLES:
+                    path = f"keyboard.{setting}"
+                    self.saved[path] = read_config(path)
+                    write_config(path, False)
+            self.owners[client] = self.owners.get(client, 0) + 1
+
+    def pop(self, client=None):
+        with self.lock:
+            # A pop without a matching push, i.e. after NVDA restarted, is a no-op
+            if not self.owners.get(client):
+                return
+            self.owners[client] -= 1
+            if self.owners[client] == 0:
+                del self.owners[client]
+                if not self.owners:
+                    self._restore()
+
+    def release(self, client):
+        """Drop every push held by a client, i.e. once it disconnects"""
+        with self.lock:
+            if self.owners.pop(client, None) and not self.owners:
+                self._restore()
+
+    def read(self, path):
+        with self.lock:
+            if path in self.saved:
+                return self.saved[path]
+            return read_config(path)
+
+    def write(self, path, value):
+        """Change a setting, or what it is restored to if it is held. Returns true if it changed"""
+        with self.lock:
+            if path in self.saved:
+                changed = self.saved[path] != value
+                self.saved[path] = value
+                return changed
+            if read_config(path) == value:
+                return False
+            write_config(path, value)
+            return True
+
+    def _restore(self):
+        for path, value in self.saved.items():
+            write_config(path, value)
+        self.saved = {}
+
+
+keyboard_state = KeyboardStateStack()
+
+
+# NVDA has no notification for every setting change, i.e. one toggled with a
+# gesture or changed in a dialog without saving, so while anyone is subscribed
+# the settings are compared this often. NVDA's notifications only get a push
+# out sooner. That is a few dict lookups in process, instead of Talon polling
+# over the socket
+WATCH_INTERVAL = 1.0
+
+
+class ConfigGeneration:
+    """
+    A number that goes up whenever any whitelisted setting changes, so
+    clients can cache what they read until it does. Changes we make bump it
+    right away, and so do NVDA's notifications for saving, switching profiles
+    and resetting. NVDA doesn't tell us about every other change, so we also
+    compare the settings when asked, at most every WATCH_INTERVAL. It starts
+    from the clock so it keeps increasing even if the server restarts
+    """
+
+    def __init__(self):
+        self.value = int(time.time() * 1000)
+        self.paths = sorted(CONFIG_WHITELIST)
+        self.positions = {path: i for i, path in enumerate(self.paths)}
+        self.snapshot = None
+        self.checked_at = 0.0
+        # Requests run on both the event loop and the command thread
+        self.lock = threading.Lock()
+
+    def bump(self, path=None, value=None):
+        """Note a change to one setting, or to any number of them if no path is given"""
+        with self.lock:
+            self.value += 1
+            # The bump covers anything that changed before it, so the snapshot
+            # only has to catch up to compare later changes against it
+            if path is not None and self.snapshot is not None:
+                self.snapshot[self.positions[path]] = value
+            else:
+                self.snapshot = None
+                self.checked_at = 0.0
+
+    def current(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.checked_at >= WATCH_INTERVAL:
+                self.checked_at = now
+                snapshot = [get_config(path) for path in self.paths]
+                if self.snapshot is not None and snapshot != self.snapshot:
+                    self.value += 1
+                self.snapshot = snapshot
+            return self.value
+
+
+config_generation = ConfigGeneration()
+
+
+# Lifecycle events a client can subscribe to alongside config paths
+LIFECYCLE_EVENTS = frozenset(["profileSwitch", "configReset", "stopping"])
+
+
+class SubscriptionHub:
+    """
+    Tracks which clients want to be told about config changes and lifecycle
+    events. Events can be posted from any thread, i.e. NVDA's main thread,
+    but are only written to the sockets by the server's event loop
+    """
+
+    def __init__(self):
+        self.topics = {}
+        # The last value pushed for every setting someone subscribed to
+        self.last_values = {}
+        self.pending_events = collections.deque()
+        # Set by the server so posting an event wakes its event loop
+        self.wake = lambda: None
+
+    def subscribe(self, *topics, client=None):
+        """Subscribe to topics, or everything if none are given, and return the current settings"""
+        if not topics:
+            topics = tuple(CONFIG_WHITELIST) + tuple(LIFECYCLE_EVENTS)
+        for topic in topics:
+            if topic not in CONFIG_WHITELIST and topic not in LIFECYCLE_EVENTS:
+                raise KeyError(f"Cannot subscribe to {topic}")
+
+        self.topics[client] = frozenset(topics)
+        snapshot = {}
+        for path in topics:
+            if path in CONFIG_WHITELIST:
+                snapshot[path] = get_config(path)
+                # Keep the value other subscribers last saw, so they still get
+                # a push if it changed since
+                self.last_values.setdefault(path, snapshot[path])
+        return snapshot
+
+    def unsubscribe(self, client=None):
+        self.topics.pop(client, None)
+        watched = set()
+        for topics in self.topics.values():
+            watched |= topics
+        for path in list(self.last_values):
+            if path not in watched:
+                del self.last_values[path]
+
+    def post_event(self, event):
+        self.pending_events.append(event)
+        self.wake()
+
+    def collect(self):
+        """Return a (client, message) pair for every push that is due"""
+        if not self.topics:
+            self.pending_events.clear()
+            return []
+
+        generation = config_generation.current()
+        messages = []
+        while self.pending_events:
+            event = self.pending_events.popleft()
+            for client, topics in self.topics.items():
+                if event in topics:
+                    messages.append(
+                        (
+                            client,
+                            {"push": "event", "event": event, "generation": generation},
+                        )
+                    )
+
+        for path, previous in list(self.last_values.items()):
+            value = get_config(path)
+            if value == previous:
+                continue
+            self.last_values[path] = value
+            for client, topics in self.topics.items():
+                if path in topics:
+                    messages.append(
+                        (
+                            client,
+                            {
+                                "push": "config",
+                                "path": path,
+                                "value": value,
+                                "generation": generation,
+                            },
+                        )
+                    )
+        return messages
+
+
+subscriptions = SubscriptionHub()
+
+
+# Upper bound of each latency bucket in seconds, the same as the Talon client's
+BUCKET_BOUNDS = (
+    50e-6,
+    100e-6,
+    250e-6,
+    500e-6,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    10e-3,
+    25e-3,
+    50e-3,
+    100e-3,
+    250e-3,
+    1.0,
+)
+
+
+class LatencyHistogram:
+    """Counts samples into fixed buckets, so recording never allocates"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "p50_ms": round(self.percentile(0.5) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class ServerMetrics:
+    """
+    How long each command and request takes. Every thread records into its
+    own histograms, so the event loop and the command thread never contend,
+    and they are only merged when someone asks for them
+    """
+
+    KINDS = ("commands", "requests")
+
+    def __init__(self):
+        self.local = threading.local()
+        self.tables = []
+        # Only taken the first time a thread records something
+        self.lock = threading.Lock()
+
+    def _tables(self):
+        tables = getattr(self.local, "tables", None)
+        if tables is None:
+            tables = self.local.tables = {kind: {} for kind in self.KINDS}
+            with self.lock:
+                self.tables.append(tables)
+        return tables
+
+    def record(self, kind, name, seconds):
+        table = self._tables()[kind]
+        histogram = table.get(name)
+        if histogram is None:
+            histogram = table[name] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def snapshot(self):
+        merged = {kind: {} for kind in self.KINDS}
+        with self.lock:
+            tables = list(self.tables)
+        for thread_tables in tables:
+            for kind, table in thread_tables.items():
+                for name, histogram in list(table.items()):
+                    merged[kind].setdefault(name, LatencyHistogram()).merge(histogram)
+        return {
+            kind: {name: histogram.summary() for name, histogram in table.items()}
+            for kind, table in merged.items()
+        }
+
+
+server_metrics = ServerMetrics()
+
+
+def _register_keyboard_toggle(setting):
+    # Capitalize just the first letter to build the camelCase command names
+    suffix = setting[0].upper() + setting[1:]
+    path = f"keyboard.{setting}"
+    register_command(f"get{suffix}", lambda: get_config(path), read_only=True)
+    register_command(f"enable{suffix}", lambda: set_config(path, True))
+    register_command(f"disable{suffix}", lambda: set_config(path, False))
+
+
+for _setting in KEYBOARD_TOGGLES:
+    _register_keyboard_toggle(_setting)
+register_command("getConfig", get_config, read_only=True)
+register_command("setConfig", set_config, slow=True)
+register_command("pushKeyboardState", keyboard_state.push, with_client=True)
+register_command("popKeyboardState", keyboard_state.pop, with_client=True)
+register_command("subscribe", subscriptions.subscribe, with_client=True)
+register_command("unsubscribe", subscriptions.unsubscribe, with_client=True)
+register_command("getMetrics", server_metrics.snapshot)
+register_command("debug", debug, slow=True)
+
+# Exhaustive list of valid commands
+valid_commands = list(COMMAND_HANDLERS)
+
+
+# Process a command, return the command and result as well as the retrieved value, if applicable
+# Commands are either a bare name or a list of the name followed by its arguments
+def handle_command(command, client=None):
+    if isinstance(command, list) and command:
+        name, args = command[0], command[1:]
+    else:
+        name, args = command, []
+
+    handler = COMMAND_HANDLERS.get(name) if isinstance(name, str) else None
+    if handler is None:
+        return command, None, StatusResult.INVALID_COMMAND_ERROR
+
+    started = time.perf_counter()
+    try:
+        if name in CLIENT_AWARE_COMMANDS:
+            return command, handler(*args, client=client), StatusResult.SUCCESS
+        return command, handler(*args), StatusResult.SUCCESS
+    except (TypeError, KeyError, ValueError) as e:
+        print(f"ERROR RUNNING TALON COMMAND {command}: {e}")
+        return command, None, StatusResult.RUNTIME_ERROR
+    except Exception as e:
+        # A bug in a handler shouldn't reach the event loop and stop the server
+        print(f"INTERNAL ERROR RUNNING TALON COMMAND {command}: {e}")
+        return command, None, StatusResult.INTERNAL_SERVER_ERROR
+    finally:
+        server_metrics.record("commands", name, time.perf_counter() - started)
+
 
-    elif command == "getSpeakTypedWords":
-        value, result = config.conf["keyboard"]["speakTypedWords"], StatusResult.SUCCESS
+# Every message is a 4 byte big endian length header followed by the payload.
+# This must match core/screenreader_ipc/ipc_protocol.py in the Talon repo
+FRAME_HEADER = struct.Struct(">I")
+# Guard against a corrupt header making us allocate an absurd buffer
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# Talon keeps its connection open between phrases, so we only drop clients
+# that have been silent for a long time, i.e. if Talon crashed without closing
+CLIENT_IDLE_TIMEOUT = 300
 
-    elif command == "getSpeakTypedCharacters":
-        value, result = (
-            config.conf["keyboard"]["speakTypedCharacters"],
-            StatusResult.SUCCESS,
+
+def encode_frame(payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+class FrameReader:
+    """
+    Incrementally reassembles frames received from a client into one reusable
+    buffer. Frames are returned as memoryviews that are only valid until
+    the next call on the reader
+    """
+
+    def __init__(self, initial_size=4096):
+        self.buffer = bytearray(initial_size)
+        self.start = 0
+        self.end = 0
+
+    def _reserve(self, size):
+        if len(self.buffer) - self.end >= size:
+            return
+
+        pending = self.end - self.start
+        if pending + size <= len(self.buffer):
+            self.buffer[0:pending] = self.buffer[self.start : self.end]
+        else:
+            grown = bytearray(max(len(self.buffer) * 2, pending + size))
+            grown[0:pending] = self.buffer[self.start : self.end]
+            self.buffer = grown
+        self.start, self.end = 0, pending
+
+    def recv_from(self, sock, size=4096):
+        self._reserve(size)
+        received = sock.recv_into(memoryview(self.buffer)[self.end :], size)
+        self.end += received
+        return received
+
+    def next_frame(self):
+        pending = self.end - self.start
+        if pending < FRAME_HEADER.size:
+            return None
+
+        (length,) = FRAME_HEADER.unpack_from(self.buffer, self.start)
+        if length > MAX_FRAME_SIZE:
+            raise ValueError(f"Frame of {length} bytes is too large")
+        if pending < FRAME_HEADER.size + length:
+            self._reserve(FRAME_HEADER.size + length - pending)
+            return None
+
+        payload_start = self.start + FRAME_HEADER.size
+        self.start = payload_start + length
+        frame = memoryview(self.buffer)[payload_start : self.start]
+        if self.start == self.end:
+            self.start = self.end = 0
+        return frame
+
+
+# Version 2 added the compact encoding, which we advertise in the spec file.
+# Version 3 added request ids, so pipelined requests can be answered out of order.
+# Version 4 added the config generation to every response and push.
+# All of this must match core/screenreader_ipc/ipc_protocol.py in the Talon repo
+PROTOCOL_VERSION = 4
+SUPPORTED_ENCODINGS = ["json", "compact"]
+# Compact frames start with a byte that can never begin a JSON document
+COMPACT_MAGIC = 0xC1
+COMPACT_VERSION = 1
+# Same as version 1, with a request id after the header
+COMPACT_PIPELINED_VERSION = 2
+COMPACT_REQUEST_ID = struct.Struct(">I")
+# magic, version, number of commands
+COMPACT_HEADER = struct.Struct(">BBH")
+# Commands are sent as their index in valid_commands
+COMPACT_COMMAND_ID = struct.Struct(">H")
+# status code, value tag
+COMPACT_RESULT = struct.Struct(">BB")
+COMPACT_INT = struct.Struct(">q")
+COMPACT_LENGTH = struct.Struct(">I")
+# Version 4 added the config generation after the results
+COMPACT_GENERATION = struct.Struct(">Q")
+# Tags describing how each returned value is packed
+VALUE_NONE, VALUE_FALSE, VALUE_TRUE, VALUE_INT, VALUE_JSON = range(5)
+COMPACT_STATUS_CODES = {
+    StatusResult.SUCCESS: 0,
+    StatusResult.INTERNAL_SERVER_ERROR: 1,
+    StatusResult.INVALID_COMMAND_ERROR: 2,
+    StatusResult.RUNTIME_ERROR: 3,
+    StatusResult.JSON_ENCODE_ERROR: 4,
+}
+INT64_MIN, INT64_MAX = -(2**63), 2**63 - 1
+
+
+def encode_compact_value(value):
+    # bool has to be checked before int since it is a subclass
+    if value is None:
+        return VALUE_NONE, b""
+    if value is True:
+        return VALUE_TRUE, b""
+    if value is False:
+        return VALUE_FALSE, b""
+    if isinstance(value, int) and INT64_MIN <= value <= INT64_MAX:
+        return VALUE_INT, COMPACT_INT.pack(value)
+    encoded = json.dumps(value).encode("utf-8")
+    return VALUE_JSON, COMPACT_LENGTH.pack(len(encoded)) + encoded
+
+
+class Request:
+    """A decoded bundle of commands and how to encode its response"""
+
+    def __init__(self, commands, request_id=None, compact=False):
+        self.commands = commands
+        # Requests without an id are answered in the order they arrived
+        self.request_id = request_id
+        self.compact = compact
+
+    def is_slow(self):
+        return any(command_name(command) in SLOW_COMMANDS for command in self.commands)
+
+    def is_read_only(self):
+        return all(
+            command_name(command) in READ_ONLY_COMMANDS for command in self.commands
         )
 
-    elif command == "disableSpeechInterruptForCharacters":
-        config.conf["keyboard"]["speechInterruptForCharacters"] = False
-        value, result = None, StatusResult.SUCCESS
 
-    elif command == "enableSpeechInterruptForCharacters":
-        config.conf["keyboard"]["speechInterruptForCharacters"] = True
-        value, result = None, StatusResult.SUCCESS
+def command_name(command):
+    return command[0] if isinstance(command, list) and command else command
+
+
+def decode_compact_request(data: memoryview) -> Request:
+    magic, version, count = COMPACT_HEADER.unpack_from(data, 0)
+    offset = COMPACT_HEADER.size
+    request_id = None
+    if version == COMPACT_PIPELINED_VERSION:
+        (request_id,) = COMPACT_REQUEST_ID.unpack_from(data, offset)
+        offset += COMPACT_REQUEST_ID.size
+    elif version != COMPACT_VERSION:
+        raise ValueError(f"Unsupported compact frame version {version}")
+    if len(data) != offset + count * COMPACT_COMMAND_ID.size:
+        raise ValueError(f"Malformed compact frame of version {version}")
 
-    elif command == "disableSpeakTypedWords":
-        config.conf["keyboard"]["speakTypedWords"] = False
-        value, result = None, StatusResult.SUCCESS
+    # Unknown ids become None, which handle_command reports as invalid
+    commands = [
+        valid_commands[command_id] if command_id < len(valid_commands) else None
+        for (command_id,) in COMPACT_COMMAND_ID.iter_unpack(data[offset:])
+    ]
+    return Request(commands, request_id, compact=True)
 
-    elif command == "enableSpeakTypedWords":
-        config.conf["keyboard"]["speakTypedWords"] = True
-        value, result = None, StatusResult.SUCCESS
 
-    elif command == "disableSpeakTypedCharacters":
-        config.conf["keyboard"]["speakTypedCharacters"] = False
-        value, result = None, StatusResult.SUCCESS
+def decode_request(data: memoryview) -> Request:
+    """
+    Requests are a JSON list of commands, a JSON object with an id and
+    the list of commands, or the compact encoding of either
+    """
+    if len(data) > 0 and data[0] == COMPACT_MAGIC:
+        return decode_compact_request(data)
 
-    elif command == "enableSpeakTypedCharacters":
-        config.conf["keyboard"]["speakTypedCharacters"] = True
-        value, result = None, StatusResult.SUCCESS
+    message = json.loads(str(data, "utf-8"))
+    if isinstance(message, dict):
+        request_id = message.get("id")
+        if not isinstance(request_id, int) or isinstance(request_id, bool):
+            raise ValueError(f"Invalid request id {request_id}")
+        return Request(message.get("commands", []), request_id)
+    if not isinstance(message, list):
+        raise ValueError("Expected a list of commands")
+    return Request(message)
 
-    elif command == "debug":
-        tones.beep(640, 100)
-        value, result = None, StatusResult.SUCCESS
 
+def encode_compact_response(request, results, generation) -> bytes:
+    if request.request_id is None:
+        response = bytearray(
+            COMPACT_HEADER.pack(COMPACT_MAGIC, COMPACT_VERSION, len(results))
+        )
     else:
-        value, result = None, StatusResult.INVALID_COMMAND_ERROR
+        response = bytearray(
+            COMPACT_HEADER.pack(COMPACT_MAGIC, COMPACT_PIPELINED_VERSION, len(results))
+        )
+        response += COMPACT_REQUEST_ID.pack(request.request_id)
+
+    for _, value, result in results:
+        tag, packed_value = encode_compact_value(value)
+        response += COMPACT_RESULT.pack(COMPACT_STATUS_CODES[result], tag)
+        response += packed_value
+    response += COMPACT_GENERATION.pack(generation)
+    return bytes(response)
+
+
+def run_request(request, client=None) -> bytes:
+    """Run the commands in a request and encode the response the same way the request was"""
+    # Reads are labelled with the generation from before they ran, so a change
+    # racing them can only make the label older than the values, never newer.
+    # Anything else reports the generation after its own changes
+    read_only = request.is_read_only()
+    if read_only:
+        generation = config_generation.current()
+    results = [handle_command(command, client) for command in request.commands]
+    if not read_only:
+        generation = config_generation.current()
+    if request.compact:
+        return encode_compact_response(request, results, generation)
+
+    response = ResponseSchema.generate()
+    response["generation"] = generation
+    if request.request_id is not None:
+        response["id"] = request.request_id
+    for command, value, result in results:
+        response["processedCommands"].append(command)
+        response["returnedValues"].append(value)
+        # We can't pickle the StatusResult enum, so we have to convert it to a string
+        response["statusResults"].append(result.value)
+    return json.dumps(response).encode("utf-8")
+
+
+def recover_request_id(data: memoryview):
+    """
+    The id of a request that couldn't be decoded, if it can still be read.
+    A JSON object with a valid id always decodes, so only a compact header can
+    have one
+    """
+    if len(data) < COMPACT_HEADER.size + COMPACT_REQUEST_ID.size:
+        return None
+    magic, version, _ = COMPACT_HEADER.unpack_from(data, 0)
+    if magic != COMPACT_MAGIC or version != COMPACT_PIPELINED_VERSION:
+        return None
+    (request_id,) = COMPACT_REQUEST_ID.unpack_from(data, COMPACT_HEADER.size)
+    return request_id
+
+
+def invalid_request_response(error, request_id=None) -> bytes:
+    print(f"RECEIVED INVALID REQUEST FROM TALON: {error}")
+    response = ResponseSchema.generate()
+    response["statusResults"] = [StatusResult.JSON_ENCODE_ERROR.value]
+    if request_id is not None:
+        response["id"] = request_id
+    return json.dumps(response).encode("utf-8")
+
+
+class CommandExecutor:
+    """
+    Runs deferred requests one at a time on their own thread, in the order
+    they were submitted, and hands the responses back to the event loop.
+    Pending counts are only touched by the event loop thread
+    """
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.jobs = queue.SimpleQueue()
+        self.finished = collections.deque()
+        self.pending = {}
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name="talon-server-commands", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.jobs.put(None)
+
+    def submit(self, client, job):
+        """Queue a job whose return value, if any, is sent to the client"""
+        self.pending[client] = self.pending.get(client, 0) + 1
+        self.jobs.put((client, job))
+
+    def has_pending(self, client):
+        return self.pending.get(client, 0) > 0
+
+    def collect(self):
+        """Return a (client, response) pair for every job that finished"""
+        finished = []
+        while self.finished:
+            client, response = self.finished.popleft()
+            self.pending[client] -= 1
+            if self.pending[client] == 0:
+                del self.pending[client]
+            if response is not None:
+                finished.append((client, response))
+        return finished
+
+    def run(self):
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                return
+            client, job = item
+            try:
+                response = job()
+            except Exception as e:
+                print(f"ERROR RUNNING DEFERRED TALON REQUEST: {e}")
+                response = None
+            self.finished.append((client, response))
+            self.wake()
+
+
+class ClientConnection:
+    """Per client state for the event loop"""
 
-    return command, value, result
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = FrameReader()
+        self.outgoing = bytearray()
+        self.last_activity = time.monotonic()
 
 
 class IPC_Server:
     port = None
     server_socket = None
     running = False
-    client_socket = None
+    selector = None
 
-    def handle_client(self, client_socket: socket.socket):
-        data = client_socket.recv(1024)
+    def __init__(self):
+        self.clients = {}
+        # Writing to this socket pair wakes the event loop up immediately,
+        # so stopping the server never has to wait for a poll interval
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        # A full buffer already has the loop awake, so waking must never block
+        self.wakeup_sender.setblocking(False)
+        subscriptions.wake = self.wake
+        self.executor = CommandExecutor(self.wake)
+
+    def wake(self):
+        try:
+            self.wakeup_sender.send(b"\0")
+        except OSError:
+            # BlockingIOError when plenty of wakeups are already waiting,
+            # or the socket was closed while shutting down
+            pass
+
+    def accept_client(self, server_socket, mask):
+        try:
+            client_socket, _ = server_socket.accept()
+        except BlockingIOError:
+            return
+        client_socket.setblocking(False)
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.clients[client_socket] = ClientConnection(client_socket)
+        self.selector.register(client_socket, selectors.EVENT_READ, self.service_client)
 
-        response = ResponseSchema.generate()
+    def drain_wakeup(self, wakeup_receiver, mask):
+        try:
+            while wakeup_receiver.recv(1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close_client(self, client):
+        # Released on the command thread so it happens after any push from
+        # this client that is still queued there
+        self.executor.submit(client, lambda: keyboard_state.release(client))
+        subscriptions.unsubscribe(client)
+        self.clients.pop(client.sock, None)
+        try:
+            self.selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
 
+    def service_client(self, client_socket, mask):
+        client = self.clients.get(client_socket)
+        if client is None:
+            # Already closed earlier in this batch of events
+            return
+        client.last_activity = time.monotonic()
         try:
-            messages = json.loads(data.decode().strip())
+            if mask & selectors.EVENT_READ:
+                self.read_from_client(client)
+            if mask & selectors.EVENT_WRITE:
+                self.flush_client(client)
+        except (OSError, ValueError):
+            # The client went away or sent a corrupt frame
+            self.close_client(client)
 
-            for message in messages:
-                command, value, result = handle_command(message)
-                response["processedCommands"].append(command)
-                response["returnedValues"].append(value)
-                # We can't pickle the StatusResult enum, so we have to convert it to a string
-                response["statusResults"].append(result.value)
+    def read_from_client(self, client):
+        # Talon keeps the connection open between phrases, so a closed
+        # socket just means the client went away
+        if client.reader.recv_from(client.sock) == 0:
+            self.close_client(client)
+            return
 
-        except json.JSONDecodeError as e:
-            print(f"RECEIVED INVALID JSON FROM TALON: {e}")
-            response["statusResults"] = [StatusResult.JSON_ENCODE_ERROR.value]
+        # A single receive can hold part of a frame or several frames
+        frame = client.reader.next_frame()
+        while frame is not None:
+            self.dispatch_frame(client, frame)
+            frame = client.reader.next_frame()
 
-        finally:
-            client_socket.sendall(json.dumps(response).encode("utf-8"))
+        if client.outgoing:
+            self.flush_client(client)
+
+    def dispatch_frame(self, client, frame):
+        """Answer a request right away, or queue it on the command thread if it changes state"""
+        started = time.perf_counter()
+        try:
+            request = decode_request(frame)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            request_id = recover_request_id(frame)
+            # Without an id the client matches the error to its oldest request,
+            # which is only this one if nothing is still running for it
+            if request_id is None and self.executor.has_pending(client):
+                raise ValueError(f"Invalid request without an id: {e}")
+            client.outgoing += encode_frame(invalid_request_response(e, request_id))
+            return
+
+        if self.must_defer(request, client):
+
+            def run_deferred():
+                response = encode_frame(run_request(request, client))
+                # Includes the time spent queued behind earlier deferred requests
+                server_metrics.record(
+                    "requests", "deferred", time.perf_counter() - started
+                )
+                return response
+
+            self.executor.submit(client, run_deferred)
+        else:
+            client.outgoing += encode_frame(run_request(request, client))
+            server_metrics.record("requests", "inline", time.perf_counter() - started)
+
+    def must_defer(self, request, client):
+        if request.is_slow():
+            return True
+        if not self.executor.has_pending(client):
+            return False
+        # Requests without an id can only be matched up by order, and a change
+        # has to wait for earlier changes. Only reads with an id skip ahead
+        return request.request_id is None or not request.is_read_only()
+
+    def flush_clients(self, clients):
+        for client in clients:
+            try:
+                self.flush_client(client)
+            except OSError:
+                self.close_client(client)
+
+    def deliver_deferred(self):
+        """Send the responses of deferred requests that finished since the last call"""
+        ready = set()
+        for client, response in self.executor.collect():
+            # The client may have disconnected while its request ran
+            if self.clients.get(client.sock) is not client:
+                continue
+            client.outgoing += response
+            ready.add(client)
+        self.flush_clients(ready)
+
+    def flush_client(self, client):
+        try:
+            sent = client.sock.send(client.outgoing)
+            del client.outgoing[:sent]
+        except BlockingIOError:
+            pass
+
+        # Only ask to be woken for writes while there is something left to send
+        events = selectors.EVENT_READ
+        if client.outgoing:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(client.sock, events, self.service_client)
+
+    def publish_pushes(self):
+        """Send subscribers every config change and event since the last call"""
+        pushed = set()
+        for client, message in subscriptions.collect():
+            client.outgoing += encode_frame(json.dumps(message).encode("utf-8"))
+            pushed.add(client)
+        self.flush_clients(pushed)
+
+    def expire_idle_clients(self):
+        """Drop idle clients and return how long until the next one could expire"""
+        now = time.monotonic()
+        next_deadline = None
+        for client in list(self.clients.values()):
+            # Subscribers are expected to stay silent while they wait for pushes
+            if client in subscriptions.topics:
+                continue
+            deadline = client.last_activity + CLIENT_IDLE_TIMEOUT
+            if deadline <= now:
+                self.close_client(client)
+            elif next_deadline is None or deadline < next_deadline:
+                next_deadline = deadline
+        return None if next_deadline is None else next_deadline - now
 
     def output_spec_file(self):
         # write a json file to let clients know how to connect and what commands are available
@@ -148,6 +1031,11 @@ class IPC_Server:
             "address": "localhost",
             "port": str(self.get_port()),
             "valid_commands": valid_commands,
+            "config_paths": sorted(CONFIG_WHITELIST),
+            "protocol_version": PROTOCOL_VERSION,
+            "encodings": SUPPORTED_ENCODINGS,
+            # Results of these only change when the config generation does
+            "read_only_commands": sorted(READ_ONLY_COMMANDS),
         }
         with open(SPEC_PATH, "w") as f:
             json.dump(spec, f)
@@ -164,66 +1052,116 @@ class IPC_Server:
         self.set_port(port)
         self.output_spec_file()
 
-        self.server_socket.listen(1)
-        # Need a time short enough that we can reboot NVDA and the old socket will be closed and won't interfere
-        self.server_socket.settimeout(0.5)
+        self.server_socket.listen(socket.SOMAXCONN)
+        self.server_socket.setblocking(False)
         print(f"\n\n\n\n\nTALON SERVER SERVING ON {self.server_socket.getsockname()}")
 
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(
+            self.server_socket, selectors.EVENT_READ, self.accept_client
+        )
+        self.selector.register(
+            self.wakeup_receiver, selectors.EVENT_READ, self.drain_wakeup
+        )
+
+        self.executor.start()
         self.running = True
+        # Without clients there are no deadlines, so we sleep until a socket is ready
+        timeout = None
 
-        while self.running:
-            try:
-                # If it was closed from another thread, we want to break out of the loop
-                if not self.server_socket:
-                    break
-
-                client_socket, _ = self.server_socket.accept()
-                self.client_socket = client_socket
-                self.client_socket.settimeout(0.3)
-                self.handle_client(self.client_socket)
-            # If the socket times out, we just want to keep looping
-            except socket.timeout:
-                pass
-            except Exception as e:
-                print(f"\n\n\n\nTALON SERVER CRASH: {e}")
-                self.stop()
-                with open(
-                    os.path.join(
-                        globalVars.appArgs.configPath, "talon_server_error.log"
-                    ),
-                    "a",
-                ) as f:
-                    f.write(
-                        f"\nERROR AT {datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S')}: {e}"
+        try:
+            while self.running:
+                for key, mask in self.selector.select(timeout):
+                    callback = key.data
+                    callback(key.fileobj, mask)
+                self.deliver_deferred()
+                self.publish_pushes()
+                timeout = self.expire_idle_clients()
+                if subscriptions.topics:
+                    timeout = (
+                        WATCH_INTERVAL
+                        if timeout is None
+                        else min(timeout, WATCH_INTERVAL)
                     )
-                    f.write(f"\n{traceback.format_exc()}")
-                    f.write(f"\nINTERNAL STATE: {self.__dict__}\n")
-                break
-            finally:
-                # Called no matter what even after a break
-                if self.client_socket:
-                    self.client_socket.close()
+        except Exception as e:
+            print(f"\n\n\n\nTALON SERVER CRASH: {e}")
+            with open(
+                os.path.join(globalVars.appArgs.configPath, "talon_server_error.log"),
+                "a",
+            ) as f:
+                f.write(
+                    f"\nERROR AT {datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S')}: {e}"
+                )
+                f.write(f"\n{traceback.format_exc()}")
+                f.write(f"\nINTERNAL STATE: {self.__dict__}\n")
+            self.stop()
+        finally:
+            self.close_sockets()
 
-    def stop(self):
-        self.running = False
+    def close_sockets(self):
+        # Best effort, since the process may be about to exit
+        subscriptions.post_event("stopping")
+        self.publish_pushes()
+        for client in list(self.clients.values()):
+            self.close_client(client)
+        self.executor.stop()
+        if self.selector:
+            self.selector.close()
         if self.server_socket:
             self.server_socket.close()
-        if self.client_socket:
-            self.client_socket.close()
+        self.wakeup_receiver.close()
+        self.wakeup_sender.close()
+
+    def stop(self):
+        self.running = False
+        # The event loop thread owns the sockets and closes them once it wakes up
+        self.wake()
         if os.path.exists(SPEC_PATH):
             os.remove(SPEC_PATH)
         print("\n\n\n\n\nTALON SERVER STOPPED")
 
 
-class GlobalPlugin(globalPluginHandler.GlobalPlugin):
-    def __init__(self):
-        super(GlobalPlugin, self).__init__()
+if globalPluginHandler:
 
-    def terminate(self):
-        # clean up when NVDA exits
-        server.stop()
+    class GlobalPlugin(globalPluginHandler.GlobalPlugin):
+        def __init__(self):
+            super(GlobalPlugin, self).__init__()
+            config.post_configProfileSwitch.register(self.on_profile_switch)
+            config.post_configReset.register(self.on_config_reset)
+            config.post_configSave.register(self.on_config_save)
+
+        def on_config_save(self):
+            config_generation.bump()
+            # So subscribers are pushed whatever was saved now, instead of
+            # at the next compare
+            subscriptions.wake()
+
+        def on_profile_switch(self):
+            config_generation.bump()
+            subscriptions.post_event("profileSwitch")
+
+        def on_config_reset(self):
+            config_generation.bump()
+            subscriptions.post_event("configReset")
+
+        def terminate(self):
+            # clean up when NVDA exits
+            config.post_configProfileSwitch.unregister(self.on_profile_switch)
+            config.post_configReset.unregister(self.on_config_reset)
+            config.post_configSave.unregister(self.on_config_save)
+            server.stop()
 
 
 server = IPC_Server()
-server_thread = threading.Thread(target=server.create_server)
-server_thread.start()
+
+if __name__ == "__main__":
+    # Run in the foreground outside of NVDA, i.e. for load testing
+    # with stub config, tones and globalVars modules on the path
+    try:
+        server.create_server()
+    except KeyboardInterrupt:
+        server.stop()
+elif globalPluginHandler:
+    server_thread = threading.Thread(target=server.create_server, daemon=True)
+    server_thread.start()
+# Imported anywhere else, i.e. by the tests, nothing is started
@@ -1,30 +1,111 @@
 import ctypes
 import os
 import time
-from typing import ClassVar
-
-from talon import Context, Module, actions, clip, cron, scope, settings, speech_system
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, ClassVar, Optional
+
+from talon import (
+    Context,
+    Module,
+    actions,
+    clip,
+    cron,
+    fs,
+    scope,
+    settings,
+    speech_system,
+)
+
+from ..core.screenreader_ipc.ipc_client import nvda_endpoint, nvda_subscription
+from ..core.screenreader_ipc.ipc_schema import IPCPushMessage
+from ..core.screenreader_presence.presence import presence_monitor, watch_screenreader
+from ..core.screenreader_presence.presence_monitor import CachedProbe
 
 mod = Module()
-ctx = Context()
 
 mod.tag("nvda_running", desc="If set, NVDA is running")
 
 
+# How long a keystroke will wait for the pre-phrase bundle to reach NVDA
+KEYSTROKE_BARRIER_TIMEOUT = 0.5
+
+
 class NVDAState:
-    # Check if we send the IPC command to NVDA at the start of the phrase
-    pre_phrase_sent: ClassVar[bool] = False
-    # Commands to re enable at the end of the phrase
-    reenable_commands: ClassVar[list[str]] = []
+    # The in flight push of NVDA's keyboard state for the current phrase.
+    # NVDA itself remembers the settings to restore, so this is only used
+    # to hold keystrokes until the push lands
+    pending_disable: ClassVar[Optional[Future]] = None
+
+
+class HookLatency:
+    """Records how long a phrase hook holds Talon's speech thread"""
+
+    def __init__(self, name: str, max_samples: int = 500):
+        self.name = name
+        self.samples: deque[float] = deque(maxlen=max_samples)
+
+    def record(self, start: float):
+        self.samples.append(time.perf_counter() - start)
+
+    def summary(self) -> str:
+        if not self.samples:
+            return f"{self.name}: no samples"
+        ordered = sorted(self.samples)
+        p50 = ordered[len(ordered) // 2] * 1000
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+        return (
+            f"{self.name}: {len(ordered)} samples, p50 {p50:.2f}ms, "
+            f"p99 {p99:.2f}ms, max {ordered[-1] * 1000:.2f}ms"
+        )
 
 
-@mod.scope
-def set_nvda_running_tag():
-    """Update tags based on if NVDA is running"""
-    try:
-        ctx.tags = ["user.nvda_running"] if actions.user.is_nvda_running() else []
-    except Exception:
-        ctx.tags = []
+pre_phrase_latency = HookLatency("pre-phrase hook")
+keystroke_wait_latency = HookLatency("keystroke wait for NVDA")
+
+
+def query_nvda_controller() -> bool:
+    """Ask the controller client if NVDA is running. This crosses into the DLL every time"""
+    if not nvda_client:
+        return False
+
+    NVDA_RUNNING_CONSTANT = 0
+    client_response = nvda_client.nvdaController_testIfRunning()
+
+    if client_response == NVDA_RUNNING_CONSTANT:
+        return True
+    else:
+        if settings.get("user.addon_debug"):
+            print(f"NVDA not running. Client response value: {client_response}")
+        return False
+
+
+# One phrase checks if NVDA is running several times, so only the first
+# check within the TTL asks the controller client
+nvda_running = CachedProbe(
+    query_nvda_controller, lambda: settings.get("user.nvda_running_ttl")
+)
+# A failed request to the addon can mean NVDA stopped
+nvda_endpoint.add_invalidate_listener(nvda_running.invalidate)
+
+
+def on_nvda_push(message: IPCPushMessage):
+    if message["push"] != "event":
+        return
+    nvda_running.invalidate()
+    # The subscription drops as soon as NVDA stops, so NVDA doesn't need
+    # polling while it is up. Other lifecycle events can mean it restarted
+    if message["event"] in ("connected", "disconnected"):
+        presence_monitor.set_watched("nvda", message["event"] == "connected")
+    else:
+        presence_monitor.notify("nvda")
+
+
+def on_spec_file_change(path: str, flags):
+    # The addon writes its spec file once NVDA has started
+    if os.path.normcase(path) == os.path.normcase(nvda_endpoint.spec_file):
+        nvda_running.invalidate()
+        presence_monitor.notify("nvda")
 
 
 if os.name == "nt":
@@ -32,8 +113,12 @@ if os.name == "nt":
     dir_path = os.path.dirname(os.path.realpath(__file__))
     dll_path = os.path.join(dir_path, "nvdaControllerClient64.dll")
     nvda_client: ctypes.WinDLL = ctypes.windll.LoadLibrary(dll_path)
-    cron.interval("3s", set_nvda_running_tag.update)
-    SPEC_FILE = os.path.expanduser("~\\AppData\\Roaming\\nvda\\talon_server_spec.json")
+    # The monitor only probes when something changed, so it skips the cache
+    watch_screenreader("nvda", "user.nvda_running", nvda_running.refresh)
+    nvda_subscription.add_listener(on_nvda_push)
+    spec_dir = os.path.dirname(nvda_endpoint.spec_file)
+    if os.path.isdir(spec_dir):
+        fs.watch(spec_dir, on_spec_file_change)
 
 else:
     nvda_client = None
@@ -45,6 +130,7 @@ class Actions:
         """Toggles NVDA on and off"""
         if not actions.user.is_nvda_running():
             actions.key("ctrl-alt-n")
+            nvda_running.invalidate()
             actions.user.tts("Turning NVDA on")
         elif actions.user.is_nvda_running():
             actions.user.with_nvda_mod_press("q")
@@ -75,18 +161,7 @@ class Actions:
 
     def is_nvda_running() -> bool:
         """Returns true if NVDA is running"""
-        if os.name != "nt" or not nvda_client:
-            return False
-
-        NVDA_RUNNING_CONSTANT = 0
-        client_response = nvda_client.nvdaController_testIfRunning()
-
-        if client_response == NVDA_RUNNING_CONSTANT:
-            return True
-        else:
-            if settings.get("user.addon_debug"):
-                print(f"NVDA not running. Client response value: {client_response}")
-            return False
+        return nvda_running()
 
     def nvda_tts(text: str, use_clipboard: bool = False):
         """text to speech with NVDA"""
@@ -102,6 +177,11 @@ class Actions:
         actions.user.send_ipc_command("debug")
         actions.user.tts("Success testing reader addon")
 
+    def nvda_hook_latency_report():
+        """Prints how long the NVDA phrase hooks have held the speech thread"""
+        for latency in (pre_phrase_latency, keystroke_wait_latency):
+            print(latency.summary())
+
 
 ctxWindowsNVDARunning = Context()
 ctxWindowsNVDARunning.matches = r"""
@@ -133,17 +213,25 @@ class UserActions:
         else:
             nvda_client.nvdaController_speakText(text)
 
-    def tts(text: str, interrupt: bool = True):
+    def tts_engine_speak(text: str) -> Optional[Callable]:
         """Text to speech within NVDA"""
         if settings.get("user.tts_via_screenreader"):
-            # we ignore interrupt since that is done by NVDA
+            # NVDA queues speech itself and doesn't say when it finishes
             actions.user.nvda_tts(text)
-        else:
-            actions.user.base_win_tts(text, interrupt)
+            return None
+        return actions.next(text)
 
-    def cancel_current_speaker():
+    def tts_engine_cancel():
         """Cancel the narrator tts from NVDA"""
         nvda_client.nvdaController_cancelSpeech()
+        if not settings.get("user.tts_via_screenreader"):
+            actions.next()
+
+    def tts_engine_interrupt():
+        """Interrupting our own speech leaves NVDA's alone, i.e. the window it focused"""
+        # Only cancelling, i.e. at the start of a phrase, cuts NVDA off
+        if not settings.get("user.tts_via_screenreader"):
+            actions.user.tts_engine().silence()
 
     def braille(text: str):
         """Output braille with NVDA"""
@@ -154,71 +242,77 @@ class UserActions:
         actions.user.tts("You must switch voice in NVDA manually")
 
 
+def wait_for_pending_disable():
+    """Block a keystroke until NVDA has received the pre-phrase bundle"""
+    future = NVDAState.pending_disable
+    if future is None or future.done():
+        return
+
+    start = time.perf_counter()
+    try:
+        future.result(timeout=KEYSTROKE_BARRIER_TIMEOUT)
+    except Exception as error:
+        # Typing is more important than the setting, so we continue regardless
+        if settings.get("user.addon_debug"):
+            print(f"NVDA did not confirm the pre-phrase bundle: {error}")
+    finally:
+        keystroke_wait_latency.record(start)
+
+
+@ctxWindowsNVDARunning.action_class("main")
+class MainActions:
+    # The pre-phrase bundle is sent in the background so we only wait for it
+    # right before the first keystroke that NVDA could otherwise interrupt
+    def key(key: str):
+        wait_for_pending_disable()
+        actions.next(key)
+
+    def insert(text: str):
+        wait_for_pending_disable()
+        actions.next(text)
+
+
 # By default the screen reader will allow you to press a key and interrupt the ph
 # rase however this does not work alongside typing given the fact that we are pres
 # sing keys. So we need to temporally disable it then re enable it at the end of
 # the phrase
 def disable_interrupt(_):
+    start = time.perf_counter()
     SLEEP_MODE = "sleep" in scope.get("mode")
     if (
         not actions.user.is_nvda_running()
         or SLEEP_MODE
-        or not os.path.exists(SPEC_FILE)
+        or not actions.user.addon_server_available()
     ):
         return
 
-    # Commands are processed in order
-    # We first see the value for each setting, then we disable them
-    # We only need to enable them at the end of the phrase if
-    # there were enabled before
-    commands = [
-        "getSpeechInterruptForCharacters",
-        "getSpeakTypedWords",
-        "getSpeakTypedCharacters",
-        "disableSpeechInterruptForCharacters",
-        "disableSpeakTypedWords",
-        "disableSpeakTypedCharacters",
-    ]
-    results = actions.user.send_ipc_commands(commands)
-
-    NVDAState.reenable_commands = []
-    for command, value in results:
-        match command:
-            case (
-                "getSpeechInterruptForCharacters"
-                | "getSpeakTypedWords"
-                | "getSpeakTypedCharacters"
-            ) as cmd if value:
-                NVDAState.reenable_commands.append(cmd.replace("get", "enable"))
-
-    NVDAState.pre_phrase_sent = True
+    # NVDA saves the current keyboard echo settings and disables them. Pushes
+    # nest, so an overlapping phrase can't restore the settings too early
+    # Don't block the speech thread here; keystrokes wait for it if needed
+    NVDAState.pending_disable = actions.user.send_ipc_commands_async(
+        ["pushKeyboardState"]
+    )
+    pre_phrase_latency.record(start)
 
 
 def enable_interrupt(_):
-    SLEEP_MODE = "sleep" in scope.get("mode")
     if (
-        not actions.user.is_nvda_running()
-        # If we are in sleep mode, we still send the interrupt
-        # assuming the pre_phrase was sent, given the fact
+        # If we are in sleep mode, we still restore the settings
+        # assuming the push was sent, given the fact
         # we still want `talon sleep` to restore the setting at the end
-        or (SLEEP_MODE and not NVDAState.pre_phrase_sent)
-        or not os.path.exists(SPEC_FILE)
+        NVDAState.pending_disable is None
+        or not actions.user.is_nvda_running()
+        or not actions.user.addon_server_available()
     ):
         return
 
-    # Can add more commands here if needed
-    # We don't need to send disable commands since they are already disabled
-    # at pre-phrase time
-    if len(NVDAState.reenable_commands) == 0:
-        return
+    # Reset so we don't pop again on another post:phrase callback during sleep mode
+    NVDAState.pending_disable = None
 
     # best way to do this because we don't have a callback at the end of the last keypress
     cron.after(
-        "400ms", lambda: actions.user.send_ipc_commands(NVDAState.reenable_commands)
+        "400ms", lambda: actions.user.send_ipc_commands_async(["popKeyboardState"])
     )
-    # Reset the pre_phrase_sent flag to prevent another post:phrase callback during sleep mode
-
-    NVDAState.pre_phrase_sent = False
 
 
 if os.name == "nt":
@@ -1,33 +1,55 @@
 import os
 import sys
 
-from talon import Context, Module, actions, cron, settings
+from talon import Context, Module, actions, settings
+
+from ..core.screenreader_presence.presence import presence_monitor, watch_screenreader
+from ..core.screenreader_presence.presence_monitor import POLL_MAX_INTERVAL
+from ..core.screenreader_presence.process_watch import (
+    ExecListener,
+    ProcessIndex,
+    read_comm,
+)
+from ..lib.running import replace_running
 
 mod = Module()
-ctx = Context()
 
 mod.tag("orca_running", desc="If set, orca is running")
 
 
-@mod.scope
-def set_orca_running_tag():
-    """Update tags based on if Orca is running"""
-    # Edge case on startup this might not be set yet we we catch all exceptions
-    try:
-        ctx.tags = ["user.orca_running"] if actions.user.is_orca_running() else []
-    except Exception:
-        ctx.tags = []
+# Checking again when no process has started since is a single small read,
+# so without process events orca can be polled often
+ORCA_POLL_MAX_INTERVAL = 1.0
+
+
+def on_exec(pid: int):
+    if read_comm(pid) == "orca":
+        orca_index.offer(pid)
+        presence_monitor.notify("orca")
 
 
 if sys.platform == "linux" or sys.platform.startswith("linux"):
-    cron.interval("3s", set_orca_running_tag.update)
+    orca_index = ProcessIndex("orca")
+    # The kernel tells us about orca starting straight away if we are allowed
+    # to listen, otherwise polling has to notice it
+    exec_listener = ExecListener(on_exec)
+    # Stops the listener a previous load of this file started
+    replace_running("orca.exec_listener", exec_listener)
+    listening = exec_listener.start()
+    # Knowing the pid lets the monitor hear about orca exiting instead of polling
+    watch_screenreader(
+        "orca",
+        "user.orca_running",
+        orca_index.find,
+        max_interval=POLL_MAX_INTERVAL if listening else ORCA_POLL_MAX_INTERVAL,
+    )
 
 
 @mod.action_class
 class Actions:
     def is_orca_running() -> bool:
         """Returns true if orca is running"""
-        return True if "user.orca_running" in ctx.tags else False
+        return "orca" in presence_monitor.present()
 
     def orca_tts(text: str, use_clipboard: bool = False):
         """text to speech with orca"""
@@ -37,7 +59,7 @@ class Actions:
 
 
 ctxLinux = Context()
-ctx.matches = r"""
+ctxLinux.matches = r"""
 os: linux
 """
 
@@ -47,7 +69,7 @@ class LinuxActions:
     def toggle_reader():
         """Toggles orca on and off"""
         if not os.path.exists("/usr/bin/orca"):
-            actions.user.tts("Orca is not installed")
+            actions.user.tts("Orca is not installed", priority="error")
             return
 
         actions.key("alt-super-s")
@@ -34,48 +34,6 @@ if os.name == "nt":
     import winsound
 
 
-def remove_special(text):
-    specialChars = [
-        "'",
-        '"',
-        "(",
-        ")",
-        "[",
-        "]",
-        "{",
-        "}",
-        "<",
-        ">",
-        "|",
-        "\\",
-        "/",
-        "_",
-        "-",
-        "+",
-        "=",
-        "*",
-        "&",
-        "^",
-        "%",
-        "$",
-        "#",
-        "@",
-        "!",
-        "`",
-        "~",
-        "?",
-        ",",
-        ".",
-        ":",
-        ";",
-    ]
-
-    for char in specialChars:
-        text = text.replace(char, "")
-
-    return text
-
-
 @mod.action_class
 class Actions:
     def indentation_level(text: str) -> int:
@@ -99,7 +57,7 @@ class Actions:
         friendly_name = actions.app.name()
         title = ui.active_window().title
         output = f"{friendly_name} {title}" if include_title else friendly_name
-        actions.user.tts(output)
+        actions.user.tts(output, priority="context")
 
     # def echo_tags():
     #     """Echo the current tags"""
@@ -134,11 +92,11 @@ class Actions:
         modes = scope.get("mode")
         # if dictation or command is in the modes, say that first
         if "dictation" in modes and "command" in modes:
-            actions.user.tts("mixed")
+            actions.user.tts("mixed", priority="mode")
         elif "dictation" in modes:
-            actions.user.tts("dictation")
+            actions.user.tts("dictation", priority="mode")
         elif "command" in modes:
-            actions.user.tts("command")
+            actions.user.tts("command", priority="mode")
 
     def get_website_text(url: str) -> str:
         """Get the visible text from a website"""
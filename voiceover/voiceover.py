@@ -1,7 +1,11 @@
 import os
+import subprocess
 import sys
 
-from talon import Context, Module, actions, cron, settings
+from talon import Context, Module, actions, settings
+
+from ..core.screenreader_presence.presence import presence_monitor, watch_screenreader
+from ..core.screenreader_presence.presence_monitor import POLL_UNSIGNALLED_MAX_INTERVAL
 
 mod = Module()
 ctx = Context()
@@ -28,27 +32,26 @@ class MacActions:
 mod.tag("voiceover_running", desc="If set, voiceover is running")
 
 
-@mod.scope
-def set_voiceover_running_tag():
-    """Update tags based on if voiceover is running"""
-    # Edge case on startup this might not be set yet we we catch all exceptions
-    try:
-        ctx.tags = (
-            ["user.voiceover_running"] if actions.user.is_voiceover_running() else []
-        )
-    except Exception:
-        ctx.tags = []
+def find_voiceover() -> bool:
+    result = subprocess.run(["pgrep", "-x", "VoiceOver"], capture_output=True)
+    return result.returncode == 0
 
 
 if sys.platform == "darwin":
-    cron.interval("3s", set_voiceover_running_tag.update)
+    # Nothing tells us when VoiceOver starts or stops
+    watch_screenreader(
+        "voiceover",
+        "user.voiceover_running",
+        find_voiceover,
+        max_interval=POLL_UNSIGNALLED_MAX_INTERVAL,
+    )
 
 
 @mod.action_class
 class Actions:
     def is_voiceover_running() -> bool:
         """Returns true if voiceover is running"""
-        return True if "user.voiceover_running" in ctx.tags else False
+        return "voiceover" in presence_monitor.present()
 
     def voiceover_tts(text: str):
         """text to speech with voiceover"""